@@ -0,0 +1,72 @@
+"""Runs a DNSProxy in a child process and measures its CPU time and loop iterations"""
+
+import logging
+import os
+from multiprocessing import Process, Value
+from time import sleep
+from typing import Any, Dict, Type
+
+from gwhosts.dns import QName
+from gwhosts.network import Address
+from gwhosts.proxy import DNSProxy, Reactor
+from gwhosts.proxy._base import BaseDNSProxy
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def _serve(
+    proxy_class: Type[BaseDNSProxy],
+    addr: Address,
+    iterations: Any,
+    hostnames: Any,
+    kwargs: Dict[str, Any],
+) -> None:
+    select = Reactor.select
+
+    def _counting_select(self, timeout=None):
+        iterations.value += 1
+        return select(self, timeout)
+
+    Reactor.select = _counting_select
+
+    logger = logging.getLogger("benchmark")
+    logger.setLevel(logging.ERROR)
+    proxy_class(hostnames=hostnames, logger=logger, **kwargs).listen(addr)
+
+
+class ProxyProcess:
+    def __init__(
+        self,
+        addr: Address,
+        hostnames=frozenset({QName((b"example", b"com"))}),
+        proxy_class: Type[BaseDNSProxy] = DNSProxy,
+        **kwargs,
+    ) -> None:
+        self.address = addr
+        self._iterations = Value("L", 0)
+        self._process = Process(
+            target=_serve,
+            args=(proxy_class, addr, self._iterations, set(hostnames), kwargs),
+            daemon=True,
+        )
+
+    def __enter__(self) -> "ProxyProcess":
+        self._process.start()
+        sleep(0.5)
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._process.terminate()
+        self._process.join()
+
+    @property
+    def iterations(self) -> int:
+        return self._iterations.value
+
+    @property
+    def cpu_time(self) -> float:
+        """:return: User and system CPU time of the proxy in seconds"""
+        with open(f"/proc/{self._process.pid}/stat") as stat:
+            fields = stat.read().rsplit(")", 1)[1].split()
+
+        return (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
@@ -0,0 +1,133 @@
+"""Local stub upstream resolver and client helpers shared by the benchmarks"""
+
+import random
+from socket import AF_INET, SOCK_DGRAM, SOCK_STREAM, socket
+from struct import pack, unpack_from
+from threading import Event, Thread
+from typing import Iterable, List, Optional
+
+from gwhosts.dns import QName
+from gwhosts.dns._serializers import _encode_qname
+from gwhosts.network import Address
+
+_QUERY_FLAGS = 0b00000001_00000000
+_RESPONSE_FLAGS = 0b10000001_10000000
+_TRUNCATED_FLAGS = 0b10000011_10000000
+
+
+def build_query(query_id: int, qname: Iterable[bytes], rr_type: int = 1) -> bytes:
+    return pack("!HHHHHH", query_id, _QUERY_FLAGS, 1, 0, 0, 0) + _encode_qname(qname) + pack("!HH", rr_type, 1)
+
+
+def hostnames(count: int, domain: QName = QName((b"example", b"com"))) -> List[QName]:
+    return [QName((f"host{_idx}".encode(), *domain)) for _idx in range(count)]
+
+
+class StubUpstream(Thread):
+    """Answers every query with a single A record
+
+    :param loss: Probability of silently dropping a query
+    :param ttl: TTL of the answers
+    :param tcp: Answer over TCP on the same port too, every connection is served by its own thread
+    :param truncated: Answer over UDP with the TC flag and no records
+    """
+
+    def __init__(
+        self,
+        addr: Address = Address("127.0.0.1", 0),
+        loss: float = 0.0,
+        ttl: int = 300,
+        tcp: bool = False,
+        truncated: bool = False,
+    ) -> None:
+        super().__init__(daemon=True)
+        self._socket = socket(AF_INET, SOCK_DGRAM)
+        self._socket.bind(addr)
+        self._socket.settimeout(0.1)
+        self._loss = loss
+        self._ttl = ttl
+        self._truncated = truncated
+        self._stopped = Event()
+        self._tcp: Optional[socket] = None
+        self.queries = 0
+        self.tcp_queries = 0
+
+        if tcp:
+            self._tcp = socket(AF_INET, SOCK_STREAM)
+            self._tcp.bind(self._socket.getsockname())
+            self._tcp.listen(16)
+            self._tcp.settimeout(0.1)
+
+    @property
+    def address(self) -> Address:
+        return Address(*self._socket.getsockname())
+
+    def _answer(self, query: bytes) -> bytes:
+        question_end = query.index(b"\x00", 12) + 5
+        query_id, flags, questions = unpack_from("!HHH", query)
+        address = bytes([10, *pack("!H", hash(query[12:question_end]) & 0xFFFF), 1])
+
+        return (
+            pack("!HHHHHH", query_id, _RESPONSE_FLAGS, questions, 1, 0, 0)
+            + query[12:question_end]
+            + pack("!HHHIH", 0xC00C, 1, 1, self._ttl, 4)
+            + address
+        )
+
+    def _truncate(self, query: bytes) -> bytes:
+        question_end = query.index(b"\x00", 12) + 5
+        query_id, flags, questions = unpack_from("!HHH", query)
+
+        return pack("!HHHHHH", query_id, _TRUNCATED_FLAGS, questions, 0, 0, 0) + query[12:question_end]
+
+    def _serve_connection(self, connection: socket) -> None:
+        with connection:
+            stream = connection.makefile("rb")
+
+            while not self._stopped.is_set():
+                length = stream.read(2)
+
+                if len(length) < 2:
+                    return
+
+                query = stream.read(unpack_from("!H", length)[0])
+                self.tcp_queries += 1
+                response = self._answer(query)
+                connection.sendall(pack("!H", len(response)) + response)
+
+    def _accept(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                connection, _ = self._tcp.accept()
+
+            except OSError:
+                continue
+
+            connection.settimeout(None)
+            Thread(target=self._serve_connection, args=(connection,), daemon=True).start()
+
+    def run(self) -> None:
+        if self._tcp is not None:
+            Thread(target=self._accept, daemon=True).start()
+
+        while not self._stopped.is_set():
+            try:
+                query, addr = self._socket.recvfrom(65535)
+
+            except OSError:
+                continue
+
+            self.queries += 1
+
+            if self._loss and random.random() < self._loss:
+                continue
+
+            self._socket.sendto(self._truncate(query) if self._truncated else self._answer(query), addr)
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+        self._socket.close()
+
+        if self._tcp is not None:
+            self._tcp.close()
@@ -0,0 +1,59 @@
+"""Cost of aggregating a batch of new addresses with the routed subnets
+
+The full reduction re-sorts and re-reduces all the routed subnets on every batch,
+the aggregator re-reduces only the branches the new addresses fall into.
+IPv6 addresses are used, so a million routes do not collapse into the 65536 IPv4 /16 branches.
+
+Usage:
+python -m benchmarks.aggregation
+"""
+
+from random import Random
+from time import perf_counter
+from typing import Dict, Set
+
+from gwhosts.network import Network, SubnetAggregator
+from gwhosts.network.ipv6 import IPV6_NETMASK_MAX, IPV6_NETMASK_MIN, ipv6_reduce_subnets
+
+ROUTES = (10_000, 100_000, 1_000_000)
+BATCH = 16
+# Batches per measurement of the aggregator, the full reduction is measured once
+BATCHES = 100
+
+
+def _random_networks(random: Random, count: int) -> Set[Network]:
+    return {Network(random.getrandbits(128), IPV6_NETMASK_MAX) for _ in range(count)}
+
+
+def _reduce(subnets: Set[Network], addresses: Set[Network]) -> Dict[Network, bool]:
+    reduced = set(ipv6_reduce_subnets(addresses.union(subnets)))
+
+    return {_subnet: _subnet in reduced for _subnet in subnets.symmetric_difference(reduced)}
+
+
+if __name__ == "__main__":
+    random = Random(0)
+
+    print(f"{'routes':>10}{'reduce':>14}{'aggregator':>14}")
+
+    for _routes in ROUTES:
+        subnets = _random_networks(random, _routes)
+        aggregator = SubnetAggregator(IPV6_NETMASK_MIN)
+
+        for _subnet in subnets:
+            aggregator.add(_subnet)
+
+        batches = [_random_networks(random, BATCH) for _ in range(BATCHES)]
+
+        started = perf_counter()
+        _reduce(subnets, batches[0])
+        reduce = (perf_counter() - started) * 1000
+
+        started = perf_counter()
+
+        for _batch in batches:
+            aggregator.update(_batch)
+
+        aggregated = (perf_counter() - started) / BATCHES * 1000
+
+        print(f"{_routes:>10}{reduce:>12.2f}ms{aggregated:>12.3f}ms")
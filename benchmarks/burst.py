@@ -0,0 +1,71 @@
+"""Queries per loop iteration and CPU time per query under burst load
+
+A client sends bursts of queries to the proxy and waits for the responses,
+the proxy forwards them to a local stub upstream.
+
+Usage:
+python -m benchmarks.burst
+"""
+
+from select import select
+from socket import AF_INET, SOCK_DGRAM, socket
+from typing import Dict, Tuple
+
+from gwhosts.network import MMSG_SUPPORTED, Address
+
+from ._proxy import ProxyProcess
+from ._stub import StubUpstream, build_query, hostnames
+
+BURST_SIZE = 500
+BURSTS = 40
+CONFIGURATIONS: Dict[str, Dict[str, object]] = {
+    "recvfrom x1": {"batch_size": 1, "mmsg": False},
+    "recvfrom x64": {"batch_size": 64, "mmsg": False},
+}
+
+if MMSG_SUPPORTED:
+    CONFIGURATIONS["recvmmsg x64"] = {"batch_size": 64, "mmsg": True}
+
+
+def _burst(client: socket, addr: Address, queries) -> int:
+    """:return: Number of answered queries"""
+    for query in queries:
+        client.sendto(query, addr)
+
+    answered = 0
+
+    while answered < len(queries) and select([client], [], [], 0.5)[0]:
+        client.recv(4096)
+        answered += 1
+
+    return answered
+
+
+def _run(upstream: StubUpstream, port: int, kwargs: Dict[str, object]) -> Tuple[float, float, float]:
+    queries = [build_query(idx, qname) for idx, qname in enumerate(hostnames(BURST_SIZE))]
+    addr = Address("127.0.0.1", port)
+
+    with ProxyProcess(addr, to_addr=upstream.address, **kwargs) as proxy, socket(AF_INET, SOCK_DGRAM) as client:
+        _burst(client, addr, queries)
+
+        iterations, cpu_time = proxy.iterations, proxy.cpu_time
+        answered = sum(_burst(client, addr, queries) for _ in range(BURSTS))
+
+        return (
+            answered / max(proxy.iterations - iterations, 1),
+            (proxy.cpu_time - cpu_time) / max(answered, 1) * 1_000_000,
+            answered / (BURST_SIZE * BURSTS) * 100,
+        )
+
+
+if __name__ == "__main__":
+    upstream = StubUpstream()
+    upstream.start()
+
+    print(f"{'':>14}{'queries/iteration':>20}{'CPU/query':>14}{'answered':>12}")
+
+    for _port, (_name, _kwargs) in enumerate(CONFIGURATIONS.items(), start=18053):
+        per_iteration, cpu, answered = _run(upstream, _port, _kwargs)
+        print(f"{_name:>14}{per_iteration:>20.1f}{cpu:>12.1f}us{answered:>11.1f}%")
+
+    upstream.stop()
@@ -0,0 +1,118 @@
+"""Cost of matching a name against the listed hostnames, memory and time taken to load them
+
+The suffix scan slices the name at every level and looks each suffix up in a set of tuples,
+the trie walks the reversed labels once, the compiled index is memory-mapped and searched.
+A walk is cheaper than a prefilter probe, so only the index rejects the unlisted names with the prefilter
+before the memo is looked up. A listed name is looked up repeatedly, so its lookups are answered by the memo.
+
+Usage:
+python -m benchmarks.hostnames
+"""
+
+from os import path
+from random import Random
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from timeit import repeat
+from tracemalloc import get_traced_memory, start, stop
+from typing import Callable, List, Set, Tuple
+
+from gwhosts.dns import QName
+from gwhosts.hosts import HostnameIndex, HostnameTrie, compile_index
+
+HOSTNAMES = 100_000
+NAMES = 4_000
+NUMBER = 10
+REPEAT = 5
+_TLDS = (b"com", b"net", b"org", b"io", b"ru")
+
+
+def _random_hostnames(random: Random, count: int) -> List[QName]:
+    return [
+        QName((random.randbytes(6).hex().encode(), random.randbytes(4).hex().encode(), random.choice(_TLDS)))
+        for _ in range(count)
+    ]
+
+
+def _suffix_scan(hostnames: Set[QName], hostname: QName) -> bool:
+    for level in range(len(hostname)):
+        if hostname[level:] in hostnames:
+            return True
+
+    return False
+
+
+def _measure(match: Callable[[QName], bool], names: List[QName]) -> float:
+    """:return: Microseconds per name"""
+    timings = repeat(lambda: [match(_name) for _name in names], number=NUMBER, repeat=REPEAT)
+
+    return min(timings) / NUMBER / len(names) * 1e6
+
+
+def _load(build: Callable[[], object]) -> Tuple[str, str]:
+    """:return: Megabytes allocated and milliseconds taken by the build"""
+    start()
+    started = perf_counter()
+    built = build()  # noqa: F841
+    elapsed = perf_counter() - started
+    _, peak = get_traced_memory()
+    stop()
+
+    return f"{peak / (1 << 20):.1f}MB", f"{elapsed * 1000:.0f}ms"
+
+
+def _row(
+    name: str, load: Tuple[str, str], match: Callable[[QName], bool], listed: List[QName], unlisted: List[QName]
+) -> None:
+    print(
+        f"{name:>14}{load[0]:>12}{load[1]:>12}{_measure(match, listed):>10.3f}us{_measure(match, unlisted):>10.3f}us"
+    )
+
+
+if __name__ == "__main__":
+    random = Random(0)
+    # Names are encoded the same way as the hostsfile lines, so the labels are not shared
+    lines = [b".".join(_hostname) for _hostname in _random_hostnames(random, HOSTNAMES)]
+    hostnames = {QName(_line.split(b".")) for _line in lines}
+    trie = HostnameTrie(hostnames)
+    listed = [QName((b"www", *_hostname)) for _hostname in random.sample(sorted(hostnames), NAMES)]
+    unlisted = _random_hostnames(random, NAMES)
+
+    with TemporaryDirectory() as directory:
+        index_path = path.join(directory, "hostnames.idx")
+        compile_index(hostnames, index_path)
+        index = HostnameIndex(index_path)
+        no_memo = HostnameIndex(index_path, memo_size=0)
+
+        print(f"{'':>14}{'memory':>12}{'load':>12}{'listed':>12}{'unlisted':>12}")
+        _row(
+            "suffix scan",
+            _load(lambda: {QName(_line.split(b".")) for _line in lines}),
+            lambda _name: _suffix_scan(hostnames, _name),
+            listed,
+            unlisted,
+        )
+        _row(
+            "trie",
+            _load(lambda: HostnameTrie(QName(_line.split(b".")) for _line in lines)),
+            trie.__contains__,
+            listed,
+            unlisted,
+        )
+        _row("trie walk", ("", ""), trie._match, listed, unlisted)
+        _row("index", _load(lambda: HostnameIndex(index_path)), index.__contains__, listed, unlisted)
+        _row("index search", ("", ""), no_memo.__contains__, listed, unlisted)
+        _row(
+            "prefilter",
+            (f"{index.prefilter.size / (1 << 20):.2f}MB", ""),
+            index.prefilter.__contains__,
+            listed,
+            unlisted,
+        )
+        print(
+            f"prefilter false positives: {index.prefilter.false_positive_rate:.2%} of the probes estimated, "
+            f"{sum(_name in index.prefilter for _name in unlisted) / NAMES:.2%} of the unlisted names, "
+            f"index file: {path.getsize(index_path) / (1 << 20):.1f}MB"
+        )
+        index.close()
+        no_memo.close()
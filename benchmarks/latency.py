@@ -0,0 +1,78 @@
+"""p50/p99 latency of the proxy engines
+
+A client keeps a fixed number of queries in flight, the proxy forwards them to a local stub upstream.
+
+Usage:
+python -m benchmarks.latency
+"""
+
+from select import select
+from socket import AF_INET, SOCK_DGRAM, socket
+from struct import unpack_from
+from time import perf_counter
+from typing import Dict, List, Tuple
+
+from gwhosts.network import Address
+from gwhosts.proxy import AsyncDNSProxy, DNSProxy
+from gwhosts.proxy._asyncio import uvloop
+
+from ._proxy import ProxyProcess
+from ._stub import StubUpstream, build_query, hostnames
+
+QUERIES = 20000
+CONCURRENCY = 16
+ENGINES: Dict[str, Dict[str, object]] = {
+    "reactor": {"proxy_class": DNSProxy},
+    "asyncio": {"proxy_class": AsyncDNSProxy},
+}
+
+if uvloop is not None:
+    ENGINES["asyncio+uvloop"] = {"proxy_class": AsyncDNSProxy, "use_uvloop": True}
+
+
+def _percentile(latencies: List[float], percentile: float) -> float:
+    return latencies[min(int(len(latencies) * percentile), len(latencies) - 1)]
+
+
+def _measure(client: socket, addr: Address) -> Tuple[List[float], int]:
+    """:return: Sorted latencies in microseconds and the number of lost queries"""
+    queries = [build_query(idx, qname) for idx, qname in enumerate(hostnames(1 << 16))]
+    sent: Dict[int, float] = {}
+    latencies: List[float] = []
+    next_query = 0
+    lost = 0
+
+    while len(latencies) + lost < QUERIES:
+        while len(sent) < CONCURRENCY and next_query < QUERIES:
+            sent[next_query & 0xFFFF] = perf_counter()
+            client.sendto(queries[next_query & 0xFFFF], addr)
+            next_query += 1
+
+        if not select([client], [], [], 1.0)[0]:
+            lost += len(sent)
+            sent.clear()
+            continue
+
+        (query_id,) = unpack_from("!H", client.recv(4096))
+
+        if query_id in sent:
+            latencies.append((perf_counter() - sent.pop(query_id)) * 1_000_000)
+
+    return sorted(latencies), lost
+
+
+if __name__ == "__main__":
+    upstream = StubUpstream()
+    upstream.start()
+
+    print(f"{'':>16}{'p50':>10}{'p99':>10}{'lost':>8}")
+
+    for _port, (_name, _kwargs) in enumerate(ENGINES.items(), start=18053):
+        _addr = Address("127.0.0.1", _port)
+
+        with ProxyProcess(_addr, to_addr=upstream.address, **_kwargs), socket(AF_INET, SOCK_DGRAM) as _client:
+            _latencies, _lost = _measure(_client, _addr)
+
+        print(f"{_name:>16}{_percentile(_latencies, 0.50):>8.0f}us{_percentile(_latencies, 0.99):>8.0f}us{_lost:>8}")
+
+    upstream.stop()
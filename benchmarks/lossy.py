@@ -0,0 +1,77 @@
+"""p50/p99 latency of a lossy upstream with and without retransmissions
+
+Two stub upstreams drop a share of the queries, a client keeps a fixed number of queries in flight and
+counts a query as lost when it is not answered within the client timeout. Lost queries hold their slots until
+the client timeout, so p50 without retransmissions is measured at a lower effective concurrency.
+
+Usage:
+python -m benchmarks.lossy
+"""
+
+from select import select
+from socket import AF_INET, SOCK_DGRAM, socket
+from struct import unpack_from
+from time import perf_counter
+from typing import Dict, List, Tuple
+
+from gwhosts.network import Address
+
+from ._proxy import ProxyProcess
+from ._stub import StubUpstream, build_query, hostnames
+from .latency import _percentile
+
+QUERIES = 5000
+CONCURRENCY = 16
+LOSS = 0.05
+CLIENT_TIMEOUT = 1.0
+RETRY_RATIOS = (0.0, 0.1)
+
+
+def _measure(client: socket, addr: Address) -> Tuple[List[float], int]:
+    """:return: Sorted latencies in microseconds and the number of lost queries"""
+    queries = [build_query(idx, qname) for idx, qname in enumerate(hostnames(QUERIES))]
+    sent: Dict[int, float] = {}
+    latencies: List[float] = []
+    next_query = 0
+    lost = 0
+
+    while len(latencies) + lost < QUERIES:
+        while len(sent) < CONCURRENCY and next_query < QUERIES:
+            sent[next_query] = perf_counter()
+            client.sendto(queries[next_query], addr)
+            next_query += 1
+
+        if select([client], [], [], 0.01)[0]:
+            (query_id,) = unpack_from("!H", client.recv(4096))
+
+            if query_id in sent:
+                latencies.append((perf_counter() - sent.pop(query_id)) * 1_000_000)
+
+        deadline = perf_counter() - CLIENT_TIMEOUT
+
+        for _query_id in [_query_id for _query_id, _time in sent.items() if _time < deadline]:
+            del sent[_query_id]
+            lost += 1
+
+    return sorted(latencies), lost
+
+
+if __name__ == "__main__":
+    upstreams = [StubUpstream(loss=LOSS), StubUpstream(loss=LOSS)]
+
+    for _upstream in upstreams:
+        _upstream.start()
+
+    print(f"{'retry ratio':>16}{'p50':>10}{'p99':>10}{'lost':>8}")
+
+    for _port, _ratio in enumerate(RETRY_RATIOS, start=18053):
+        _addr = Address("127.0.0.1", _port)
+        _kwargs = {"to_addrs": [_upstream.address for _upstream in upstreams], "cache_size": 0, "retry_ratio": _ratio}
+
+        with ProxyProcess(_addr, **_kwargs), socket(AF_INET, SOCK_DGRAM) as _client:
+            _latencies, _lost = _measure(_client, _addr)
+
+        print(f"{_ratio:>16}{_percentile(_latencies, 0.50):>8.0f}us{_percentile(_latencies, 0.99):>8.0f}us{_lost:>8}")
+
+    for _upstream in upstreams:
+        _upstream.stop()
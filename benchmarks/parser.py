@@ -0,0 +1,45 @@
+"""Parsing time of a query and of a response with compressed names
+
+The view decodes only the section that is accessed: the questions of the query and the answers of the response.
+
+Usage:
+python -m benchmarks.parser
+"""
+
+from functools import partial
+from timeit import Timer
+
+from gwhosts.dns import DNSDataView, parse, scan
+
+ROUNDS = 100_000
+# A www.youtube.com
+QUERY = (
+    b"\x68\x52\x01\x20\x00\x01\x00\x00\x00\x00\x00\x01\x03www\x07youtube\x03com\x00\x00\x01\x00\x01"
+    b"\x00\x00\x29\x04\xd0\x00\x00\x00\x00\x00\x00"
+)
+# www.youtube.com CNAME youtube-ui.l.google.com and its 4 A records
+RESPONSE = (
+    b"\x68\x52\x81\x80\x00\x01\x00\x05\x00\x00\x00\x01\x03\x77\x77\x77\x07\x79\x6f\x75\x74\x75\x62\x65\x03\x63\x6f"
+    b"\x6d\x00\x00\x01\x00\x01\xc0\x0c\x00\x05\x00\x01\x00\x00\x07\x8d\x00\x16\x0a\x79\x6f\x75\x74\x75\x62\x65\x2d"
+    b"\x75\x69\x01\x6c\x06\x67\x6f\x6f\x67\x6c\x65\xc0\x18\xc0\x2d\x00\x01\x00\x01\x00\x00\x07\x8d\x00\x04\xac\xd9"
+    b"\x13\x4e\xc0\x2d\x00\x01\x00\x01\x00\x00\x07\x8d\x00\x04\xac\xd9\x10\x4e\xc0\x2d\x00\x01\x00\x01\x00\x00\x07"
+    b"\x8d\x00\x04\x8e\xfa\xb5\xce\xc0\x2d\x00\x01\x00\x01\x00\x00\x07\x8d\x00\x04\x8e\xfb\xd1\x8e\x00\x00\x29\xff"
+    b"\xd6\x00\x00\x00\x00\x00\x00"
+)
+
+
+def _view(data: bytes, section: str) -> list:
+    return getattr(DNSDataView(data), section)
+
+
+def _cost(function, data: bytes) -> float:
+    """:return: Average time of a single call in microseconds"""
+    return min(Timer(lambda: function(data)).repeat(3, ROUNDS)) / ROUNDS * 1_000_000
+
+
+if __name__ == "__main__":
+    print(f"{'message':>10}{'parse':>12}{'view':>12}{'scan':>12}")
+
+    for _name, _data, _section in (("query", QUERY, "questions"), ("response", RESPONSE, "answers")):
+        view = _cost(partial(_view, section=_section), _data)
+        print(f"{_name:>10}{_cost(parse, _data):>10.2f}us{view:>10.2f}us{_cost(scan, _data):>10.2f}us")
@@ -0,0 +1,69 @@
+"""Wakeup cost of the reactor backends depending on the number of in-flight queries
+
+Every in-flight query holds an idle upstream socket registered in the reactor,
+while a single socket is always ready for reading.
+
+Usage:
+python -m benchmarks.reactor
+"""
+
+import resource
+from socket import socketpair, AF_UNIX, SOCK_DGRAM
+from time import perf_counter
+from typing import List
+
+from gwhosts.network import UDPSocket
+from gwhosts.proxy import Reactor, ReactorBackend
+
+IN_FLIGHT_QUERIES = (16, 256, 1000, 4000, 16000)
+WAKEUPS = 2000
+FD_SETSIZE = 1024
+
+
+def _raise_open_files_limit(count: int) -> None:
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+
+    if soft < count:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(count, hard), hard))
+
+
+def _wakeup_cost(backend: ReactorBackend, in_flight: int) -> float:
+    """:return: Average time of a single wakeup in microseconds"""
+    idle: List[UDPSocket] = [UDPSocket() for _ in range(in_flight)]
+    reader, writer = socketpair(AF_UNIX, SOCK_DGRAM)
+    writer.send(b"ready")
+
+    try:
+        with Reactor(backend) as reactor:
+            for _socket in idle:
+                reactor.register(_socket)
+
+            reactor.register(reader)
+
+            started = perf_counter()
+
+            for _ in range(WAKEUPS):
+                reactor.select(0)
+
+            return (perf_counter() - started) / WAKEUPS * 1_000_000
+
+    finally:
+        for _socket in (*idle, reader, writer):
+            _socket.close()
+
+
+if __name__ == "__main__":
+    _raise_open_files_limit(max(IN_FLIGHT_QUERIES) + 64)
+
+    print(f"{'in-flight':>10}" + "".join(f"{_backend.value:>12}" for _backend in ReactorBackend))
+
+    for _in_flight in IN_FLIGHT_QUERIES:
+        row = f"{_in_flight:>10}"
+
+        for _backend in ReactorBackend:
+            if _backend is ReactorBackend.SELECT and _in_flight + 8 > FD_SETSIZE:
+                row += f"{'n/a':>12}"
+            else:
+                row += f"{_wakeup_cost(_backend, _in_flight):>10.1f}us"
+
+        print(row)
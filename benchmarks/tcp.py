@@ -0,0 +1,114 @@
+"""Throughput of the proxy over UDP and TCP
+
+Clients keep a fixed number of queries in flight over UDP or over pipelined TCP connections,
+the proxy forwards them to a local stub upstream over UDP, or over TCP when the stub truncates every UDP response.
+
+Usage:
+python -m benchmarks.tcp
+"""
+
+from select import select
+from socket import AF_INET, SOCK_DGRAM, SOCK_STREAM, socket
+from struct import pack, unpack_from
+from time import perf_counter
+from typing import Dict, List, Tuple
+
+from gwhosts.network import Address
+
+from ._proxy import ProxyProcess
+from ._stub import StubUpstream, build_query, hostnames
+
+QUERIES = 20000
+CONNECTIONS = 4
+CONCURRENCY = 16
+
+
+def _udp(addr: Address, queries: List[bytes]) -> int:
+    """:return: Number of answered queries"""
+    answered = 0
+
+    with socket(AF_INET, SOCK_DGRAM) as client:
+        sent = 0
+
+        while answered < len(queries):
+            while sent - answered < CONNECTIONS * CONCURRENCY and sent < len(queries):
+                client.sendto(queries[sent], addr)
+                sent += 1
+
+            if not select([client], [], [], 1.0)[0]:
+                break
+
+            client.recv(4096)
+            answered += 1
+
+    return answered
+
+
+def _tcp(addr: Address, queries: List[bytes]) -> int:
+    """:return: Number of answered queries"""
+    clients = [socket(AF_INET, SOCK_STREAM) for _ in range(CONNECTIONS)]
+    buffers: Dict[socket, bytearray] = {}
+    in_flight: Dict[socket, int] = {}
+    answered = 0
+    sent = 0
+
+    for client in clients:
+        client.connect(addr)
+        buffers[client] = bytearray()
+        in_flight[client] = 0
+
+    while answered < len(queries):
+        for client in clients:
+            while in_flight[client] < CONCURRENCY and sent < len(queries):
+                client.sendall(pack("!H", len(queries[sent])) + queries[sent])
+                in_flight[client] += 1
+                sent += 1
+
+        ready = select(clients, [], [], 1.0)[0]
+
+        if not ready:
+            break
+
+        for client in ready:
+            buffer = buffers[client]
+            buffer += client.recv(65536)
+
+            while len(buffer) >= 2 and len(buffer) >= 2 + unpack_from("!H", buffer)[0]:
+                del buffer[: 2 + unpack_from("!H", buffer)[0]]
+                in_flight[client] -= 1
+                answered += 1
+
+    for client in clients:
+        client.close()
+
+    return answered
+
+
+def _run(transport, port: int, upstream: StubUpstream) -> Tuple[float, int]:
+    """:return: Answered queries per second and lost queries"""
+    queries = [build_query(idx, qname) for idx, qname in enumerate(hostnames(QUERIES))]
+    addr = Address("127.0.0.1", port)
+
+    with ProxyProcess(addr, to_addr=upstream.address, tcp=True, cache_size=0):
+        started = perf_counter()
+        answered = transport(addr, queries)
+
+        return answered / (perf_counter() - started), QUERIES - answered
+
+
+if __name__ == "__main__":
+    upstreams = {"udp": StubUpstream(tcp=True), "tcp": StubUpstream(tcp=True, truncated=True)}
+
+    for _upstream in upstreams.values():
+        _upstream.start()
+
+    print(f"{'client':>8}{'upstream':>10}{'qps':>10}{'lost':>8}")
+
+    for _port, (_client, _upstream) in enumerate(
+        [(_client, _upstream) for _client in ("udp", "tcp") for _upstream in upstreams], start=18053
+    ):
+        _qps, _lost = _run(_udp if _client == "udp" else _tcp, _port, upstreams[_upstream])
+        print(f"{_client:>8}{_upstream:>10}{_qps:>10.0f}{_lost:>8}")
+
+    for _upstream in upstreams.values():
+        _upstream.stop()
@@ -2,21 +2,62 @@ from ._casts import qname_to_str, answer_to_str
 from ._exceptions import DNSParserError, DNSParserInvalidLabelLengthError
 from ._parsers import parse
 from ._serializers import serialize
-from ._types import Addition, Answer, Authority, DNSData, Header, QName, Question, RRType
+from ._view import DNSDataView
+from ._types import (
+    Addition,
+    Answer,
+    Authority,
+    DNSData,
+    Flags,
+    Header,
+    QName,
+    Question,
+    RCode,
+    RRType,
+    WireLayout,
+    WireRecord,
+)
+from ._wire import (
+    MIN_UDP_PAYLOAD_SIZE,
+    answer_addresses,
+    key_query,
+    limit_udp_payload_size,
+    question_key,
+    question_matches,
+    scan,
+    standard_question,
+    truncate,
+    udp_payload_size,
+)
 
 __all__ = [
     "DNSData",
+    "DNSDataView",
     "DNSParserError",
     "DNSParserInvalidLabelLengthError",
+    "Flags",
     "Header",
     "Question",
     "QName",
     "Answer",
     "Authority",
     "Addition",
+    "RCode",
     "RRType",
+    "WireLayout",
+    "WireRecord",
     "parse",
     "serialize",
+    "scan",
+    "answer_addresses",
+    "question_key",
+    "question_matches",
+    "key_query",
+    "standard_question",
+    "udp_payload_size",
+    "limit_udp_payload_size",
+    "truncate",
+    "MIN_UDP_PAYLOAD_SIZE",
     "qname_to_str",
     "answer_to_str",
 ]
@@ -1,9 +1,14 @@
-from io import BytesIO
-from typing import BinaryIO, Iterable, Tuple
-
-from ._exceptions import DNSParserError, DNSParserRecursionError, DNSParserInvalidLabelLengthError
+from struct import error
+from typing import Callable, Dict, List, Tuple, Type, TypeVar
+
+from ._exceptions import (
+    DNSParserError,
+    DNSParserInvalidLabelLengthError,
+    DNSParserRecursionError,
+    DNSParserUnpackError,
+)
 from ._serializers import _encode_qname
-from ._struct import unpack_bytes, unpack_buffer
+from ._struct import HEADER, QUESTION, RESOURCE
 from ._types import Addition, Answer, Authority, DNSData, Header, QName, Question, RRType
 
 # [https://www.rfc-editor.org/rfc/rfc1035.html#section-2.3.4]
@@ -12,101 +17,105 @@ _MAX_NAME_LENGTH: int = 0b1111_1111
 _POINTER_MASK: int = 0b1100_0000
 _MAX_POINTERS: int = (_MAX_NAME_LENGTH + 1) // 2 - 2
 
+# Names decoded at the offsets the compression pointers refer to
+_Names = Dict[int, QName]
+_CNAME: int = RRType.CNAME.value
+_Resource = TypeVar("_Resource", Answer, Authority, Addition)
+_T = TypeVar("_T")
 
-def _parse_header(buffer: BinaryIO) -> Header:
-    return Header(*unpack_buffer("!HHHHHH", buffer))
-
-
-def _parse_compressed_name(length: int, buffer: BinaryIO, depth: int) -> Iterable[bytes]:
-    pointer_bytes = bytes([length & _MAX_LABEL_LENGTH]) + buffer.read(1)
-    pointer = unpack_bytes("!H", pointer_bytes)[0]
-    current_pos = buffer.tell()
-    buffer.seek(pointer)
-    for name in _parse_name(buffer, depth):
-        yield name
-
-    buffer.seek(current_pos)
 
+def _parse_name(data: bytes, offset: int, names: _Names, pointers: int = 0) -> Tuple[QName, int]:
+    """:return: Name and the offset right after it"""
+    labels: List[bytes] = []
 
-def _parse_name(buffer: BinaryIO, depth: int) -> Iterable[bytes]:
-    while (byte := buffer.read(1)) and (length := byte[0]):
+    while length := data[offset]:
         if length > _MAX_LABEL_LENGTH:
             if length < _POINTER_MASK:
                 raise DNSParserInvalidLabelLengthError(f"Invalid label length {length}")
 
-            if depth > _MAX_POINTERS:
-                raise DNSParserRecursionError(f"The limit of {_MAX_POINTERS} pointers has been reached")
-
-            for name in _parse_compressed_name(length, buffer, depth + 1):
-                yield name
-
-            break
-
-        else:
-            yield buffer.read(length)
-
-
-def _decompress_name(buffer: BinaryIO) -> bytes:
-    return _encode_qname(_parse_name(buffer, 0))
+            pointer = (length & _MAX_LABEL_LENGTH) << 8 | data[offset + 1]
+            suffix = names.get(pointer)
 
+            if suffix is None:
+                if pointers > _MAX_POINTERS:
+                    raise DNSParserRecursionError(f"The limit of {_MAX_POINTERS} pointers has been reached")
 
-def _parse_qname(buffer: BinaryIO) -> QName:
-    return QName(_parse_name(buffer, 0))
+                suffix = names[pointer] = _parse_name(data, pointer, names, pointers + 1)[0]
 
+            return QName((*labels, *suffix)) if labels else suffix, offset + 2
 
-def _parse_question(buffer: BinaryIO) -> Question:
-    name = _parse_qname(buffer)
-    rr_type, rr_class = unpack_buffer("!HH", buffer)
-    return Question(name, rr_type, rr_class)
+        offset += 1
+        labels.append(data[offset : offset + length])
+        offset += length
 
+    return QName(labels), offset + 1
 
-def _parse_resource(buffer: BinaryIO) -> Tuple[QName, RRType, int, int, int, bytes]:
-    name = _parse_qname(buffer)
-    rr_type, rr_class, ttl, rr_data_length = unpack_buffer("!HHIH", buffer)
 
-    if rr_type == RRType.CNAME.value:
-        rr_data = _decompress_name(buffer)
+def _parse_questions(data: bytes, offset: int, count: int, names: _Names) -> Tuple[List[Question], int]:
+    """:return: Questions and the offset right after them"""
+    questions: List[Question] = []
 
-    else:
-        rr_data = buffer.read(rr_data_length)
+    for _ in range(count):
+        name, offset = _parse_name(data, offset, names)
+        questions.append(Question(name, *QUESTION.unpack_from(data, offset)))
+        offset += QUESTION.size
 
-    return name, rr_type, rr_class, ttl, rr_data_length, rr_data
+    return questions, offset
 
 
-def _parse_answer(buffer: BinaryIO) -> Answer:
-    return Answer(*_parse_resource(buffer))
+def _parse_resources(
+    resource: Type[_Resource], data: bytes, offset: int, count: int, names: _Names
+) -> Tuple[List[_Resource], int]:
+    """:return: Resource records and the offset right after them"""
+    resources: List[_Resource] = []
 
+    for _ in range(count):
+        name, offset = _parse_name(data, offset, names)
+        rr_type, rr_class, ttl, rr_data_length = RESOURCE.unpack_from(data, offset)
+        offset += RESOURCE.size
+        end = offset + rr_data_length
 
-def _parse_authority(buffer: BinaryIO) -> Authority:
-    return Authority(*_parse_resource(buffer))
+        if rr_type == _CNAME:
+            rr_data = _encode_qname(_parse_name(data, offset, names)[0])
 
+        else:
+            rr_data = data[offset:end]
 
-def _parse_addition(buffer: BinaryIO) -> Addition:
-    return Addition(*_parse_resource(buffer))
+        resources.append(resource(name, rr_type, rr_class, ttl, rr_data_length, rr_data))
+        offset = end
 
+    return resources, offset
 
-def _bytes_to_buffer(data: bytes) -> BytesIO:
-    return BytesIO(data)
 
+def _parse(data: bytes) -> DNSData:
+    header = Header(*HEADER.unpack_from(data))
+    names: _Names = {}
+    questions, offset = _parse_questions(data, HEADER.size, header.questions, names)
+    answers, offset = _parse_resources(Answer, data, offset, header.answers, names)
+    authorities, offset = _parse_resources(Authority, data, offset, header.authorities, names)
+    additions, offset = _parse_resources(Addition, data, offset, header.additions, names)
 
-def _parse(buffer: BytesIO) -> DNSData:
-    header = _parse_header(buffer)
+    # Labels and RDATA running past the end are cut short by slicing
+    if offset > len(data):
+        raise DNSParserError("The message is truncated")
 
-    return DNSData(
-        header=header,
-        questions=[_parse_question(buffer) for _ in range(header.questions)],
-        answers=[_parse_answer(buffer) for _ in range(header.answers)],
-        authorities=[_parse_authority(buffer) for _ in range(header.authorities)],
-        additions=[_parse_addition(buffer) for _ in range(header.additions)],
-    )
+    return DNSData(header=header, questions=questions, answers=answers, authorities=authorities, additions=additions)
 
 
-def parse(data: bytes) -> DNSData:
+def _decode(decoder: Callable[[], _T]) -> _T:
+    """:return: Result of the decoder, any failure is raised as DNSParserError"""
     try:
-        return _parse(_bytes_to_buffer(data))
+        return decoder()
 
     except DNSParserError:
         raise
 
+    except error as e:
+        raise DNSParserUnpackError from e
+
     except Exception as any_exception:
         raise DNSParserError from any_exception
+
+
+def parse(data: bytes) -> DNSData:
+    return _decode(lambda: _parse(data))
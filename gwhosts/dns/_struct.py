@@ -1,16 +1,12 @@
-from struct import unpack, error, calcsize
-from typing import Any, BinaryIO, Tuple
-
-from ._exceptions import DNSParserUnpackError
-
-
-def unpack_bytes(fmt: str, buffer: bytes) -> Tuple[Any, ...]:
-    try:
-        return unpack(fmt, buffer)
-
-    except error as e:
-        raise DNSParserUnpackError from e
-
-
-def unpack_buffer(fmt: str, buffer: BinaryIO) -> Tuple[Any, ...]:
-    return unpack_bytes(fmt, buffer.read(calcsize(fmt)))
+from struct import Struct
+
+# ID, flags, QDCOUNT, ANCOUNT, NSCOUNT, ARCOUNT [https://www.iana.org/go/rfc1035]
+HEADER = Struct("!HHHHHH")
+# QTYPE, QCLASS
+QUESTION = Struct("!HH")
+# TYPE, CLASS, TTL, RDLENGTH
+RESOURCE = Struct("!HHIH")
+UINT16 = Struct("!H")
+# Addresses of A and AAAA records
+IPV4 = Struct("!L")
+IPV6 = Struct("!QQ")
@@ -1,6 +1,6 @@
 from dataclasses import dataclass
 from enum import Enum
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 
 class Flags(Enum):
@@ -9,6 +9,7 @@ class Flags(Enum):
     :param TC: Truncated Response [https://www.iana.org/go/rfc1035]
     :param RD: Recursion Desired [https://www.iana.org/go/rfc1035]
     :param RA: Recursion Available [https://www.iana.org/go/rfc1035]
+    :param CD: Checking Disabled [https://www.iana.org/go/rfc4035]
     :see: https://www.iana.org/assignments/dns-parameters/dns-parameters.xhtml#dns-parameters-12
     """
 
@@ -19,9 +20,23 @@ class Flags(Enum):
     RD: int = 0b00000001_00000000
     RA: int = 0b00000000_10000000
     Z: int = 0b00000000_01110000
+    CD: int = 0b00000000_00010000
     RCODE: int = 0b00000000_00001111
 
 
+class RCode(Enum):
+    """Response codes
+    :param NOERROR: No Error [https://www.iana.org/go/rfc1035]
+    :param SERVFAIL: Server Failure [https://www.iana.org/go/rfc1035]
+    :param NXDOMAIN: Non-Existent Domain [https://www.iana.org/go/rfc1035]
+    :see: https://www.iana.org/assignments/dns-parameters/dns-parameters.xhtml#dns-parameters-6
+    """
+
+    NOERROR: int = 0
+    SERVFAIL: int = 2
+    NXDOMAIN: int = 3
+
+
 class DNSClass(Enum):
     """DNS CLASSes
     :param IN: Internet (IN) [https://www.iana.org/go/rfc1035]
@@ -36,14 +51,18 @@ class RRType(Enum):
     :param A: IPv4 Address [https://www.iana.org/go/rfc1035]
     :param AAAA: IPv6 Address [https://www.iana.org/go/rfc3596]
     :param CNAME: the canonical name for an alias [https://www.iana.org/go/rfc1035]
+    :param SOA: marks the start of a zone of authority [https://www.iana.org/go/rfc1035]
     :param OPT: a pseudo-record type [https://www.iana.org/go/rfc6891]
+    :param HTTPS: HTTPS binding [https://www.iana.org/go/rfc9460]
     :see: https://www.iana.org/assignments/dns-parameters/dns-parameters.xhtml#dns-parameters-4
     """
 
     A: int = 1
     AAAA: int = 28
     CNAME: int = 5
+    SOA: int = 6
     OPT: int = 41
+    HTTPS: int = 65
 
 
 @dataclass
@@ -125,3 +144,35 @@ class DNSData:
     answers: List[Answer]
     authorities: List[Authority]
     additions: List[Addition]
+
+
+@dataclass
+class WireRecord:
+    """Location of a Resource Record (RR) in a message
+    :param rr_type: Type of RR
+    :param ttl: Offset of the TTL field
+    :param rr_data: (start, end) of the RDATA field
+    """
+
+    rr_type: int
+    ttl: int
+    rr_data: Tuple[int, int]
+
+
+@dataclass
+class WireLayout:
+    """Offsets of the message fields that are patched or compared without parsing the message
+    :param header: Message header
+    :param question: (start, end) of the first question
+    :param ttls: Offsets of the TTL fields of all RRs except OPT
+    :param answers: Answer records
+    :param authorities: Authority records
+    :param opt: Offset of the OPT record CLASS field (the requestor's UDP payload size), None if there is no OPT record
+    """
+
+    header: Header
+    question: Tuple[int, int]
+    ttls: List[int]
+    answers: List[WireRecord]
+    authorities: List[WireRecord]
+    opt: Optional[int] = None
@@ -0,0 +1,104 @@
+from typing import List, Optional, Tuple, Type
+
+from ._exceptions import DNSParserError
+from ._parsers import _Names, _Resource, _decode, _parse_questions, _parse_resources
+from ._struct import HEADER, QUESTION, RESOURCE
+from ._types import Addition, Answer, Authority, Header, Question
+from ._wire import _skip_name
+
+_QUESTIONS, _ANSWERS, _AUTHORITIES, _ADDITIONS = range(4)
+
+
+class DNSDataView:
+    """Raw message with its sections decoded on first access, a drop-in for DNSData when only some sections are needed
+
+    Only the header is decoded right away. A section is located by skipping the sections before it,
+    unless they have been decoded already, so the questions of a query or the answers of a response
+    cost about as much as decoding them alone.
+
+    :param data: Raw message
+    :raises DNSParserError: The header is malformed, a section raises it on access if it is malformed
+    """
+
+    __slots__ = ("data", "header", "_offsets", "_names", "_questions", "_answers", "_authorities", "_additions")
+
+    def __init__(self, data: bytes) -> None:
+        self.data = data
+        self.header: Header = _decode(lambda: Header(*HEADER.unpack_from(data)))
+        # Offsets where the questions, the answers, the authorities and the additions start, as far as they are known
+        self._offsets: List[int] = [HEADER.size]
+        self._names: _Names = {}
+        self._questions: Optional[List[Question]] = None
+        self._answers: Optional[List[Answer]] = None
+        self._authorities: Optional[List[Authority]] = None
+        self._additions: Optional[List[Addition]] = None
+
+    def _skip(self, section: int) -> int:
+        """:return: Offset right after the section"""
+        data, offset = self.data, self._offsets[section]
+
+        if section == _QUESTIONS:
+            for _ in range(self.header.questions):
+                offset = _skip_name(data, offset) + QUESTION.size
+
+        else:
+            for _ in range((self.header.answers, self.header.authorities, self.header.additions)[section - 1]):
+                offset = _skip_name(data, offset)
+                offset += RESOURCE.size + RESOURCE.unpack_from(data, offset)[-1]
+
+        return offset
+
+    def _start(self, section: int) -> int:
+        """:return: Offset where the section starts"""
+        offsets = self._offsets
+
+        while len(offsets) <= section:
+            offsets.append(_decode(lambda: self._skip(len(offsets) - 1)))
+
+        return offsets[section]
+
+    def _end(self, section: int, end: int) -> None:
+        if end > len(self.data):
+            raise DNSParserError("The message is truncated")
+
+        if len(self._offsets) == section + 1:
+            self._offsets.append(end)
+
+    def _resources(self, resource: Type[_Resource], section: int, count: int) -> List[_Resource]:
+        start = self._start(section)
+        resources, end = _decode(lambda: _parse_resources(resource, self.data, start, count, self._names))
+        self._end(section, end)
+
+        return resources
+
+    @property
+    def questions(self) -> List[Question]:
+        if self._questions is None:
+            questions: Tuple[List[Question], int] = _decode(
+                lambda: _parse_questions(self.data, HEADER.size, self.header.questions, self._names)
+            )
+            self._end(_QUESTIONS, questions[1])
+            self._questions = questions[0]
+
+        return self._questions
+
+    @property
+    def answers(self) -> List[Answer]:
+        if self._answers is None:
+            self._answers = self._resources(Answer, _ANSWERS, self.header.answers)
+
+        return self._answers
+
+    @property
+    def authorities(self) -> List[Authority]:
+        if self._authorities is None:
+            self._authorities = self._resources(Authority, _AUTHORITIES, self.header.authorities)
+
+        return self._authorities
+
+    @property
+    def additions(self) -> List[Addition]:
+        if self._additions is None:
+            self._additions = self._resources(Addition, _ADDITIONS, self.header.additions)
+
+        return self._additions
@@ -0,0 +1,326 @@
+from struct import error
+from typing import List, Optional, Tuple
+
+from ._exceptions import DNSParserError, DNSParserInvalidLabelLengthError
+from ._parsers import _MAX_LABEL_LENGTH, _POINTER_MASK
+from ._struct import HEADER, IPV4, IPV6, QUESTION, RESOURCE, UINT16
+from ._types import Flags, Header, QName, Question, RRType, WireLayout, WireRecord
+
+_CLASS_OFFSET: int = 2
+_TTL_OFFSET: int = 4
+# Root name, TYPE, CLASS, TTL, RDLENGTH of an OPT record
+_OPT_SIZE: int = 1 + RESOURCE.size
+_OPT_CLASS_OFFSET: int = 1 + _CLASS_OFFSET
+# Flags in the OPT record TTL follow the CLASS, the extended RCODE and the version
+_OPT_FLAGS_OFFSET: int = _CLASS_OFFSET + 2
+# DNSSEC OK flag [https://www.iana.org/go/rfc3225]
+_DO: int = 0x8000
+# Query flags that select the response, the last byte of a question key
+_KEY_EDNS: int = 0b001
+_KEY_DO: int = 0b010
+_KEY_CD: int = 0b100
+
+_A: int = RRType.A.value
+_AAAA: int = RRType.AAAA.value
+
+# UDP payload size of a requestor without EDNS [https://www.iana.org/go/rfc6891]
+MIN_UDP_PAYLOAD_SIZE: int = 512
+
+
+def _skip_name(data: bytes, offset: int) -> int:
+    """:return: Offset right after the name"""
+    while length := data[offset]:
+        if length > _MAX_LABEL_LENGTH:
+            if length < _POINTER_MASK:
+                raise DNSParserInvalidLabelLengthError(f"Invalid label length {length}")
+
+            return offset + 2
+
+        offset += length + 1
+
+    return offset + 1
+
+
+def _scan(data: bytes) -> WireLayout:
+    header = Header(*HEADER.unpack_from(data))
+    offset = HEADER.size
+    question: Tuple[int, int] = (offset, offset)
+
+    for idx in range(header.questions):
+        start = offset
+        offset = _skip_name(data, offset) + QUESTION.size
+
+        if not idx:
+            question = (start, offset)
+
+    ttls: List[int] = []
+    records: List[WireRecord] = []
+    opt: Optional[int] = None
+
+    for _ in range(header.answers + header.authorities + header.additions):
+        offset = _skip_name(data, offset)
+        rr_type, _, _, rr_data_length = RESOURCE.unpack_from(data, offset)
+        rr_class = offset + _CLASS_OFFSET
+        ttl = offset + _TTL_OFFSET
+        rr_data = offset + RESOURCE.size
+        offset = rr_data + rr_data_length
+
+        if rr_type != RRType.OPT.value:
+            ttls.append(ttl)
+        else:
+            opt = rr_class
+
+        records.append(WireRecord(rr_type, ttl, (rr_data, offset)))
+
+    if offset > len(data):
+        raise DNSParserError("The message is truncated")
+
+    return WireLayout(
+        header=header,
+        question=question,
+        ttls=ttls,
+        answers=records[: header.answers],
+        authorities=records[header.answers : header.answers + header.authorities],
+        opt=opt,
+    )
+
+
+def scan(data: bytes) -> WireLayout:
+    """Locate the fields of a message without decoding names and RDATA"""
+    try:
+        return _scan(data)
+
+    except DNSParserError:
+        raise
+
+    except (IndexError, error) as e:
+        raise DNSParserError from e
+
+
+def _question_end(data: bytes) -> Optional[int]:
+    """:return: Offset right after the question of a message with a single uncompressed question, None otherwise"""
+    if len(data) < HEADER.size or data[4:6] != b"\x00\x01":
+        return None
+
+    offset = HEADER.size
+
+    try:
+        while length := data[offset]:
+            if length > _MAX_LABEL_LENGTH:
+                return None
+
+            offset += length + 1
+
+    except IndexError:
+        return None
+
+    end = offset + 1 + QUESTION.size
+
+    return end if end <= len(data) else None
+
+
+def _answer_addresses(data: bytes) -> Tuple[List[int], List[int]]:
+    _, _, questions, answers, _, _ = HEADER.unpack_from(data)
+    offset = HEADER.size
+    ipv4_addresses: List[int] = []
+    ipv6_addresses: List[int] = []
+
+    for _ in range(questions):
+        offset = _skip_name(data, offset) + QUESTION.size
+
+    for _ in range(answers):
+        offset = _skip_name(data, offset)
+        rr_type, _, _, rr_data_length = RESOURCE.unpack_from(data, offset)
+        offset += RESOURCE.size
+
+        if rr_type == _A and rr_data_length == IPV4.size:
+            ipv4_addresses.append(IPV4.unpack_from(data, offset)[0])
+
+        elif rr_type == _AAAA and rr_data_length == IPV6.size:
+            high, low = IPV6.unpack_from(data, offset)
+            ipv6_addresses.append(high << 64 | low)
+
+        offset += rr_data_length
+
+    if offset > len(data):
+        raise DNSParserError("The message is truncated")
+
+    return ipv4_addresses, ipv6_addresses
+
+
+def answer_addresses(data: bytes) -> Tuple[List[int], List[int]]:
+    """Extract the addresses from the answers without decoding names and other records
+
+    :return: IPv4 and IPv6 addresses of the A and AAAA answers as integers
+    :raises DNSParserError: The message is malformed
+    """
+    try:
+        return _answer_addresses(data)
+
+    except DNSParserError:
+        raise
+
+    except (IndexError, error) as e:
+        raise DNSParserError from e
+
+
+def _key_flags(data: bytes, end: int) -> int:
+    """:return: EDNS presence, DO and CD flags of the query whose single question ends at the offset"""
+    flags = _KEY_CD if UINT16.unpack_from(data, 2)[0] & Flags.CD.value else 0
+
+    if data[6:12] == b"\x00\x00\x00\x00\x00\x00":
+        return flags
+
+    # A single question followed by nothing but the OPT record, the way stub resolvers send queries
+    if (
+        data[6:12] == b"\x00\x00\x00\x00\x00\x01"
+        and data[end : end + 3] == b"\x00\x00\x29"
+        and end + _OPT_SIZE <= len(data)
+    ):
+        opt: Optional[int] = end + _OPT_CLASS_OFFSET
+    else:
+        opt = _scan(data).opt
+
+    if opt is None:
+        return flags
+
+    return flags | _KEY_EDNS | (_KEY_DO if UINT16.unpack_from(data, opt + _OPT_FLAGS_OFFSET)[0] & _DO else 0)
+
+
+def question_key(data: bytes) -> Optional[bytes]:
+    """Key of the queries that are answered with the same response
+
+    :return: Raw (QNAME, QTYPE, QCLASS) followed by a byte of the EDNS presence, DO and CD flags, of a standard
+        query (QR=0, OPCODE=QUERY) with a single uncompressed question, None otherwise
+    """
+    end = _question_end(data)
+
+    if end is None or UINT16.unpack_from(data, 2)[0] & (Flags.QR.value | Flags.OPCODE.value):
+        return None
+
+    try:
+        flags = _key_flags(data, end)
+
+    except (DNSParserError, IndexError, error):
+        return None
+
+    return data[HEADER.size : end] + flags.to_bytes(1, "big")
+
+
+def question_matches(query: bytes, response: bytes) -> bool:
+    """Compare the questions byte for byte, including the case of the names
+
+    :return: The response repeats the question of the query
+    """
+    end = _question_end(query)
+
+    if end is not None:
+        return response[4:6] == b"\x00\x01" and response[HEADER.size : end] == query[HEADER.size : end]
+
+    try:
+        question = _scan(query).question
+        response_question = _scan(response).question
+
+    except (DNSParserError, IndexError, error):
+        return False
+
+    return question[0] != question[1] and response[slice(*response_question)] == query[slice(*question)]
+
+
+def key_query(key: bytes, query_id: int = 0, payload_size: int = MIN_UDP_PAYLOAD_SIZE) -> bytes:
+    """Recreate the query of a question key, the way the clients asked it
+
+    :param payload_size: UDP payload size advertised if the key has EDNS
+    :return: Recursive query with the question and the flags of the key
+    """
+    flags = key[-1]
+    query = HEADER.pack(
+        query_id,
+        Flags.RD.value | (Flags.CD.value if flags & _KEY_CD else 0),
+        1,
+        0,
+        0,
+        1 if flags & _KEY_EDNS else 0,
+    )
+    query += key[:-1]
+
+    if flags & _KEY_EDNS:
+        query += b"\x00" + RESOURCE.pack(RRType.OPT.value, payload_size, _DO if flags & _KEY_DO else 0, 0)
+
+    return query
+
+
+def standard_question(data: bytes) -> Optional[Question]:
+    """Classify a query without parsing it, the message is validated before anything is decoded
+
+    :return: Question of a standard query (QR=0, OPCODE=QUERY) with a single uncompressed question, None otherwise
+    """
+    if len(data) < HEADER.size or UINT16.unpack_from(data, 2)[0] & (Flags.QR.value | Flags.OPCODE.value):
+        return None
+
+    end = _question_end(data)
+
+    if end is None:
+        return None
+
+    labels: List[bytes] = []
+    offset = HEADER.size
+
+    while length := data[offset]:
+        offset += 1
+        labels.append(data[offset : offset + length])
+        offset += length
+
+    return Question(QName(labels), *QUESTION.unpack_from(data, offset + 1))
+
+
+def udp_payload_size(data: bytes) -> int:
+    """:return: UDP payload size the requestor can reassemble, 512 if the query has no valid OPT record"""
+    # A single question followed by nothing but the OPT record, the way stub resolvers send queries
+    if data[6:12] == b"\x00\x00\x00\x00\x00\x01" and (end := _question_end(data)) is not None:
+        if data[end : end + 3] == b"\x00\x00\x29" and end + _OPT_SIZE <= len(data):
+            return max(UINT16.unpack_from(data, end + _OPT_CLASS_OFFSET)[0], MIN_UDP_PAYLOAD_SIZE)
+
+    try:
+        opt = _scan(data).opt
+
+    except (DNSParserError, IndexError, error):
+        return MIN_UDP_PAYLOAD_SIZE
+
+    return MIN_UDP_PAYLOAD_SIZE if opt is None else max(UINT16.unpack_from(data, opt)[0], MIN_UDP_PAYLOAD_SIZE)
+
+
+def limit_udp_payload_size(data: bytes, size: int) -> bytes:
+    """:return: The query advertising at most the UDP payload size in its OPT record"""
+    try:
+        opt = _scan(data).opt
+
+    except (DNSParserError, IndexError, error):
+        return data
+
+    if opt is None or UINT16.unpack_from(data, opt)[0] <= size:
+        return data
+
+    return data[:opt] + UINT16.pack(size) + data[opt + UINT16.size :]
+
+
+def truncate(data: bytes, size: int) -> bytes:
+    """:return: The response if it fits the UDP payload size, otherwise its header with the TC flag and the question"""
+    if len(data) <= size:
+        return data
+
+    try:
+        layout = _scan(data)
+
+    except (DNSParserError, IndexError, error):
+        layout = None
+
+    if layout is None or layout.question[0] == layout.question[1]:
+        header = Header(*HEADER.unpack_from(data))
+        question = b""
+
+    else:
+        header = layout.header
+        question = data[slice(*layout.question)]
+
+    return HEADER.pack(header.id, header.flags | Flags.TC.value, 1 if question else 0, 0, 0, 0) + question
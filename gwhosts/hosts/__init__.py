@@ -0,0 +1,15 @@
+from ._base import BaseHostnames
+from ._bloom import HostnameFilter
+from ._hostsfile import read_hostsfile
+from ._index import HostnameIndex, compile_index, is_hostname_index
+from ._trie import HostnameTrie
+
+__all__ = [
+    "BaseHostnames",
+    "HostnameFilter",
+    "HostnameIndex",
+    "HostnameTrie",
+    "compile_index",
+    "is_hostname_index",
+    "read_hostsfile",
+]
@@ -0,0 +1,22 @@
+from argparse import ArgumentParser
+
+from . import compile_index, read_hostsfile
+
+if __name__ == "__main__":
+    parser = ArgumentParser(prog="python -m gwhosts.hosts", description="Hostname list tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+    compile_parser = commands.add_parser("compile", help="Compile a gzipped list of hostnames into an index")
+    compile_parser.add_argument("hostsfile", help="Gzipped list of hostnames, one name per line")
+    compile_parser.add_argument("index", help="Compiled index, the proxy takes it in place of the list")
+    compile_parser.add_argument(
+        "--bits-per-hostname",
+        dest="bits_per_hostname",
+        help="Size of the prefilter, more bits make fewer false positives",
+        default=12,
+        type=int,
+    )
+
+    args = parser.parse_args()
+
+    count = compile_index(read_hostsfile(args.hostsfile), args.index, args.bits_per_hostname)
+    print(f"{count} hostnames were written to {args.index}")
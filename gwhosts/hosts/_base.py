@@ -0,0 +1,62 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict
+
+from ..dns import QName
+
+
+class BaseHostnames(ABC):
+    """Listed hostnames and all of their subdomains
+
+    The results of recent lookups are kept in a separate LRU memo capped at `memo_size` names.
+
+    :param size: Number of the listed hostnames
+    :param memo_size: Number of the most recently looked up names whose results are memoized, 0 disables the memo
+    """
+
+    def __init__(self, size: int, memo_size: int = 4096) -> None:
+        self._size = size
+        self._memo: OrderedDict[QName, bool] = OrderedDict()
+        self._memo_size = memo_size
+        self._hits: int = 0
+        self._misses: int = 0
+
+    def __len__(self) -> int:
+        """:return: Number of the listed hostnames, subdomains of the listed ones are not counted"""
+        return self._size
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        return {
+            "hostnames": self._size,
+            "hostname_memo_entries": len(self._memo),
+            "hostname_memo_hits": self._hits,
+            "hostname_memo_misses": self._misses,
+        }
+
+    @abstractmethod
+    def _match(self, hostname: QName) -> bool:
+        """:return: The hostname or one of its parent domains is listed, checked exactly"""
+
+    def __contains__(self, hostname: QName) -> bool:
+        """:return: The hostname or one of its parent domains is listed"""
+        if not self._memo_size:
+            self._misses += 1
+            return self._match(hostname)
+
+        memo = self._memo
+        listed = memo.get(hostname)
+
+        if listed is not None:
+            self._hits += 1
+            memo.move_to_end(hostname)
+            return listed
+
+        self._misses += 1
+        listed = self._match(hostname)
+        memo[hostname] = listed
+
+        if len(memo) > self._memo_size:
+            memo.popitem(last=False)
+
+        return listed
@@ -0,0 +1,141 @@
+from array import array
+from struct import Struct
+from sys import byteorder
+from typing import Union
+from zlib import crc32
+
+from ..dns import QName
+
+# Bits set by a hash in its 64-bit block
+_BITS_PER_HASH: int = 4
+# The top bits of a hash pick one of the bit patterns
+_PATTERN_SHIFT: int = 22
+# Shortest listed name and number of blocks, followed by the little-endian blocks
+_DUMP_HEADER = Struct("<BxxxI")
+
+
+def _pattern(index: int) -> int:
+    """:return: Bits picked by 6-bit chunks of the index CRC-32, the chunks may pick the same bit"""
+    digest = crc32(index.to_bytes(2, "big"))
+    pattern = 0
+
+    for shift in range(0, 6 * _BITS_PER_HASH, 6):
+        pattern |= 1 << (digest >> shift & 63)
+
+    return pattern
+
+
+_PATTERNS = tuple(_pattern(_index) for _index in range(1 << (32 - _PATTERN_SHIFT)))
+
+
+class HostnameFilter:
+    """Blocked Bloom filter over the hashes of the listed hostnames
+
+    A hostname is hashed with CRC-32 chained over its labels from the top-level one, so the hashes of all
+    the suffixes of a name are computed in one pass. A hash sets a few bits within a single 64-bit block,
+    so a probe reads one block. A name may be listed only if the hash of one of its suffixes is in the filter,
+    a name that is not rejected needs an exact check.
+
+    :param count: Expected number of hashes
+    :param bits_per_hash: Filter size, rounded up to a power of two, 12 bits keep below 1% of the probes falsely positive
+    """
+
+    def __init__(self, count: int, bits_per_hash: int = 12) -> None:
+        blocks = 1
+
+        while blocks * 64 < count * bits_per_hash:
+            blocks <<= 1
+
+        self._mask = blocks - 1
+        self._blocks = array("Q", bytes(blocks * 8))
+        # Suffixes shorter than the shortest listed name are not probed
+        self._min_labels: int = 127
+
+    @property
+    def size(self) -> int:
+        """:return: Size of the filter in bytes"""
+        return len(self._blocks) * self._blocks.itemsize
+
+    @property
+    def false_positive_rate(self) -> float:
+        """:return: Estimated share of the probes of unlisted suffixes that pass the filter"""
+        return sum((bin(_block).count("1") / 64) ** _BITS_PER_HASH for _block in self._blocks) / len(self._blocks)
+
+    def dump(self) -> bytes:
+        """:return: The filter in a portable form"""
+        blocks = array("Q", self._blocks)
+
+        if byteorder == "big":
+            blocks.byteswap()
+
+        return _DUMP_HEADER.pack(self._min_labels, len(blocks)) + blocks.tobytes()
+
+    @classmethod
+    def load(cls, data: Union[bytes, memoryview]) -> "HostnameFilter":
+        """Load the filter without copying it on little-endian machines, the filter shares the data memory
+
+        :param data: Filter dumped by HostnameFilter.dump
+        :raises ValueError: The data is not a dumped filter
+        """
+        if len(data) < _DUMP_HEADER.size:
+            raise ValueError("Malformed hostname filter")
+
+        min_labels, count = _DUMP_HEADER.unpack_from(data)
+
+        if not count or count & (count - 1) or len(data) - _DUMP_HEADER.size != count * 8:
+            raise ValueError("Malformed hostname filter")
+
+        if byteorder == "little":
+            blocks = memoryview(data)[_DUMP_HEADER.size :].cast("Q")
+        else:
+            blocks = array("Q")
+            blocks.frombytes(data[_DUMP_HEADER.size :])
+            blocks.byteswap()
+
+        prefilter = cls(0)
+        prefilter._blocks = blocks
+        prefilter._mask = count - 1
+        prefilter._min_labels = min_labels
+
+        return prefilter
+
+    def release(self) -> None:
+        """Stop sharing the memory of the data the filter is loaded from"""
+        if isinstance(self._blocks, memoryview):
+            self._blocks.release()
+
+    def probe(self, value: int) -> bool:
+        """:return: The hash may be in the filter"""
+        pattern = _PATTERNS[value >> _PATTERN_SHIFT]
+
+        return self._blocks[value & self._mask] & pattern == pattern
+
+    def add(self, value: int, labels: int) -> None:
+        """:param labels: Number of labels of the hashed name"""
+        self._blocks[value & self._mask] |= _PATTERNS[value >> _PATTERN_SHIFT]
+        self._min_labels = min(self._min_labels, labels)
+
+    def __contains__(self, hostname: QName) -> bool:
+        """:return: The hash of one of the hostname suffixes is in the filter"""
+        level = len(hostname) - self._min_labels
+
+        if level < 0:
+            return False
+
+        blocks = self._blocks
+        mask = self._mask
+        value = 0
+
+        for label in hostname[:level:-1]:
+            value = crc32(label, value)
+
+        while level >= 0:
+            value = crc32(hostname[level], value)
+            pattern = _PATTERNS[value >> _PATTERN_SHIFT]
+
+            if blocks[value & mask] & pattern == pattern:
+                return True
+
+            level -= 1
+
+        return False
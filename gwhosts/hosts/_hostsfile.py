@@ -0,0 +1,10 @@
+import gzip
+from typing import List
+
+from ..dns import QName
+
+
+def read_hostsfile(path: str) -> List[QName]:
+    """:return: Hostnames from a gzipped list, one name per line"""
+    with gzip.open(path, "r") as hostsfile:
+        return [QName(_line.split(b".")) for _line in hostsfile.read().splitlines() if _line]
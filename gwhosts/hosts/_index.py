@@ -0,0 +1,173 @@
+from array import array
+from mmap import ACCESS_READ, mmap
+from os import replace
+from struct import Struct
+from sys import byteorder
+from typing import Dict, Iterable, Tuple
+from zlib import crc32
+
+from ._base import BaseHostnames
+from ._bloom import HostnameFilter
+from ._trie import HostnameTrie
+from ..dns import QName
+
+_MAGIC: bytes = b"GWHI"
+_VERSION: int = 1
+# Magic, version, number of the hostnames and size of the dumped prefilter
+_HEADER = Struct("<4sHxxII")
+_OFFSET = Struct("<I")
+# Start and end of a name in the names section
+_BOUNDS = Struct("<II")
+
+
+def _encode(labels: Iterable[bytes]) -> bytes:
+    """:return: Length-prefixed labels"""
+    return b"".join(len(_label).to_bytes(1, "big") + _label for _label in labels)
+
+
+def is_hostname_index(path: str) -> bool:
+    """:return: The file is a compiled hostname index rather than a gzipped list of hostnames"""
+    with open(path, "rb") as index:
+        return index.read(len(_MAGIC)) == _MAGIC
+
+
+def compile_index(hostnames: Iterable[QName], path: str, bits_per_hostname: int = 12) -> int:
+    """Write the hostnames as an index that is opened by HostnameIndex
+
+    The file has a header, the dumped prefilter, little-endian offsets of the names and the names themselves:
+    sorted and deduplicated, with the labels in reverse order and length-prefixed. Subdomains of the listed
+    names are left out. The file is replaced atomically, so the processes that have the previous index open
+    keep reading it.
+
+    :param bits_per_hostname: Size of the prefilter
+    :return: Number of the written hostnames
+    """
+    trie = HostnameTrie(hostnames, memo_size=0)
+    names = sorted(_encode(reversed(_hostname)) for _hostname in trie)
+    prefilter = trie.build_prefilter(bits_per_hostname).dump()
+    offsets = array("I", [0])
+
+    for name in names:
+        offsets.append(offsets[-1] + len(name))
+
+    if byteorder == "big":
+        offsets.byteswap()
+
+    with open(path + ".tmp", "wb") as index:
+        index.write(_HEADER.pack(_MAGIC, _VERSION, len(names), len(prefilter)))
+        index.write(prefilter)
+        index.write(offsets.tobytes())
+        index.writelines(names)
+
+    replace(path + ".tmp", path)
+
+    return len(names)
+
+
+class HostnameIndex(BaseHostnames):
+    """Listed hostnames and all of their subdomains, looked up in an index compiled by compile_index
+
+    The index is memory-mapped, so opening it takes no time and the processes share its pages. Most of the names
+    asked are not listed, they are rejected by the prefilter before the memo is looked up. The suffixes of a name
+    that pass the prefilter are looked up by binary search.
+
+    :param path: Compiled index
+    :param memo_size: Number of the most recently looked up names whose results are memoized, 0 disables the memo
+    :raises ValueError: The file is not a compiled index of a supported version
+    """
+
+    def __init__(self, path: str, memo_size: int = 4096) -> None:
+        with open(path, "rb") as index:
+            self._data = mmap(index.fileno(), 0, access=ACCESS_READ)
+
+        try:
+            self.prefilter, count = self._load(path)
+
+        except ValueError:
+            self._data.close()
+            raise
+
+        super().__init__(count, memo_size)
+        self._rejected: int = 0
+
+    def _load(self, path: str) -> Tuple[HostnameFilter, int]:
+        """Locate the sections
+
+        :return: The prefilter and number of the hostnames
+        """
+        data = self._data
+
+        if len(data) < _HEADER.size:
+            raise ValueError(f"{path} is not a hostname index")
+
+        magic, version, count, prefilter_size = _HEADER.unpack_from(data)
+
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"{path} is not a hostname index of version {_VERSION}")
+
+        self._offsets = _HEADER.size + prefilter_size
+        self._names = self._offsets + (count + 1) * _OFFSET.size
+
+        if self._names > len(data) or self._names + _OFFSET.unpack_from(data, self._names - _OFFSET.size)[0] != len(
+            data
+        ):
+            raise ValueError(f"{path} is truncated")
+
+        with memoryview(data)[_HEADER.size : self._offsets] as dumped:
+            # The prefilter is read from the mapped pages, the processes share it as well
+            return HostnameFilter.load(dumped), count
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        return {**super().stats, "hostname_prefilter_rejected": self._rejected}
+
+    def close(self) -> None:
+        self.prefilter.release()
+        self._data.close()
+
+    def __contains__(self, hostname: QName) -> bool:
+        if hostname not in self.prefilter:
+            self._rejected += 1
+            return False
+
+        return super().__contains__(hostname)
+
+    def _search(self, name: bytes) -> bool:
+        data = self._data
+        offsets = self._offsets
+        names = self._names
+        low = 0
+        high = self._size
+
+        while low < high:
+            middle = (low + high) >> 1
+            start, end = _BOUNDS.unpack_from(data, offsets + middle * _OFFSET.size)
+            listed = data[names + start : names + end]
+
+            if listed < name:
+                low = middle + 1
+
+            elif listed > name:
+                high = middle
+
+            else:
+                return True
+
+        return False
+
+    def _match(self, hostname: QName) -> bool:
+        prefilter = self.prefilter
+        name = b""
+        value = 0
+        level = len(hostname)
+
+        while level:
+            level -= 1
+            label = hostname[level]
+            name += len(label).to_bytes(1, "big") + label
+            value = crc32(label, value)
+
+            if prefilter.probe(value) and self._search(name):
+                return True
+
+        return False
@@ -0,0 +1,114 @@
+from typing import Any, Dict, Iterable, Iterator, Tuple
+from zlib import crc32
+
+from ._base import BaseHostnames
+from ._bloom import HostnameFilter
+from ..dns import QName
+
+_Node = Dict[bytes, Any]
+# Shared node of a listed name, the names below it are listed as well, so it needs no children
+_LISTED: _Node = {}
+
+
+class HostnameTrie(BaseHostnames):
+    """Listed hostnames and all of their subdomains, looked up in a single pass from the top-level label
+
+    Labels are stored in reverse order, a name is listed once the walk reaches a listed node, so a lookup
+    neither slices the name nor allocates. A walk is cheaper than a prefilter probe, so the trie has no prefilter
+    in front of it, the one built by build_prefilter is dumped into a compiled index. The configured hostnames are
+    never modified.
+
+    :param hostnames: Listed hostnames
+    :param memo_size: Number of the most recently looked up names whose results are memoized, 0 disables the memo
+    """
+
+    def __init__(self, hostnames: Iterable[QName], memo_size: int = 4096) -> None:
+        self._root: _Node = {}
+        self._size: int = 0
+
+        for hostname in hostnames:
+            self._add(hostname)
+
+        super().__init__(self._size, memo_size)
+
+    def _add(self, hostname: QName) -> None:
+        if not hostname:
+            return
+
+        node = self._root
+
+        for label in reversed(hostname[1:]):
+            child = node.get(label)
+
+            if child is _LISTED:
+                return
+
+            if child is None:
+                child = node[label] = {}
+
+            node = child
+
+        child = node.get(hostname[0])
+
+        if child is _LISTED:
+            return
+
+        # Subdomains listed before their parent domain are covered by it now
+        self._size += 1 - (0 if child is None else self._count(child))
+        node[hostname[0]] = _LISTED
+
+    def build_prefilter(self, bits_per_hostname: int = 12) -> HostnameFilter:
+        """:param bits_per_hostname: Size of the prefilter
+        :return: Bloom filter over the listed hostnames
+        """
+        prefilter = HostnameFilter(self._size, bits_per_hostname)
+        self._fill(prefilter, self._root, 0, 1)
+
+        return prefilter
+
+    @classmethod
+    def _fill(cls, prefilter: HostnameFilter, node: _Node, value: int, labels: int) -> None:
+        """Add the hashes of the listed names below the node to the prefilter
+
+        :param value: Hash of the node suffix
+        :param labels: Number of labels of the names at the node
+        """
+        for label, child in node.items():
+            if child is _LISTED:
+                prefilter.add(crc32(label, value), labels)
+
+            else:
+                cls._fill(prefilter, child, crc32(label, value), labels + 1)
+
+    @classmethod
+    def _count(cls, node: _Node) -> int:
+        return sum(1 if _child is _LISTED else cls._count(_child) for _child in node.values())
+
+    def __iter__(self) -> Iterator[QName]:
+        """:return: Listed hostnames in no particular order"""
+        return self._iter(self._root, ())
+
+    @classmethod
+    def _iter(cls, node: _Node, suffix: Tuple[bytes, ...]) -> Iterator[QName]:
+        for label, child in node.items():
+            if child is _LISTED:
+                yield QName((label, *suffix))
+
+            else:
+                yield from cls._iter(child, (label, *suffix))
+
+    def _match(self, hostname: QName) -> bool:
+        node = self._root
+        level = len(hostname)
+
+        while level:
+            level -= 1
+            node = node.get(hostname[level])
+
+            if node is None:
+                return False
+
+            if node is _LISTED:
+                return True
+
+        return False
@@ -1,12 +1,31 @@
-import gzip
 import logging
 import sys
 from argparse import ArgumentParser
+from functools import partial
 
-from .dns import QName
-from .network import Address
+from .hosts import HostnameIndex, HostnameTrie, is_hostname_index, read_hostsfile
+from .network import MMSG_SUPPORTED, Address
 from .performance import no_gc
-from .proxy import DNSProxy
+from .proxy import AsyncDNSProxy, DNSProxy, ReactorBackend, RouteOwner, listen_with_workers
+
+
+def _address(value: str) -> Address:
+    """Parse HOST[:PORT] or [IPV6][:PORT], the port is 53 by default, a bare IPv6 address has no port"""
+    if value.startswith("["):
+        host, _, port = value[1:].partition("]")
+
+        if port and not port.startswith(":"):
+            raise ValueError(f"Invalid address {value}")
+
+        return Address(host, int(port[1:]) if port else 53)
+
+    if value.count(":") != 1:
+        return Address(value, 53)
+
+    host, _, port = value.partition(":")
+
+    return Address(host, int(port))
+
 
 if __name__ == "__main__":
     parser = ArgumentParser()
@@ -19,7 +38,14 @@ if __name__ == "__main__":
         "debug": logging.DEBUG,
     }
 
-    parser.add_argument("hostsfile", help="Host List", nargs="?")
+    engines = {
+        "reactor": DNSProxy,
+        "asyncio": AsyncDNSProxy,
+    }
+
+    parser.add_argument(
+        "hostsfile", help="Host List, gzipped or compiled with python -m gwhosts.hosts compile", nargs="?"
+    )
     parser.add_argument("--ipv4-ifname", dest="ipv4_ifname", help="IPv4 interface name", default=None)
     parser.add_argument("--ipv4-gateway", dest="ipv4_gateway", help="IPv4 gateway", default=None)
     parser.add_argument("--ipv6-ifname", dest="ipv6_ifname", help="IPv6 interface name", default=None)
@@ -28,7 +54,135 @@ if __name__ == "__main__":
     parser.add_argument("--port", dest="port", help="Listening port", default="8053", type=int)
     parser.add_argument("--dns-host", dest="dns_host", help="Remote DNS address", default="127.0.0.1")
     parser.add_argument("--dns-port", dest="dns_port", help="Remote DNS port", default="65053", type=int)
+    parser.add_argument(
+        "--upstream",
+        dest="upstreams",
+        help="Remote DNS address as HOST[:PORT], repeat to balance queries between several resolvers "
+        "(overrides --dns-host and --dns-port)",
+        action="append",
+        type=_address,
+    )
+    parser.add_argument(
+        "--upstream-sockets",
+        dest="upstream_sockets",
+        help="Number of sockets shared by all queries forwarded to the remote DNS",
+        default=4,
+        type=int,
+    )
+    parser.add_argument(
+        "--udp-payload-size",
+        dest="buff_size",
+        help="Largest UDP response accepted from the upstream, EDNS queries advertising more are clamped to it",
+        default=4096,
+        type=int,
+        choices=range(512, 65536),
+        metavar="512..65535",
+    )
+    parser.add_argument(
+        "--batch-size",
+        dest="batch_size",
+        help="Maximum number of datagrams read from a socket or sent at once",
+        default=64,
+        type=int,
+    )
+    parser.add_argument(
+        "--mmsg",
+        dest="mmsg",
+        help="Use recvmmsg/sendmmsg system calls for batches",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--stats-interval",
+        dest="stats_interval",
+        help="Log open files, in-flight queries and other stats every N seconds",
+        default=None,
+        type=int,
+    )
+    parser.add_argument(
+        "--cache-size",
+        dest="cache_size",
+        help="Response cache size in MiB, 0 disables caching",
+        default=16,
+        type=int,
+    )
+    parser.add_argument(
+        "--negative-cache-size",
+        dest="negative_cache_size",
+        help="NXDOMAIN/NODATA responses cache size in MiB, 0 disables caching",
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        "--prefetch-top",
+        dest="prefetch_top",
+        help="Number of the most frequently asked proxied hostnames re-resolved before their TTL expires, 0 disables",
+        default=0,
+        type=int,
+    )
+    parser.add_argument(
+        "--prefetch-qps",
+        dest="prefetch_qps",
+        help="Upstream queries per second budget of prefetching",
+        default=10.0,
+        type=float,
+    )
+    parser.add_argument(
+        "--retry-ratio",
+        dest="retry_ratio",
+        help="Retransmissions per forwarded query allowed for queries not answered within the upstream RTO, 0 disables",
+        default=0.0,
+        type=float,
+    )
+    parser.add_argument(
+        "--serve-stale-after",
+        dest="serve_stale_after",
+        help="Seconds to wait for the upstream before answering from expired cache entries (RFC 8767), disabled if unset",
+        default=None,
+        type=float,
+    )
+    parser.add_argument(
+        "--tcp",
+        dest="tcp",
+        help="Accept queries over TCP and re-query truncated responses over TCP",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--tcp-idle-timeout",
+        dest="tcp_idle_timeout",
+        help="Seconds after which idle TCP connections are closed",
+        default=10.0,
+        type=float,
+    )
     parser.add_argument("--timeout", dest="timeout", help="DNS queries timeout in seconds", default=5, type=int)
+    parser.add_argument(
+        "--engine",
+        dest="engine",
+        help="Proxy engine",
+        default="reactor",
+        choices=engines.keys(),
+    )
+    parser.add_argument(
+        "--uvloop",
+        dest="uvloop",
+        help="Run the asyncio engine on uvloop",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--workers",
+        dest="workers",
+        help="Number of worker processes sharing the listening port, routes are programmed by the main process",
+        default=1,
+        type=int,
+    )
+    parser.add_argument(
+        "--reactor",
+        dest="reactor",
+        help="I/O multiplexing backend",
+        default=ReactorBackend.EPOLL.value,
+        choices=[_backend.value for _backend in ReactorBackend],
+    )
     parser.add_argument(
         "--log-level",
         dest="log_level",
@@ -47,23 +201,69 @@ if __name__ == "__main__":
     if args.hostsfile:
         logger.info(f"DNS: reading hostnames from {args.hostsfile}")
 
-        with gzip.open(args.hostsfile, "r") as hostsfile:
+        if is_hostname_index(args.hostsfile):
+            _hostnames = HostnameIndex(args.hostsfile)
+            logger.info(
+                f"DNS: hostname prefilter takes {_hostnames.prefilter.size} bytes, "
+                f"{_hostnames.prefilter.false_positive_rate:.2%} of the probes are falsely positive"
+            )
+
+        else:
             with no_gc():
-                _hostnames = {QName(_name.split(b".")) for _name in hostsfile.read().splitlines()}
+                _hostnames = HostnameTrie(read_hostsfile(args.hostsfile))
 
         logger.info(f"DNS: {len(_hostnames)} hostnames were added to the proxying list")
 
     else:
-        _hostnames = set()
+        _hostnames = HostnameTrie(())
 
-    proxy = DNSProxy(
+    if args.engine == "asyncio":
+        engine_kwargs = {
+            "use_uvloop": args.uvloop,
+        }
+
+    else:
+        engine_kwargs = {
+            "reactor": ReactorBackend(args.reactor),
+            "batch_size": args.batch_size,
+            "mmsg": args.mmsg and MMSG_SUPPORTED,
+        }
+
+    proxy_factory = partial(
+        engines[args.engine],
         ipv4_ifname=args.ipv4_ifname,
         ipv4_gateway=args.ipv4_gateway,
         ipv6_ifname=args.ipv6_ifname,
         ipv6_gateway=args.ipv6_gateway,
         to_addr=Address(args.dns_host, args.dns_port),
+        to_addrs=args.upstreams,
         hostnames=_hostnames,
         logger=logger,
         timeout_in_seconds=args.timeout,
+        buff_size=args.buff_size,
+        upstream_sockets=args.upstream_sockets,
+        stats_interval=args.stats_interval,
+        cache_size=args.cache_size << 20,
+        negative_cache_size=args.negative_cache_size << 20,
+        prefetch_top=args.prefetch_top,
+        prefetch_qps=args.prefetch_qps,
+        retry_ratio=args.retry_ratio,
+        serve_stale_after=args.serve_stale_after,
+        tcp=args.tcp,
+        tcp_idle_timeout=args.tcp_idle_timeout,
+        **engine_kwargs,
     )
-    proxy.listen(Address(args.host, args.port))
+
+    if args.workers > 1:
+        owner = RouteOwner(
+            ipv4_ifname=args.ipv4_ifname,
+            ipv4_gateway=args.ipv4_gateway,
+            ipv6_ifname=args.ipv6_ifname,
+            ipv6_gateway=args.ipv6_gateway,
+            logger=logger,
+            reactor=ReactorBackend(args.reactor),
+        )
+        listen_with_workers(proxy_factory, owner, Address(args.host, args.port), args.workers)
+
+    else:
+        proxy_factory().listen(Address(args.host, args.port))
@@ -1,3 +1,11 @@
+from ._batch import (
+    MMSG_SUPPORTED,
+    DatagramReceiver,
+    DatagramSender,
+    MMsgDatagramReceiver,
+    MMsgDatagramSender,
+)
+from ._stream import StreamConnection
 from ._types import (
     Address,
     Datagram,
@@ -6,18 +14,30 @@ from ._types import (
     IPBinary,
     Network,
     NetworkSize,
+    StreamAddress,
+    TCPSocket,
     UDPSocket,
     RT_CLASS_MAIN,
 )
+from ._utils import SubnetAggregator
 
 __all__ = [
     "Address",
     "Datagram",
+    "DatagramReceiver",
+    "DatagramSender",
     "ExpiringAddress",
     "IPAddress",
     "IPBinary",
+    "MMSG_SUPPORTED",
+    "MMsgDatagramReceiver",
+    "MMsgDatagramSender",
     "Network",
     "NetworkSize",
+    "StreamAddress",
+    "StreamConnection",
+    "SubnetAggregator",
+    "TCPSocket",
     "UDPSocket",
     "RT_CLASS_MAIN",
 ]
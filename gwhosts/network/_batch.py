@@ -0,0 +1,208 @@
+import ctypes
+from errno import EAGAIN, EINTR, EWOULDBLOCK
+from functools import lru_cache
+from os import strerror
+from socket import AF_INET, MSG_DONTWAIT, htons, inet_aton, inet_ntop, ntohs, socket
+from typing import Iterable, List
+
+from ._types import Address, Datagram
+
+_libc = ctypes.CDLL(None, use_errno=True)
+
+# recvmmsg(2) and sendmmsg(2) are available since Linux 2.6.33/3.0 and glibc 2.12/2.14
+MMSG_SUPPORTED: bool = hasattr(_libc, "recvmmsg") and hasattr(_libc, "sendmmsg")
+
+
+class _IOVec(ctypes.Structure):
+    _fields_ = [
+        ("iov_base", ctypes.c_void_p),
+        ("iov_len", ctypes.c_size_t),
+    ]
+
+
+class _SockAddrIn(ctypes.Structure):
+    _fields_ = [
+        ("sin_family", ctypes.c_ushort),
+        ("sin_port", ctypes.c_uint16),
+        ("sin_addr", ctypes.c_uint8 * 4),
+        ("sin_zero", ctypes.c_uint8 * 8),
+    ]
+
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_IOVec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_hdr", _MsgHdr),
+        ("msg_len", ctypes.c_uint),
+    ]
+
+
+_SOCKADDR_IN_SIZE: int = ctypes.sizeof(_SockAddrIn)
+
+
+def _raise_errno() -> None:
+    errno = ctypes.get_errno()
+    raise OSError(errno, strerror(errno))
+
+
+@lru_cache(maxsize=4096)
+def _sockaddr_in(addr: Address) -> _SockAddrIn:
+    sockaddr = _SockAddrIn()
+    sockaddr.sin_family = AF_INET
+    sockaddr.sin_port = htons(addr.port)
+    ctypes.memmove(sockaddr.sin_addr, inet_aton(addr.host), 4)
+
+    return sockaddr
+
+
+class DatagramReceiver:
+    """Drains a socket with recvfrom_into(2) into a preallocated buffer
+
+    :param buff_size: Maximum size of a datagram
+    :param batch_size: Maximum number of datagrams read from a socket at once
+    """
+
+    def __init__(self, buff_size: int = 1024, batch_size: int = 64) -> None:
+        self._buff_size = buff_size
+        self._batch_size = batch_size
+        self._buffer = memoryview(bytearray(buff_size))
+
+    @property
+    def buff_size(self) -> int:
+        return self._buff_size
+
+    def receive(self, _socket: socket) -> List[Datagram]:
+        """:return: Datagrams that are ready, up to the batch size"""
+        datagrams: List[Datagram] = []
+        buffer = self._buffer
+
+        for _ in range(self._batch_size):
+            try:
+                length, addr = _socket.recvfrom_into(buffer, 0, MSG_DONTWAIT)
+
+            except BlockingIOError:
+                break
+
+            datagrams.append(Datagram(bytes(buffer[:length]), Address(*addr[:2])))
+
+        return datagrams
+
+
+class MMsgDatagramReceiver(DatagramReceiver):
+    """Drains an IPv4 socket with a single recvmmsg(2) call into preallocated buffers, other sockets are drained
+    with recvfrom_into(2)
+    """
+
+    def __init__(self, buff_size: int = 1024, batch_size: int = 64) -> None:
+        super().__init__(buff_size, batch_size)
+        self._buffers = [bytearray(buff_size) for _ in range(batch_size)]
+        self._views = [memoryview(_buffer) for _buffer in self._buffers]
+        self._iovecs = (_IOVec * batch_size)()
+        self._names = (_SockAddrIn * batch_size)()
+        self._messages = (_MMsgHdr * batch_size)()
+
+        for idx, _buffer in enumerate(self._buffers):
+            self._iovecs[idx].iov_base = ctypes.addressof((ctypes.c_char * buff_size).from_buffer(_buffer))
+            self._iovecs[idx].iov_len = buff_size
+            self._messages[idx].msg_hdr.msg_name = ctypes.addressof(self._names[idx])
+            self._messages[idx].msg_hdr.msg_iov = ctypes.pointer(self._iovecs[idx])
+            self._messages[idx].msg_hdr.msg_iovlen = 1
+
+    def receive(self, _socket: socket) -> List[Datagram]:
+        if _socket.family != AF_INET:
+            return super().receive(_socket)
+
+        messages, names = self._messages, self._names
+
+        for idx in range(self._batch_size):
+            messages[idx].msg_hdr.msg_namelen = _SOCKADDR_IN_SIZE
+
+        count = _libc.recvmmsg(_socket.fileno(), messages, self._batch_size, MSG_DONTWAIT, None)
+
+        if count < 0:
+            if ctypes.get_errno() in (EAGAIN, EWOULDBLOCK, EINTR):
+                return []
+
+            _raise_errno()
+
+        return [
+            Datagram(
+                bytes(self._views[idx][: messages[idx].msg_len]),
+                Address(inet_ntop(AF_INET, bytes(names[idx].sin_addr)), ntohs(names[idx].sin_port)),
+            )
+            for idx in range(count)
+        ]
+
+
+class DatagramSender:
+    """Sends datagrams with a sendto(2) call per datagram
+
+    :param batch_size: Maximum number of datagrams sent at once
+    """
+
+    def __init__(self, batch_size: int = 64) -> None:
+        self._batch_size = batch_size
+
+    def send(self, _socket: socket, datagrams: Iterable[Datagram]) -> None:
+        for data, addr in datagrams:
+            _socket.sendto(data, addr)
+
+
+class MMsgDatagramSender(DatagramSender):
+    """Sends datagrams from an IPv4 socket with a sendmmsg(2) call per batch"""
+
+    def __init__(self, batch_size: int = 64) -> None:
+        super().__init__(batch_size)
+        self._iovecs = (_IOVec * batch_size)()
+        self._messages = (_MMsgHdr * batch_size)()
+
+        for idx in range(batch_size):
+            self._messages[idx].msg_hdr.msg_namelen = _SOCKADDR_IN_SIZE
+            self._messages[idx].msg_hdr.msg_iov = ctypes.pointer(self._iovecs[idx])
+            self._messages[idx].msg_hdr.msg_iovlen = 1
+
+    def _send_batch(self, _socket: socket, batch: List[Datagram]) -> None:
+        messages, iovecs = self._messages, self._iovecs
+        names = [_sockaddr_in(addr) for data, addr in batch]
+
+        for idx, (data, addr) in enumerate(batch):
+            iovecs[idx].iov_base = ctypes.cast(data, ctypes.c_void_p)
+            iovecs[idx].iov_len = len(data)
+            messages[idx].msg_hdr.msg_name = ctypes.addressof(names[idx])
+
+        sent = 0
+
+        while sent < len(batch):
+            count = _libc.sendmmsg(_socket.fileno(), ctypes.byref(messages[sent]), len(batch) - sent, 0)
+
+            if count < 0:
+                if ctypes.get_errno() == EINTR:
+                    continue
+
+                _raise_errno()
+
+            sent += count
+
+    def send(self, _socket: socket, datagrams: Iterable[Datagram]) -> None:
+        batch: List[Datagram] = []
+
+        for datagram in datagrams:
+            batch.append(datagram)
+
+            if len(batch) == self._batch_size:
+                self._send_batch(_socket, batch)
+                batch = []
+
+        if batch:
+            self._send_batch(_socket, batch)
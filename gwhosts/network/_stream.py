@@ -0,0 +1,139 @@
+from errno import EINPROGRESS
+from os import strerror
+from socket import SOL_SOCKET, SO_ERROR, socket
+from struct import Struct
+from typing import List
+
+from ._types import Address, StreamAddress
+
+# Two-octet length prefix of the messages sent over TCP [https://www.iana.org/go/rfc1035]
+_LENGTH = Struct("!H")
+# Output a peer may leave unread, a few of the largest messages
+_MAX_OUTPUT_SIZE: int = 4 << 16
+
+
+class StreamConnection:
+    """Non-blocking TCP connection carrying length-prefixed DNS messages
+
+    Incoming bytes are read into a caller's buffer and accumulated until whole messages are received.
+    Outgoing messages are written right away, whatever the socket does not take waits for it to become writable.
+    While the connection is being established, the output waits for it. A peer that leaves too much output unread
+    is disconnected. The connection is active only while bytes are read or written.
+
+    :param _socket: Connected socket, or the one to be connected by connect
+    :param peer: Address of the peer
+    :param now: Time when the connection was established
+    """
+
+    def __init__(self, _socket: socket, peer: StreamAddress, now: float) -> None:
+        _socket.setblocking(False)
+        self.socket = _socket
+        self.peer = peer
+        self.last_active = now
+        # Readiness notifications the engine is subscribed to
+        self.watched: bool = False
+        self.writes_watched: bool = False
+        self.connecting: bool = False
+        self._input = bytearray()
+        self._output = bytearray()
+
+    def fileno(self) -> int:
+        return self.socket.fileno()
+
+    @property
+    def backlog(self) -> bool:
+        """:return: There is output waiting for the socket to become writable, or the socket is being connected"""
+        return self.connecting or bool(self._output)
+
+    def connect(self, addr: Address) -> None:
+        """Start connecting to the peer without blocking, the connect completes once the socket is writable
+
+        :raises OSError: The peer is not reachable
+        """
+        error = self.socket.connect_ex(addr)
+
+        if error not in (0, EINPROGRESS):
+            raise OSError(error, strerror(error))
+
+        self.connecting = error == EINPROGRESS
+
+    def receive(self, buffer: memoryview, now: float) -> List[bytes]:
+        """Read what is available
+
+        :param buffer: Reusable buffer the bytes are read into
+        :return: Messages received in full
+        :raises ConnectionError: The peer closed the connection
+        """
+        try:
+            length = self.socket.recv_into(buffer)
+
+        except BlockingIOError:
+            return []
+
+        if not length:
+            raise ConnectionResetError("The connection is closed by the peer")
+
+        self.last_active = now
+        data = self._input
+        data += buffer[:length]
+        messages: List[bytes] = []
+        offset = 0
+
+        while len(data) - offset >= _LENGTH.size:
+            end = offset + _LENGTH.size + _LENGTH.unpack_from(data, offset)[0]
+
+            if end > len(data):
+                break
+
+            messages.append(bytes(data[offset + _LENGTH.size : end]))
+            offset = end
+
+        del data[:offset]
+
+        return messages
+
+    def send(self, message: bytes, now: float) -> None:
+        """Queue the message and write as much as the socket takes
+
+        :raises ConnectionError: The output the peer left unread exceeds the limit
+        """
+        if len(self._output) + _LENGTH.size + len(message) > _MAX_OUTPUT_SIZE:
+            raise ConnectionAbortedError("The peer does not read the output")
+
+        self._output += _LENGTH.pack(len(message))
+        self._output += message
+
+        if not self.connecting:
+            self.flush(now)
+
+    def flush(self, now: float) -> None:
+        """Complete the connect and write the queued output until the socket buffer is full
+
+        Called once the socket is ready, a socket that is being connected becomes ready when the connect completes.
+
+        :raises OSError: The connect failed
+        """
+        if self.connecting:
+            error = self.socket.getsockopt(SOL_SOCKET, SO_ERROR)
+
+            if error:
+                raise OSError(error, strerror(error))
+
+            self.connecting = False
+
+        if not self._output:
+            return
+
+        try:
+            sent = self.socket.send(self._output)
+
+        except BlockingIOError:
+            return
+
+        if sent:
+            self.last_active = now
+
+        del self._output[:sent]
+
+    def close(self) -> None:
+        self.socket.close()
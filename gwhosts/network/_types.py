@@ -1,4 +1,4 @@
-from socket import AF_INET, SOCK_DGRAM, socket
+from socket import AF_INET, SOCK_DGRAM, SOCK_STREAM, socket
 from typing import NamedTuple
 
 RouteClass = int
@@ -17,6 +17,12 @@ class Address(NamedTuple):
     port: Port
 
 
+class StreamAddress(Address):
+    """Address of a TCP peer, messages to it are sent over its connection"""
+
+    __slots__ = ()
+
+
 class ExpiringAddress(NamedTuple):
     address: Address
     time: float
@@ -33,5 +39,10 @@ class Network(NamedTuple):
 
 
 class UDPSocket(socket):
-    def __init__(self, *args, **kwargs) -> None:
-        super().__init__(AF_INET, SOCK_DGRAM, *args, **kwargs)
+    def __init__(self, family: int = AF_INET, *args, **kwargs) -> None:
+        super().__init__(family, SOCK_DGRAM, *args, **kwargs)
+
+
+class TCPSocket(socket):
+    def __init__(self, family: int = AF_INET, *args, **kwargs) -> None:
+        super().__init__(family, SOCK_STREAM, *args, **kwargs)
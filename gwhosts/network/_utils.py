@@ -1,6 +1,6 @@
-from typing import Iterable, Iterator
+from typing import Dict, Iterable, Iterator, List, Set
 
-from ._types import Network, NetworkSize
+from ._types import IPBinary, Network, NetworkSize
 
 
 def _reduce_subnets(addresses: Iterable[Network], netmask_min: NetworkSize) -> Iterator[Network]:
@@ -38,3 +38,105 @@ def _reduce_subnets(addresses: Iterable[Network], netmask_min: NetworkSize) -> I
             address=netaddr,
             mask=netmask,
         )
+
+
+class SubnetAggregator:
+    """Routed subnets aggregated one branch at a time
+
+    _reduce_subnets never aggregates beyond the branch one 8-bit step narrower than the minimal netmask
+    (/16 for IPv4, /40 for IPv6), so the subnets are indexed by their branch and an update re-reduces
+    only the branches the new addresses fall into instead of all the subnets.
+
+    Membership of an address is looked up by probing the subnets with each netmask in use,
+    from the longest to the shortest one.
+
+    :param netmask_min: Netmask the aggregates must be narrower than
+    """
+
+    def __init__(self, netmask_min: IPBinary) -> None:
+        self._netmask_min = netmask_min
+        self._branch_mask = netmask_min | netmask_min >> 8
+        self._branches: Dict[IPBinary, Set[Network]] = {}
+        # Number of subnets per netmask and the netmasks from the longest to the shortest one
+        self._netmasks: Dict[IPBinary, int] = {}
+        self._probes: List[IPBinary] = []
+        self._hits: int = 0
+        self._misses: int = 0
+        self.subnets: Set[Network] = set()
+
+    def __len__(self) -> int:
+        return len(self.subnets)
+
+    def __iter__(self) -> Iterator[Network]:
+        return iter(self.subnets)
+
+    def __contains__(self, network: object) -> bool:
+        return network in self.subnets
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        return {"subnets": len(self.subnets), "lookup_hits": self._hits, "lookup_misses": self._misses}
+
+    def covers(self, address: IPBinary) -> bool:
+        """:return: The address is within one of the subnets"""
+        subnets = self.subnets
+
+        for netmask in self._probes:
+            # Network compares and hashes as a plain tuple
+            if (address & netmask, netmask) in subnets:
+                self._hits += 1
+                return True
+
+        self._misses += 1
+
+        return False
+
+    def add(self, subnet: Network) -> None:
+        """Account a subnet that is routed"""
+        if subnet in self.subnets:
+            return
+
+        self.subnets.add(subnet)
+        self._branches.setdefault(subnet.address & self._branch_mask, set()).add(subnet)
+        self._netmasks[subnet.mask] = self._netmasks.get(subnet.mask, 0) + 1
+
+        if self._netmasks[subnet.mask] == 1:
+            self._probes = sorted(self._netmasks, reverse=True)
+
+    def remove(self, subnet: Network) -> None:
+        """Forget a subnet that is not routed anymore
+
+        :raises KeyError: The subnet is not routed
+        """
+        self.subnets.remove(subnet)
+        key = subnet.address & self._branch_mask
+        branch = self._branches[key]
+        branch.remove(subnet)
+
+        if not branch:
+            del self._branches[key]
+
+        self._netmasks[subnet.mask] -= 1
+
+        if not self._netmasks[subnet.mask]:
+            del self._netmasks[subnet.mask]
+            self._probes = sorted(self._netmasks, reverse=True)
+
+    def update(self, addresses: Iterable[Network]) -> Dict[Network, bool]:
+        """Aggregate the addresses with the routed subnets, the routed subnets stay intact until they are added
+
+        :return: Subnets to route (True) and to stop routing (False)
+        """
+        branches: Dict[IPBinary, Set[Network]] = {}
+
+        for address in addresses:
+            branches.setdefault(address.address & self._branch_mask, set()).add(address)
+
+        updates: Dict[Network, bool] = {}
+
+        for key, branch in branches.items():
+            routed = self._branches.get(key, set())
+            subnets = set(_reduce_subnets(branch.union(routed), self._netmask_min))
+            updates.update((_subnet, _subnet in subnets) for _subnet in routed.symmetric_difference(subnets))
+
+        return updates
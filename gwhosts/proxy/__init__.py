@@ -1,4 +1,7 @@
+from ._asyncio import AsyncDNSProxy
 from ._proxy import DNSProxy
+from ._reactor import Reactor, ReactorBackend
 from ._types import RTMEvent
+from ._workers import RouteOwner, listen_with_workers
 
-__all__ = ["DNSProxy", "RTMEvent"]
+__all__ = ["AsyncDNSProxy", "DNSProxy", "Reactor", "ReactorBackend", "RouteOwner", "RTMEvent", "listen_with_workers"]
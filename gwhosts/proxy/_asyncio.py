@@ -0,0 +1,291 @@
+import asyncio
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+
+from ._base import BaseDNSProxy
+from ._types import RoutedResponse
+from ..network import Address, Datagram, StreamAddress, StreamConnection, TCPSocket, UDPSocket
+from ..routes import Netlink
+
+try:
+    import uvloop
+except ImportError:  # pragma: no cover
+    uvloop = None
+
+
+class _ListenerProtocol(asyncio.DatagramProtocol):
+    def __init__(self, proxy: "AsyncDNSProxy") -> None:
+        self._proxy = proxy
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+        self._proxy._on_query(Datagram(data, Address(*addr[:2])))
+
+
+class _UpstreamProtocol(asyncio.DatagramProtocol):
+    def __init__(self, proxy: "AsyncDNSProxy", _socket: UDPSocket) -> None:
+        self._proxy = proxy
+        self._socket = _socket
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+        self._proxy._on_response(self._socket, data, Address(*addr[:2]))
+
+
+class AsyncDNSProxy(BaseDNSProxy):
+    """Proxy engine built on asyncio transports
+
+    The listening socket, the upstream sockets and the netlink socket are served by an asyncio event loop,
+    so timers and other tasks can run alongside DNS forwarding.
+
+    :param use_uvloop: Run the proxy on the uvloop event loop (requires uvloop)
+    """
+
+    def __init__(self, *args, use_uvloop: bool = False, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+
+        if use_uvloop and uvloop is None:
+            raise ImportError("uvloop is not installed")
+
+        self._use_uvloop = use_uvloop
+        self._listener: Optional[asyncio.DatagramTransport] = None
+        self._netlink_socket: Optional[Netlink] = None
+        self._retransmit_handle: Optional[asyncio.TimerHandle] = None
+        self._connects: Dict[StreamConnection, asyncio.Task] = {}
+
+    def _schedule_retransmit(self) -> None:
+        if self._retransmit_handle is not None:
+            return
+
+        timeout = self._retransmit_timeout()
+
+        if timeout is not None:
+            self._retransmit_handle = asyncio.get_running_loop().call_later(timeout, self._on_retransmit)
+
+    def _on_retransmit(self) -> None:
+        self._retransmit_handle = None
+
+        try:
+            self._tick()
+            self._upstream.retransmit(self._now)
+            self._schedule_retransmit()
+
+        except Exception as e:
+            self._logger.exception(e)
+
+    def _send(self, data: bytes, addr: Address) -> None:
+        if isinstance(addr, StreamAddress):
+            self._send_stream(Datagram(data, addr))
+        else:
+            self._listener.sendto(data, addr)
+
+    def _connect_stream(self, connection: StreamConnection, addr: Address) -> None:
+        """The connect is left to the event loop, it watches the socket until the connect completes"""
+        loop = asyncio.get_running_loop()
+        task = loop.create_task(loop.sock_connect(connection.socket, addr))
+        task.add_done_callback(partial(self._on_connect, connection))
+        connection.connecting = True
+        self._connects[connection] = task
+
+    def _register_stream(self, connection: StreamConnection) -> None:
+        asyncio.get_running_loop().add_reader(connection.fileno(), self._on_stream, connection)
+
+    def _unregister_stream(self, connection: StreamConnection) -> None:
+        loop = asyncio.get_running_loop()
+        loop.remove_reader(connection.fileno())
+        loop.remove_writer(connection.fileno())
+        task = self._connects.pop(connection, None)
+
+        if task is not None:
+            task.cancel()
+
+    def _watch_writes(self, connection: StreamConnection) -> None:
+        loop = asyncio.get_running_loop()
+
+        if connection.connecting:
+            # The socket is watched by sock_connect until the connect completes
+            return
+
+        if connection.writes_watched:
+            loop.add_writer(connection.fileno(), self._on_stream, connection)
+        else:
+            loop.remove_writer(connection.fileno())
+
+    def _on_connect(self, connection: StreamConnection, task: asyncio.Task) -> None:
+        if task.cancelled() or self._connects.pop(connection, None) is not task:
+            return
+
+        if task.exception() is not None:
+            self._tcp_upstream.abort(connection)
+            return
+
+        connection.connecting = False
+        # Writes are watched again from scratch, sock_connect has removed its writer
+        connection.writes_watched = False
+        self._on_stream(connection)
+
+    def _on_accept(self, listener: TCPSocket) -> None:
+        try:
+            self._tick()
+            self._accept_streams(listener)
+
+        except Exception as e:
+            self._logger.exception(e)
+
+    def _on_stream(self, connection: StreamConnection) -> None:
+        """Flush and read the TCP connection, it is either a client's or an upstream one"""
+        try:
+            self._tick()
+
+            if connection not in self._tcp_upstream:
+                for _datagram in self._read_stream(connection):
+                    self._on_query(_datagram)
+
+                return
+
+            regular: List[Datagram] = []
+            routed: List[RoutedResponse] = []
+            followers = self._read_tcp_upstream(connection, regular, routed)
+
+            for _data, _addr in (*self._process_responses(self._netlink_socket, regular, routed), *followers):
+                self._send(_data, _addr)
+
+        except Exception as e:
+            self._logger.exception(e)
+
+    def _on_query(self, datagram: Datagram) -> None:
+        try:
+            self._tick()
+            response = self._route_request(datagram)
+
+            if response is not None:
+                self._send(*response)
+            else:
+                self._schedule_retransmit()
+
+        except OverflowError:
+            self._logger.warning("DNS: no upstream capacity left, the query is dropped")
+
+        except Exception as e:
+            self._logger.exception(e)
+
+    def _on_response(self, _socket: UDPSocket, data: bytes, addr: Address) -> None:
+        try:
+            self._tick()
+            matched = self._upstream.match(_socket, data, addr, self._now)
+
+            if matched is None:
+                return
+
+            regular: List[Datagram] = []
+            routed: List[RoutedResponse] = []
+            followers = self._accept_response(*matched, regular, routed)
+
+            for _data, _addr in (*self._process_responses(self._netlink_socket, regular, routed), *followers):
+                self._send(_data, _addr)
+
+        except Exception as e:
+            self._logger.exception(e)
+
+    def _on_netlink(self) -> None:
+        try:
+            for _message in self._netlink_socket.get():
+                self._process_netlink_message(self._netlink_socket, _message)
+
+        except Exception as e:
+            self._logger.exception(e)
+
+    async def _expire_periodically(self) -> None:
+        while True:
+            self._tick()
+            timeout = self._expiry_timeout()
+            await asyncio.sleep(self._timeout_in_seconds if timeout is None else timeout)
+            self._tick()
+            self._expire_queries()
+
+    async def _log_stats_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self._stats_interval)
+            self._tick()
+            self._log_stats()
+
+    async def _answer_stale_periodically(self) -> None:
+        while True:
+            self._tick()
+            timeout = self._stale_timeout()
+            await asyncio.sleep(self._serve_stale_after if timeout is None else timeout)
+            self._tick()
+
+            for _data, _addr in self._answer_stale():
+                self._send(_data, _addr)
+
+    async def _prefetch_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self._prefetcher.interval)
+            self._tick()
+            self._prefetch()
+            self._schedule_retransmit()
+
+    async def serve(self, addr: Address) -> None:
+        loop = asyncio.get_running_loop()
+        transports: List[asyncio.BaseTransport] = []
+        tasks: List[asyncio.Task] = []
+
+        with self._netlink() as netlink, self._budget.reserve(), self._upstream as upstream:
+            with self._tcp_listener(addr) as tcp:
+                self._netlink_socket = netlink
+
+                if netlink is not None:
+                    loop.add_reader(netlink.fileno(), self._on_netlink)
+
+                if tcp is not None:
+                    loop.add_reader(tcp.fileno(), self._on_accept, tcp)
+
+                try:
+                    for _socket in upstream:
+                        transport, _ = await loop.create_datagram_endpoint(
+                            partial(_UpstreamProtocol, self, _socket),
+                            sock=_socket,
+                        )
+                        transports.append(transport)
+
+                    self._listener, _ = await loop.create_datagram_endpoint(
+                        partial(_ListenerProtocol, self),
+                        local_addr=addr,
+                        reuse_port=self._reuse_port,
+                    )
+                    transports.append(self._listener)
+
+                    self._logger.info(f"DNS: proxy is listening at {addr.host}:{addr.port}")
+
+                    if self._stats_interval is not None:
+                        tasks.append(loop.create_task(self._log_stats_periodically()))
+
+                    if self._prefetcher.enabled:
+                        tasks.append(loop.create_task(self._prefetch_periodically()))
+
+                    if self._serve_stale_after is not None:
+                        tasks.append(loop.create_task(self._answer_stale_periodically()))
+
+                    await self._expire_periodically()
+
+                finally:
+                    if netlink is not None:
+                        loop.remove_reader(netlink.fileno())
+
+                    if tcp is not None:
+                        loop.remove_reader(tcp.fileno())
+
+                    for task in tasks:
+                        task.cancel()
+
+                    if self._retransmit_handle is not None:
+                        self._retransmit_handle.cancel()
+                        self._retransmit_handle = None
+
+                    for transport in transports:
+                        transport.close()
+
+    def listen(self, addr: Address) -> None:
+        if self._use_uvloop:
+            uvloop.run(self.serve(addr))
+        else:
+            asyncio.run(self.serve(addr))
@@ -0,0 +1,643 @@
+from abc import ABC, abstractmethod
+from base64 import b64encode
+from contextlib import contextmanager
+from multiprocessing.connection import Connection
+from heapq import heappop, heappush
+from itertools import count
+from struct import pack, unpack_from
+from logging import INFO, Logger
+from socket import SOL_SOCKET, SO_REUSEADDR, SO_REUSEPORT
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Sequence, Set, Tuple, Optional, Union
+
+from ._budget import FDBudget
+from ._cache import ResponseCache
+from ._clock import monotonic_coarse
+from ._prefetch import Prefetcher
+from ._resolvers import ResolverPool
+from ._router import BaseRouter
+from ._tcp import TCPUpstream
+from ._types import AnswerAddresses, InFlightQuery, RoutedResponse
+from ._upstream import RetryBudget, UpstreamChannel
+from ..dns import (
+    MIN_UDP_PAYLOAD_SIZE,
+    QName,
+    DNSParserError,
+    Flags,
+    RCode,
+    RRType,
+    DNSDataView,
+    answer_addresses,
+    qname_to_str,
+    answer_to_str,
+    key_query,
+    question_key,
+    standard_question,
+    limit_udp_payload_size,
+    truncate,
+    udp_payload_size,
+)
+from ..hosts import BaseHostnames, HostnameTrie
+from ..network import (
+    Address,
+    Datagram,
+    IPAddress,
+    Network,
+    StreamAddress,
+    StreamConnection,
+    TCPSocket,
+)
+from ..network.ipv4 import IPV4_NETMASK_MAX
+from ..network.ipv6 import IPV6_NETMASK_MAX
+from ..routes import Netlink
+
+# Largest DNS message, a TCP client can receive any response in full
+_MAX_MESSAGE_SIZE: int = 65535
+_TCP_BACKLOG: int = 128
+# Types of the questions whose answers carry addresses to route
+_ROUTED_TYPES: FrozenSet[int] = frozenset((RRType.A.value, RRType.AAAA.value, RRType.HTTPS.value))
+
+
+class BaseDNSProxy(BaseRouter, ABC):
+    """Routing logic shared by the proxy engines"""
+
+    def __init__(
+        self,
+        hostnames: Union[BaseHostnames, Iterable[QName]],
+        logger: Logger,
+        ipv4_ifname: Optional[str] = None,
+        ipv4_gateway: Optional[IPAddress] = None,
+        ipv6_ifname: Optional[str] = None,
+        ipv6_gateway: Optional[IPAddress] = None,
+        to_addr: Address = Address("127.0.0.1", 8053),
+        to_addrs: Optional[Sequence[Address]] = None,
+        buff_size: int = 4096,
+        timeout_in_seconds: int = 5,
+        upstream_sockets: int = 4,
+        reuse_port: bool = False,
+        route_pipe: Optional[Connection] = None,
+        stats_interval: Optional[int] = None,
+        cache_size: int = 16 << 20,
+        negative_cache_size: int = 1 << 20,
+        prefetch_top: int = 0,
+        prefetch_qps: float = 10.0,
+        retry_ratio: float = 0.0,
+        serve_stale_after: Optional[float] = None,
+        tcp: bool = False,
+        tcp_idle_timeout: float = 10.0,
+    ) -> None:
+        super().__init__(
+            logger=logger,
+            ipv4_ifname=ipv4_ifname,
+            ipv4_gateway=ipv4_gateway,
+            ipv6_ifname=ipv6_ifname,
+            ipv6_gateway=ipv6_gateway,
+        )
+        self._timeout_in_seconds = timeout_in_seconds
+        self._now: float = monotonic_coarse()
+        self._hostnames = hostnames if isinstance(hostnames, BaseHostnames) else HostnameTrie(hostnames)
+        self._buff_size = buff_size
+        self._budget = FDBudget()
+        resolvers = ResolverPool([to_addr] if to_addrs is None else to_addrs)
+        self._tcp = tcp
+        self._tcp_idle_timeout = tcp_idle_timeout
+        self._tcp_clients: Dict[StreamAddress, StreamConnection] = {}
+        self._tcp_upstream: Optional[TCPUpstream] = None
+        self._stream_buffer = memoryview(bytearray(_MAX_MESSAGE_SIZE + 2 if tcp else 0))
+
+        if tcp:
+            self._tcp_upstream = TCPUpstream(
+                resolvers,
+                watch=self._watch_stream,
+                unwatch=self._unregister_stream,
+                connect=self._connect_stream,
+                idle_timeout=tcp_idle_timeout,
+                budget=self._budget,
+            )
+
+        self._upstream = UpstreamChannel(
+            resolvers,
+            sockets_count=upstream_sockets,
+            budget=self._budget,
+            retry_budget=RetryBudget(retry_ratio) if retry_ratio > 0 else None,
+            tcp=self._tcp_upstream,
+        )
+        self._reuse_port = reuse_port
+        self._route_pipe = route_pipe
+        self._stats_interval = stats_interval
+        self._cache = ResponseCache(cache_size, negative_cache_size)
+        self._prefetcher = Prefetcher(prefetch_top, prefetch_qps)
+        self._prefetch_time: float = self._now
+        self._stats_time: float = self._now
+        self._serve_stale_after = serve_stale_after
+        self._stale_answers: List[Tuple[float, int, InFlightQuery]] = []
+        self._sequence = count()
+
+    def _hostname_exists(self, hostname: QName) -> bool:
+        return hostname in self._hostnames
+
+    def _routed_addresses(self, queue: Iterable[AnswerAddresses]) -> Tuple[Set[Network], Set[Network]]:
+        """:return: IPv4 and IPv6 addresses from the answers that are not routed yet"""
+        ipv4_addresses = set()
+        ipv6_addresses = set()
+
+        for ipv4, ipv6 in queue:
+            for address in ipv4:
+                if not self._ipv4_in_subnets(address):
+                    ipv4_addresses.add(Network(address, IPV4_NETMASK_MAX))
+
+            for address in ipv6:
+                if not self._ipv6_in_subnets(address):
+                    ipv6_addresses.add(Network(address, IPV6_NETMASK_MAX))
+
+        return ipv4_addresses, ipv6_addresses
+
+    def _update_routes(self, queue: Iterable[AnswerAddresses]) -> Tuple[Dict[Network, bool], Dict[Network, bool]]:
+        return self._update_subnets(*self._routed_addresses(queue))
+
+    def _log_how_to_reproduce(self, data: bytes) -> None:
+        b64data = b64encode(data).decode("utf8")
+        self._logger.error("To reproduce, run:")
+        self._logger.error(f"echo -n '{b64data}' | python -m base64 -d | python -m gwhosts.dns.parser")
+
+    @staticmethod
+    def _fit(response: bytes, query: bytes, addr: Address) -> bytes:
+        """:return: The response truncated to the UDP payload size advertised in the query"""
+        if len(response) <= MIN_UDP_PAYLOAD_SIZE or isinstance(addr, StreamAddress):
+            return response
+
+        return truncate(response, udp_payload_size(query))
+
+    def _route_request(self, datagram: Datagram) -> Optional[Datagram]:
+        """Forward the query to the upstream resolver
+
+        :return: Cached response, None if the query was forwarded or dropped
+        """
+        data, addr = datagram
+        key = question_key(data)
+
+        if key is not None:
+            cached = self._cache.get(key, data[:2], self._now)
+
+            if cached is not None:
+                self._prefetcher.hit(key)
+                return Datagram(self._fit(cached, data, addr), addr)
+
+            if self._upstream.overdue(key):
+                stale = self._cache.stale(key, data[:2], self._now)
+
+                if stale is not None:
+                    return Datagram(self._fit(stale, data, addr), addr)
+
+        question = standard_question(data)
+
+        if question is not None:
+            questions = [question]
+
+        else:
+            try:
+                questions = DNSDataView(data).questions
+
+            except DNSParserError:
+                self._logger.error("Failed to parse DNS query")
+                self._log_how_to_reproduce(data)
+
+                return None
+
+        query_id = unpack_from("!H", data)[0]
+        domains = [_question.name for _question in questions]
+        routed = any(
+            _question.rr_type in _ROUTED_TYPES and self._hostname_exists(_question.name) for _question in questions
+        )
+        payload_size = _MAX_MESSAGE_SIZE if isinstance(addr, StreamAddress) else udp_payload_size(data)
+
+        if payload_size > self._buff_size:
+            # The upstream must not send more than the receive buffer holds, it sets the TC flag instead
+            data = limit_udp_payload_size(data, self._buff_size)
+
+        in_flight = InFlightQuery(query_id, addr, self._now, routed, key, payload_size)
+        self._upstream.send(data, in_flight)
+
+        if self._serve_stale_after is not None and key is not None:
+            heappush(self._stale_answers, (self._now + self._serve_stale_after, next(self._sequence), in_flight))
+
+        if routed and key is not None:
+            self._prefetcher.track(key)
+
+        if routed:
+            for hostname in domains:
+                self._logger.info(f"DNS: Q[{query_id}] <- {qname_to_str(hostname)} (P)")
+
+        else:
+            for hostname in domains:
+                self._logger.info(f"DNS: Q[{query_id}] <- {qname_to_str(hostname)}")
+
+        return None
+
+    def _stale_responses(self, responses: List[Datagram], query: InFlightQuery) -> List[Datagram]:
+        """:return: Stale responses in place of the failed ones, the failed ones if there is nothing stale"""
+        stale_responses: List[Datagram] = []
+
+        for idx, (data, addr) in enumerate(responses):
+            stale = self._cache.stale(query.key, data[:2], self._now)
+
+            if stale is None:
+                return responses
+
+            # Payload sizes of the followers are not known here, their stale responses fit any client
+            stale_responses.append(
+                Datagram(truncate(stale, MIN_UDP_PAYLOAD_SIZE if idx else query.payload_size), addr)
+            )
+
+        return stale_responses
+
+    def _accept_response(
+        self,
+        responses: List[Datagram],
+        query: InFlightQuery,
+        regular: List[Datagram],
+        routed: List[RoutedResponse],
+    ) -> List[Datagram]:
+        """Cache the upstream response and queue it as a routed one only if some of its addresses are not routed
+
+        :param responses: Responses to the forwarded query in full and to its followers
+        :return: Responses to the followers, ready to be sent
+        """
+        message = responses[0].data
+
+        if query.key is not None:
+            self._cache.put(query.key, message, self._now)
+
+        if self._serve_stale_after is not None and query.key is not None and query.address is not None:
+            if unpack_from("!H", message, 2)[0] & Flags.RCODE.value == RCode.SERVFAIL.value:
+                responses = self._stale_responses(responses, query)
+
+        (data, addr), *followers = responses
+
+        if query.address is None:
+            # Prefetched response, it only refreshes the cache and the routes
+            if self._has_unrouted_addresses(message):
+                routed.append(RoutedResponse(message, None))
+
+            return followers
+
+        response = Datagram(truncate(data, query.payload_size), addr)
+
+        if query.routed and self._has_unrouted_addresses(message):
+            routed.append(RoutedResponse(message, response))
+        else:
+            regular.append(response)
+
+        return followers
+
+    def _has_unrouted_addresses(self, data: bytes) -> bool:
+        """Check the addresses rather than the cached answers, a route deleted since is learned again
+
+        :return: Some of the answer addresses are not routed, a malformed response is left to be reported
+        """
+        try:
+            ipv4, ipv6 = answer_addresses(data)
+
+        except DNSParserError:
+            return True
+
+        return not all(map(self._ipv4_in_subnets, ipv4)) or not all(map(self._ipv6_in_subnets, ipv6))
+
+    def _log_answers(self, data: bytes, suffix: str = "") -> None:
+        """:raises DNSParserError: The response is malformed"""
+        response = DNSDataView(data)
+
+        for answer in response.answers:
+            self._logger.info(f"DNS: R[{response.header.id}] {answer_to_str(answer)}{suffix}")
+
+    def _parse_routed_responses(self, responses: List[RoutedResponse]) -> Iterator[AnswerAddresses]:
+        logging = self._logger.isEnabledFor(INFO)
+
+        for data, _ in responses:
+            try:
+                if logging:
+                    self._log_answers(data, " (P)")
+
+                addresses = AnswerAddresses(*answer_addresses(data))
+
+            except DNSParserError:
+                self._logger.error("Failed to parse DNS response")
+                self._log_how_to_reproduce(data)
+
+            else:
+                yield addresses
+
+    def _parse_regular_responses(self, responses: List[Datagram]) -> None:
+        """Log the answers, the responses are not parsed at all unless they are logged"""
+        if not self._logger.isEnabledFor(INFO):
+            return
+
+        for data, addr in responses:
+            try:
+                self._log_answers(data)
+
+            except DNSParserError:
+                self._logger.error("Failed to parse DNS response")
+                self._log_how_to_reproduce(data)
+
+    @contextmanager
+    def _netlink(self) -> Iterator[Optional[Netlink]]:
+        """:return: Netlink socket with the existing routes loaded, None when routes are owned by another process"""
+        if self._route_pipe is not None:
+            yield None
+            return
+
+        with self._budget.reserve(), Netlink() as netlink:
+            netlink.bind()
+            self._load_routes(netlink)
+
+            yield netlink
+
+    def _connect_stream(self, connection: StreamConnection, addr: Address) -> None:
+        """Start connecting the upstream connection, it is flushed once it becomes writable"""
+        connection.connect(addr)
+
+    @abstractmethod
+    def _register_stream(self, connection: StreamConnection) -> None:
+        """Start notifying when the connection is readable"""
+
+    @abstractmethod
+    def _unregister_stream(self, connection: StreamConnection) -> None:
+        """Stop notifying about the connection before it is closed"""
+
+    @abstractmethod
+    def _watch_writes(self, connection: StreamConnection) -> None:
+        """Start or stop notifying when the connection is writable, according to connection.writes_watched"""
+
+    def _watch_stream(self, connection: StreamConnection) -> None:
+        """Keep the readiness notifications in line with the connection state"""
+        if not connection.watched:
+            connection.watched = True
+            self._register_stream(connection)
+
+        if connection.backlog != connection.writes_watched:
+            connection.writes_watched = connection.backlog
+            self._watch_writes(connection)
+
+    @contextmanager
+    def _tcp_listener(self, addr: Address) -> Iterator[Optional[TCPSocket]]:
+        """Listen for TCP clients at the address, the client and upstream connections are closed on exit
+
+        :return: Listening socket, None if TCP is disabled
+        """
+        if not self._tcp:
+            yield None
+            return
+
+        with self._budget.reserve(), TCPSocket() as listener:
+            listener.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+
+            if self._reuse_port:
+                listener.setsockopt(SOL_SOCKET, SO_REUSEPORT, 1)
+
+            listener.bind(addr)
+            listener.listen(_TCP_BACKLOG)
+            listener.setblocking(False)
+
+            try:
+                yield listener
+
+            finally:
+                for _connection in list(self._tcp_clients.values()):
+                    self._close_stream(_connection)
+
+                self._tcp_upstream.close()
+
+    def _accept_streams(self, listener: TCPSocket) -> None:
+        while True:
+            try:
+                _socket, addr = listener.accept()
+
+            except BlockingIOError:
+                return
+
+            try:
+                self._budget.acquire()
+
+            except OverflowError:
+                _socket.close()
+                self._logger.warning("DNS: open files limit is reached, the TCP connection is dropped")
+                continue
+
+            connection = StreamConnection(_socket, StreamAddress(*addr), self._now)
+            self._tcp_clients[connection.peer] = connection
+            self._watch_stream(connection)
+
+    def _close_stream(self, connection: StreamConnection) -> None:
+        self._unregister_stream(connection)
+        connection.close()
+        self._budget.release()
+        del self._tcp_clients[connection.peer]
+
+    def _read_stream(self, connection: StreamConnection) -> List[Datagram]:
+        """:return: Queries received in full from the TCP client"""
+        try:
+            connection.flush(self._now)
+            messages = connection.receive(self._stream_buffer, self._now)
+
+        except OSError:
+            self._close_stream(connection)
+            return []
+
+        self._watch_stream(connection)
+
+        return [Datagram(_message, connection.peer) for _message in messages]
+
+    def _read_tcp_upstream(
+        self,
+        connection: StreamConnection,
+        regular: List[Datagram],
+        routed: List[RoutedResponse],
+    ) -> List[Datagram]:
+        """:return: Responses to the followers, ready to be sent"""
+        followers: List[Datagram] = []
+
+        for _matched in self._tcp_upstream.receive(connection, self._stream_buffer, self._now):
+            followers.extend(self._accept_response(*_matched, regular, routed))
+
+        return followers
+
+    def _send_stream(self, datagram: Datagram) -> None:
+        """Send the response to the TCP client if it is still connected"""
+        connection = self._tcp_clients.get(datagram.target)
+
+        if connection is None:
+            return
+
+        try:
+            connection.send(datagram.data, self._now)
+
+        except OSError:
+            self._close_stream(connection)
+            return
+
+        self._watch_stream(connection)
+
+    def _tick(self) -> None:
+        """Read the clock once for everything processed until the next tick"""
+        self._now = monotonic_coarse()
+
+    def _expiry_timeout(self) -> Optional[float]:
+        """:return: Seconds until the oldest in-flight query expires, None if there are no in-flight queries"""
+        oldest = self._upstream.oldest
+
+        if self._tcp_upstream is not None and self._tcp_upstream.oldest is not None:
+            oldest = self._tcp_upstream.oldest if oldest is None else min(oldest, self._tcp_upstream.oldest)
+
+        if oldest is None:
+            return None
+
+        return max(oldest + self._timeout_in_seconds - self._now, 0.0)
+
+    def _stats_timeout(self) -> Optional[float]:
+        """:return: Seconds until the stats are logged, None if periodic logging is disabled"""
+        if self._stats_interval is None:
+            return None
+
+        return max(self._stats_time + self._stats_interval - self._now, 0.0)
+
+    def _prefetch_timeout(self) -> Optional[float]:
+        """:return: Seconds until hot names are checked for prefetching, None if there is nothing to prefetch"""
+        if not self._prefetcher.enabled or not self._prefetcher:
+            return None
+
+        return max(self._prefetch_time + self._prefetcher.interval - self._now, 0.0)
+
+    def _retransmit_timeout(self) -> Optional[float]:
+        """:return: Seconds until the earliest retransmission, None if there is nothing to retransmit"""
+        next_retransmit = self._upstream.next_retransmit
+
+        if next_retransmit is None:
+            return None
+
+        return max(next_retransmit - self._now, 0.0)
+
+    def _stale_timeout(self) -> Optional[float]:
+        """:return: Seconds until the earliest query may be answered stale, None if there are no such queries"""
+        if not self._stale_answers:
+            return None
+
+        return max(self._stale_answers[0][0] - self._now, 0.0)
+
+    def _answer_stale(self) -> List[Datagram]:
+        """Answer the clients from expired cache entries when the upstream is slow to respond (RFC 8767)
+
+        The queries stay in flight and their responses refresh the cache and the routes.
+
+        :return: Stale responses, ready to be sent
+        """
+        stale_answers = self._stale_answers
+        ready: List[Datagram] = []
+
+        while stale_answers and stale_answers[0][0] <= self._now:
+            _, _, query = heappop(stale_answers)
+
+            if not self._cache.has_stale(query.key, self._now):
+                continue
+
+            for _query in self._upstream.detach(query):
+                stale = self._cache.stale(query.key, pack("!H", _query.id), self._now)
+                ready.append(Datagram(truncate(stale, _query.payload_size), _query.address))
+
+        return ready
+
+    def _idle_timeout(self) -> Optional[float]:
+        """:return: Seconds until the least recently active TCP connection becomes idle, None if there are none"""
+        connections = [*self._tcp_clients.values(), *(self._tcp_upstream or ())]
+
+        if not connections:
+            return None
+
+        last_active = min(_connection.last_active for _connection in connections)
+
+        return max(last_active + self._tcp_idle_timeout - self._now, 0.0)
+
+    def _next_timeout(self) -> Optional[float]:
+        """:return: Seconds until the next scheduled work, None if there is nothing scheduled"""
+        timeouts = (
+            self._idle_timeout(),
+            self._expiry_timeout(),
+            self._stats_timeout(),
+            self._prefetch_timeout(),
+            self._retransmit_timeout(),
+            self._stale_timeout(),
+        )
+
+        return min((_timeout for _timeout in timeouts if _timeout is not None), default=None)
+
+    def _prefetch(self) -> None:
+        """Re-resolve hot routed names shortly before their cached responses expire"""
+        self._prefetch_time = self._now
+
+        for key in self._prefetcher.due(self._now, self._cache):
+            if self._upstream.pending(key) or not self._upstream.capacity:
+                continue
+
+            self._upstream.send(
+                key_query(key, payload_size=self._buff_size), InFlightQuery(0, None, self._now, True, key)
+            )
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        return {
+            "fds_used": self._budget.used,
+            "fds_headroom": self._budget.headroom,
+            "in_flight": len(self._upstream),
+            "upstream_capacity": self._upstream.capacity,
+            "coalesced": self._upstream.coalesced,
+            "retransmitted": self._upstream.retransmitted,
+            "retries_throttled": self._upstream.retries_throttled,
+            **self._hostnames.stats,
+            **self._cache.stats,
+            **self._prefetcher.stats,
+            **self._upstream.resolvers.stats(self._now),
+            **self.route_stats,
+            **({"tcp_clients": len(self._tcp_clients), **self._tcp_upstream.stats} if self._tcp else {}),
+        }
+
+    def _log_stats(self) -> None:
+        self._stats_time = self._now
+        self._logger.info("DNS: stats " + " ".join(f"{_name}={_value}" for _name, _value in self.stats.items()))
+
+    def _expire_queries(self) -> None:
+        expired_queries = self._upstream.expire(self._now - self._timeout_in_seconds)
+
+        if self._tcp_upstream is not None:
+            expired_queries += self._tcp_upstream.expire(self._now - self._timeout_in_seconds)
+            self._tcp_upstream.close_idle(self._now)
+
+        for _connection in list(self._tcp_clients.values()):
+            if _connection.last_active + self._tcp_idle_timeout <= self._now:
+                self._close_stream(_connection)
+
+        if expired_queries:
+            self._logger.warning(f"DNS: {expired_queries} queries expired")
+
+    def _process_responses(
+        self, netlink: Netlink, regular: List[Datagram], routed: List[RoutedResponse]
+    ) -> List[Datagram]:
+        """Log the responses and update the routes
+
+        :return: Responses ready to be sent to the clients
+        """
+        self._parse_regular_responses(regular)
+
+        if not routed:
+            return regular
+
+        routed_messages = self._parse_routed_responses(routed)
+
+        if self._route_pipe is None:
+            self._program_routes(netlink, *self._update_routes(routed_messages))
+
+        else:
+            ipv4_addresses, ipv6_addresses = self._routed_addresses(routed_messages)
+
+            if ipv4_addresses or ipv6_addresses:
+                self._route_pipe.send((ipv4_addresses, ipv6_addresses))
+
+        return [*regular, *(_routed.response for _routed in routed if _routed.response is not None)]
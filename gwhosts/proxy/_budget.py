@@ -0,0 +1,55 @@
+from contextlib import contextmanager
+from resource import RLIMIT_NOFILE, RLIM_INFINITY, getrlimit
+from typing import Iterator
+
+# Effective limit when RLIMIT_NOFILE is unlimited, matches the default fs.nr_open
+_NR_OPEN: int = 1 << 20
+
+
+class FDBudget:
+    """Open file descriptors accounting
+
+    The RLIMIT_NOFILE soft limit is read once and sockets are counted as the proxy opens and closes them,
+    so the headroom is known without listing /proc/self/fd.
+
+    :param reserved: Descriptors left for the interpreter, logging and pipes
+    """
+
+    def __init__(self, reserved: int = 16) -> None:
+        soft_limit, _ = getrlimit(RLIMIT_NOFILE)
+        self._limit: int = _NR_OPEN if soft_limit == RLIM_INFINITY else soft_limit
+        self._reserved = reserved
+        self._used: int = 0
+
+    @property
+    def limit(self) -> int:
+        return self._limit
+
+    @property
+    def used(self) -> int:
+        """:return: Number of descriptors opened by the proxy"""
+        return self._used
+
+    @property
+    def headroom(self) -> int:
+        """:return: Number of descriptors the proxy can open"""
+        return max(self._limit - self._reserved - self._used, 0)
+
+    def acquire(self, count: int = 1) -> None:
+        if count > self.headroom:
+            raise OverflowError("DNS: open files limit is reached")
+
+        self._used += count
+
+    def release(self, count: int = 1) -> None:
+        self._used -= count
+
+    @contextmanager
+    def reserve(self, count: int = 1) -> Iterator[None]:
+        self.acquire(count)
+
+        try:
+            yield
+
+        finally:
+            self.release(count)
@@ -0,0 +1,238 @@
+from collections import OrderedDict
+from struct import Struct
+from typing import Dict, FrozenSet, NamedTuple, Optional, Tuple
+
+from ..dns import DNSParserError, Flags, RCode, RRType, WireLayout, scan
+
+_TTL = Struct("!I")
+# Rough per-entry overhead of the key, the entry tuple and the ordered dict node
+_ENTRY_OVERHEAD: int = 256
+# TTL of the answers served stale [https://www.iana.org/go/rfc8767]
+_STALE_TTL: int = 30
+
+
+class CachedResponse(NamedTuple):
+    """
+    :param data: Raw response
+    :param ttls: Offsets and original values of the TTL fields
+    :param answers: RDATA of the answers
+    :param time: Time when the response was cached
+    :param expires: Time when the response is not fresh anymore
+    :param size: Accounted memory size
+    """
+
+    data: bytes
+    ttls: Tuple[Tuple[int, int], ...]
+    answers: FrozenSet[bytes]
+    time: float
+    expires: float
+    size: int
+
+
+class _Partition:
+    """Cached responses sharing a memory budget, the least recently used ones are evicted first"""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.size: int = 0
+        self.hits: int = 0
+        self._entries: OrderedDict[bytes, CachedResponse] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: bytes, now: float) -> Optional[CachedResponse]:
+        """:return: Fresh response, None if there is no fresh response"""
+        entry = self._entries.get(key)
+
+        if entry is None or entry.expires <= now:
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+
+        return entry
+
+    def peek(self, key: bytes) -> Optional[CachedResponse]:
+        """:return: Response regardless of its freshness without counting a hit"""
+        return self._entries.get(key)
+
+    def pop(self, key: bytes) -> Optional[CachedResponse]:
+        entry = self._entries.pop(key, None)
+
+        if entry is not None:
+            self.size -= entry.size
+
+        return entry
+
+    def add(self, key: bytes, entry: CachedResponse) -> None:
+        if entry.size > self.max_size:
+            return
+
+        self._entries[key] = entry
+        self.size += entry.size
+
+        while self.size > self.max_size:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= evicted.size
+
+
+class ResponseCache:
+    """TTL-aware LRU cache of raw upstream responses
+
+    Responses are keyed by the raw (QNAME, QTYPE, QCLASS) and the EDNS, DO and CD flags of the query
+    (question_key) and returned with the client's ID and the TTLs decremented by the time spent in the cache.
+    Expired responses are kept until they are replaced or evicted, so a fresh response can be compared
+    with the previous one and served stale (RFC 8767) while the upstream is slow or failing.
+
+    Negative responses (NXDOMAIN and NODATA) are cached for the SOA minimum TTL (RFC 2308) within
+    a separate memory budget, so a flood of nonexistent names does not evict positive responses.
+
+    :param max_size: Memory cap of positive responses in bytes, 0 disables caching
+    :param negative_max_size: Memory cap of negative responses in bytes, 0 disables caching
+    :param max_stale: Seconds after the expiration during which a response can be served stale
+    """
+
+    def __init__(self, max_size: int = 16 << 20, negative_max_size: int = 1 << 20, max_stale: float = 86400.0) -> None:
+        self._positive = _Partition(max_size)
+        self._negative = _Partition(negative_max_size)
+        self._max_stale = max_stale
+        self._misses: int = 0
+        self._stale_hits: int = 0
+
+    def __len__(self) -> int:
+        return len(self._positive) + len(self._negative)
+
+    @property
+    def size(self) -> int:
+        """:return: Accounted memory size in bytes"""
+        return self._positive.size + self._negative.size
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        hits = self._positive.hits + self._negative.hits
+        lookups = hits + self._misses
+
+        return {
+            "cache_entries": len(self._positive),
+            "cache_bytes": self._positive.size,
+            "negative_cache_entries": len(self._negative),
+            "negative_cache_bytes": self._negative.size,
+            "cache_hits": self._positive.hits,
+            "negative_cache_hits": self._negative.hits,
+            "cache_misses": self._misses,
+            "cache_hit_ratio": round(hits / lookups, 3) if lookups else 0.0,
+            "stale_hits": self._stale_hits,
+        }
+
+    @staticmethod
+    def _render(entry: CachedResponse, query_id: bytes, elapsed: Optional[int]) -> bytes:
+        """:param elapsed: Seconds spent in the cache, None sets the TTLs of a stale response"""
+        data = bytearray(entry.data)
+        data[:2] = query_id
+
+        for offset, ttl in entry.ttls:
+            _TTL.pack_into(data, offset, _STALE_TTL if elapsed is None else max(ttl - elapsed, 0))
+
+        return bytes(data)
+
+    def get(self, key: bytes, query_id: bytes, now: float) -> Optional[bytes]:
+        """:return: Cached response for the query ID, None if there is no fresh response"""
+        entry = self._positive.get(key, now) or self._negative.get(key, now)
+
+        if entry is None:
+            self._misses += 1
+            return None
+
+        return self._render(entry, query_id, int(now - entry.time))
+
+    def _peek_stale(self, key: bytes, now: float) -> Optional[CachedResponse]:
+        entry = self._positive.peek(key) or self._negative.peek(key)
+
+        if entry is None or not entry.expires <= now <= entry.expires + self._max_stale:
+            return None
+
+        return entry
+
+    def has_stale(self, key: bytes, now: float) -> bool:
+        """:return: There is an expired response within the stale limit"""
+        return self._peek_stale(key, now) is not None
+
+    def stale(self, key: bytes, query_id: bytes, now: float) -> Optional[bytes]:
+        """:return: Expired response for the query ID with short TTLs, None if there is none within the stale limit"""
+        entry = self._peek_stale(key, now)
+
+        if entry is None:
+            return None
+
+        self._stale_hits += 1
+
+        return self._render(entry, query_id, None)
+
+    def lifetime(self, key: bytes) -> Optional[Tuple[float, float]]:
+        """:return: Time when the positive response was cached and time when it expires, None if there is none"""
+        entry = self._positive.peek(key)
+
+        return None if entry is None else (entry.time, entry.expires)
+
+    @staticmethod
+    def _negative_ttl(data: bytes, layout: WireLayout) -> int:
+        """:return: The smallest of the SOA TTL and the SOA MINIMUM field [https://www.iana.org/go/rfc2308]"""
+        for record in layout.authorities:
+            if record.rr_type == RRType.SOA.value:
+                _, end = record.rr_data
+
+                return min(_TTL.unpack_from(data, record.ttl)[0], _TTL.unpack_from(data, end - _TTL.size)[0])
+
+        return 0
+
+    def _keep(self, key: bytes, previous: Optional[CachedResponse]) -> bool:
+        """Put the previous response back, so it can be served stale
+
+        :return: There is no previous response
+        """
+        if previous is None:
+            return True
+
+        (self._positive if previous.answers else self._negative).add(key, previous)
+
+        return False
+
+    def put(self, key: bytes, data: bytes, now: float) -> bool:
+        """Cache a successful or a negative response, other responses leave the previous one in place
+
+        :return: The answers differ from the previously cached response for the key
+        """
+        previous = self._positive.pop(key) or self._negative.pop(key)
+
+        try:
+            layout = scan(data)
+
+        except DNSParserError:
+            return self._keep(key, previous)
+
+        answers = frozenset(data[slice(*_record.rr_data)] for _record in layout.answers)
+        changed = previous is None or previous.answers != answers
+        rcode = layout.header.flags & Flags.RCODE.value
+
+        if layout.header.flags & Flags.TC.value:
+            return self._keep(key, previous)
+
+        if rcode == RCode.NOERROR.value and answers:
+            partition = self._positive
+            ttl = min(_TTL.unpack_from(data, _offset)[0] for _offset in layout.ttls)
+
+        elif rcode in (RCode.NOERROR.value, RCode.NXDOMAIN.value) and not answers:
+            partition = self._negative
+            ttl = self._negative_ttl(data, layout)
+
+        else:
+            return self._keep(key, previous)
+
+        if ttl:
+            ttls = tuple((_offset, _TTL.unpack_from(data, _offset)[0]) for _offset in layout.ttls)
+            partition.add(
+                key, CachedResponse(data, ttls, answers, now, now + ttl, len(key) + len(data) + _ENTRY_OVERHEAD)
+            )
+
+        return changed
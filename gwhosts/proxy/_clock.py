@@ -0,0 +1,11 @@
+from time import monotonic
+
+try:
+    from time import CLOCK_MONOTONIC_COARSE, clock_gettime
+
+    def monotonic_coarse() -> float:
+        """:return: Monotonic time with the kernel tick resolution, cheaper to read than the precise clock"""
+        return clock_gettime(CLOCK_MONOTONIC_COARSE)
+
+except ImportError:  # pragma: no cover
+    monotonic_coarse = monotonic
@@ -0,0 +1,121 @@
+from heapq import nlargest
+from operator import itemgetter
+from typing import Dict, List, Optional
+
+from ._cache import ResponseCache
+
+
+class TokenBucket:
+    """Rate limiter refilled with `rate` tokens per second up to `burst` tokens"""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self._rate = rate
+        self._burst = burst
+        self._tokens = burst
+        self._time: float = 0.0
+
+    def take(self, now: float) -> bool:
+        """:return: A token was available and has been taken"""
+        self._tokens = min(self._tokens + (now - self._time) * self._rate, self._burst)
+        self._time = now
+
+        if self._tokens < 1.0:
+            return False
+
+        self._tokens -= 1.0
+        return True
+
+
+class Prefetcher:
+    """Picks the most frequently asked routed names whose cached responses are about to expire
+
+    Query counts are halved every `decay_interval` seconds, so the names that are not asked anymore fade out.
+
+    :param top: Number of the most frequently asked names kept fresh, 0 disables prefetching
+    :param qps: Upstream queries per second budget
+    :param lead: Seconds before the expiry when a response is prefetched, a tenth of the TTL at most
+    :param interval: Seconds between checks
+    :param decay_interval: Seconds between halvings of the query counts
+    """
+
+    def __init__(
+        self,
+        top: int = 0,
+        qps: float = 10.0,
+        lead: float = 5.0,
+        interval: float = 1.0,
+        decay_interval: float = 60.0,
+    ) -> None:
+        self._top = top
+        self._lead = lead
+        self._interval = interval
+        self._decay_interval = decay_interval
+        self._bucket = TokenBucket(qps, max(qps, 1.0))
+        self._counts: Dict[bytes, int] = {}
+        self._decay_time: Optional[float] = None
+        self._prefetched: int = 0
+        self._throttled: int = 0
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    @property
+    def enabled(self) -> bool:
+        return self._top > 0
+
+    @property
+    def interval(self) -> float:
+        return self._interval
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        return {
+            "prefetch_tracked": len(self._counts),
+            "prefetched": self._prefetched,
+            "prefetch_throttled": self._throttled,
+        }
+
+    def track(self, key: bytes) -> None:
+        """Count a query for a routed name"""
+        if self._top:
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+    def hit(self, key: bytes) -> None:
+        """Count a query answered from the cache, only the names that are tracked already are counted"""
+        if key in self._counts:
+            self._counts[key] += 1
+
+    def _decay(self, now: float) -> None:
+        if self._decay_time is None:
+            self._decay_time = now
+
+        if now - self._decay_time < self._decay_interval:
+            return
+
+        self._decay_time = now
+        self._counts = {_key: _count >> 1 for _key, _count in self._counts.items() if _count > 1}
+
+    def due(self, now: float, cache: ResponseCache) -> List[bytes]:
+        """:return: Keys of the hot names to be prefetched right now"""
+        self._decay(now)
+        keys: List[bytes] = []
+
+        for key, _ in nlargest(self._top, self._counts.items(), key=itemgetter(1)):
+            lifetime = cache.lifetime(key)
+
+            if lifetime is None:
+                continue
+
+            cached, expires = lifetime
+
+            if not expires - min(self._lead, (expires - cached) / 10) <= now < expires:
+                continue
+
+            if not self._bucket.take(now):
+                self._throttled += 1
+                break
+
+            self._prefetched += 1
+            keys.append(key)
+
+        return keys
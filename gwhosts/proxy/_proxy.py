@@ -1,462 +1,157 @@
-import os
-import resource
-from base64 import b64encode
 from collections import deque
-from functools import lru_cache
-from logging import Logger
-from select import select
-from socket import socket, AF_INET, AF_INET6
-from time import time
-from typing import Callable, Dict, Iterable, Iterator, List, Set, Tuple, Optional
-
-from ._types import DNSDataMessage, LinkState, RTMEvent
-from ..dns import QName, DNSParserError, RRType, parse, qname_to_str, answer_to_str
+from socket import SOL_SOCKET, SO_REUSEPORT
+from typing import Dict, List, Optional
+
+from ._base import BaseDNSProxy
+from ._reactor import Reactor, ReactorBackend
+from ._types import RoutedResponse
 from ..network import (
     Address,
     Datagram,
-    ExpiringAddress,
-    IPAddress,
-    IPBinary,
-    Network,
-    NetworkSize,
+    DatagramReceiver,
+    DatagramSender,
+    MMsgDatagramReceiver,
+    MMsgDatagramSender,
+    StreamAddress,
+    StreamConnection,
     UDPSocket,
 )
-from ..network.ipv4 import (
-    IPV4_NETMASK_MAX,
-    ipv4_bytes_to_int,
-    ipv4_str_to_int,
-    ipv4_network_size_to_netmask,
-    ipv4_network_to_str,
-    ipv4_reduce_subnets,
-)
-from ..network.ipv6 import (
-    IPV6_NETMASK_MAX,
-    ipv6_bytes_to_int,
-    ipv6_str_to_int,
-    ipv6_network_size_to_netmask,
-    ipv6_network_to_str,
-    ipv6_reduce_subnets,
-)
-from ..routes import Netlink
 
 
-class DNSProxy:
+class DNSProxy(BaseDNSProxy):
+    """Proxy engine built on a reactor loop
+
+    :param reactor: I/O multiplexing backend
+    :param batch_size: Maximum number of datagrams read from a socket or sent at once
+    :param mmsg: Use recvmmsg/sendmmsg system calls
+    """
+
     def __init__(
         self,
-        hostnames: Set[QName],
-        logger: Logger,
-        ipv4_ifname: Optional[str] = None,
-        ipv4_gateway: Optional[IPAddress] = None,
-        ipv6_ifname: Optional[str] = None,
-        ipv6_gateway: Optional[IPAddress] = None,
-        to_addr: Address = Address("127.0.0.1", 8053),
-        buff_size: int = 1024,
-        timeout_in_seconds: int = 5,
+        *args,
+        reactor: ReactorBackend = ReactorBackend.EPOLL,
+        batch_size: int = 64,
+        mmsg: bool = False,
+        **kwargs,
     ) -> None:
-        self._ipv4_ifname = ipv4_ifname
-        self._ipv4_gateway = ipv4_gateway
-        self._ipv6_ifname = ipv6_ifname
-        self._ipv6_gateway = ipv6_gateway
-        self._to_addr = to_addr
-        self._buff_size = buff_size
-        self._timeout_in_seconds = timeout_in_seconds
-        self._hostnames: Set[QName] = hostnames
-        self._logger: Logger = logger
-        self._free_pool: List[UDPSocket] = []
-        self._input_pool: List[UDPSocket] = []
-        self._regular_pool: Dict[UDPSocket, ExpiringAddress] = {}
-        self._routed_pool: Dict[UDPSocket, ExpiringAddress] = {}
-        self._queries_queue: deque = deque()
-        self._ipv4_addresses: Set[IPAddress] = set()
-        self._ipv4_subnets: Set[Network] = set()
-        self._ipv6_addresses: Set[IPAddress] = set()
-        self._ipv6_subnets: Set[Network] = set()
-        self._netlink_event_handlers: Dict[RTMEvent, Callable] = {
-            RTMEvent.NEW_ROUTE.value: self._process_rtm_route,
-            RTMEvent.DEL_ROUTE.value: self._process_rtm_route,
-            RTMEvent.NEW_LINK.value: self._process_rtm_newlink,
-        }
-        rtm_route_handlers = (
-            (RTMEvent.NEW_ROUTE.value, AF_INET, ipv4_gateway, self._ipv4_process_rtm_new_route),
-            (RTMEvent.NEW_ROUTE.value, AF_INET6, ipv6_gateway, self._ipv6_process_rtm_new_route),
-            (RTMEvent.DEL_ROUTE.value, AF_INET, ipv4_gateway, self._ipv4_process_rtm_del_route),
-            (RTMEvent.DEL_ROUTE.value, AF_INET6, ipv6_gateway, self._ipv6_process_rtm_del_route),
-        )
-        self._rtm_route_handlers: Dict[Tuple[str, int, str], Callable] = {
-            (_event, _family, _gateway): _handler
-            for _event, _family, _gateway, _handler in rtm_route_handlers
-            if _gateway is not None
-        }
-        rtm_newlink_handlers = (
-            (ipv4_ifname, LinkState.UP.value, self._process_rtm_newlink_up),
-            (ipv4_ifname, LinkState.DOWN.value, self._process_rtm_newlink_down),
-            (ipv6_ifname, LinkState.UP.value, self._process_rtm_newlink_up),
-            (ipv6_ifname, LinkState.DOWN.value, self._process_rtm_newlink_down),
-        )
-        self._rtm_newlink_handlers: Dict[Tuple[str, str], Callable] = {
-            (_ifname, _state): _handler for _ifname, _state, _handler in rtm_newlink_handlers if _ifname is not None
-        }
-        self._preserved_ifnames: Set[str] = set()
-        self._netlink_to_network = {
-            AF_INET: self._ipv4_netlink_to_network,
-            AF_INET6: self._ipv6_netlink_to_network,
-        }
-
-    @property
-    def _open_files_count(self) -> int:
-        """:return: The number of open file descriptors"""
-        open_files = os.listdir("/proc/self/fd")
-
-        return len(open_files)
-
-    @property
-    def _max_open_files_count(self) -> int:
-        """:return: Current soft limit on the number of open file descriptors"""
-        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
-
-        return soft
-
-    @property
-    def _active_pool(self):
-        return [*self._input_pool, *self._regular_pool, *self._routed_pool]
-
-    def _get_socket(self) -> UDPSocket:
-        if len(self._free_pool):
-            return self._free_pool.pop()
-
-        _socket = UDPSocket()
-        _socket.setblocking(False)
-
-        return _socket
-
-    def _hostname_exists(self, hostname: QName) -> bool:
-        for level in range(len(hostname)):
-            if hostname[level:] in self._hostnames:
-                self._hostnames.add(hostname)
-                return True
-
-        return False
-
-    @property
-    def ipv4_subnets(self) -> Set[Network]:
-        return self._ipv4_subnets
-
-    @lru_cache(maxsize=4094)
-    def _ipv4_in_subnets(self, address: IPBinary) -> bool:
-        return any(address & subnet.mask == subnet.address for subnet in self.ipv4_subnets)
-
-    def _ipv4_update_subnets(self, addresses: Set[Network]) -> Dict[Network, bool]:
-        subnets = set(ipv4_reduce_subnets(addresses.union(self.ipv4_subnets)))
-        updates = self._ipv4_subnets.symmetric_difference(subnets)
-
-        return {subnet: subnet in subnets for subnet in updates}
-
-    @property
-    def ipv6_subnets(self) -> Set[Network]:
-        return self._ipv6_subnets
-
-    @lru_cache(maxsize=4094)
-    def _ipv6_in_subnets(self, address: IPBinary) -> bool:
-        return any(address & subnet.mask == subnet.address for subnet in self.ipv6_subnets)
-
-    def _ipv6_update_subnets(self, addresses: Set[Network]) -> Dict[Network, bool]:
-        subnets = set(ipv6_reduce_subnets(addresses.union(self.ipv6_subnets)))
-        updates = self._ipv6_subnets.symmetric_difference(subnets)
-
-        return {subnet: subnet in subnets for subnet in updates}
-
-    def _update_routes(self, queue: Iterable[DNSDataMessage]) -> Tuple[Dict[Network, bool], Dict[Network, bool]]:
-        ipv4_addresses = set()
-        ipv6_addresses = set()
-
-        for response, addr in queue:
-            for answer in response.answers:
-                if answer.rr_type == RRType.A.value:
-                    address = ipv4_bytes_to_int(answer.rr_data)
-
-                    if not self._ipv4_in_subnets(address):
-                        ipv4_addresses.add(Network(address, IPV4_NETMASK_MAX))
-
-                elif answer.rr_type == RRType.AAAA.value:
-                    address = ipv6_bytes_to_int(answer.rr_data)
-
-                    if not self._ipv6_in_subnets(address):
-                        ipv6_addresses.add(Network(address, IPV6_NETMASK_MAX))
-
-        return (
-            self._ipv4_update_subnets(ipv4_addresses) if ipv4_addresses else {},
-            self._ipv6_update_subnets(ipv6_addresses) if ipv6_addresses else {},
+        super().__init__(*args, **kwargs)
+        self._reactor_backend = reactor
+        self._receiver: DatagramReceiver = (MMsgDatagramReceiver if mmsg else DatagramReceiver)(
+            self._buff_size, batch_size
         )
+        self._sender: DatagramSender = (MMsgDatagramSender if mmsg else DatagramSender)(batch_size)
+        self._queries_queue: deque = deque()
+        self._reactor: Optional[Reactor] = None
 
-    def _process_queued_queries(self) -> int:
+    def _process_queued_queries(self, ready: List[Datagram]) -> int:
         """Process queued queries and return the number of remaining ones
 
+        :param ready: Receives responses to the queries answered from the cache
         :return: Number of remaining queries
         """
-        queue_size = len(self._queries_queue)
-        available_file_descriptors_count = self._max_open_files_count - self._open_files_count
-
-        for _ in range(min(queue_size, available_file_descriptors_count)):
-            self._route_request(self._queries_queue.popleft())
-
-        return len(self._queries_queue)
-
-    def _log_how_to_reproduce(self, data: bytes) -> None:
-        b64data = b64encode(data).decode("utf8")
-        self._logger.error("To reproduce, run:")
-        self._logger.error(f"echo -n '{b64data}' | python -m base64 -d | python -m gwhosts.dns.parser")
+        queue = self._queries_queue
 
-    def _route_request(self, datagram: Datagram) -> None:
-        data, addr = datagram
+        while queue and self._upstream.capacity:
+            response = self._route_request(queue.popleft())
 
-        try:
-            query = parse(data)
+            if response is not None:
+                ready.append(response)
 
-        except DNSParserError:
-            self._logger.error("Failed to parse DNS query")
-            self._log_how_to_reproduce(data)
+        return len(queue)
 
-            return
-
-        remote = self._get_socket()
-        remote.sendto(data, self._to_addr)
-
-        domains = [q.name for q in query.questions]
-
-        if any(self._hostname_exists(hostname) for hostname in domains):
-            self._routed_pool[remote] = ExpiringAddress(addr, time())
-
-            for hostname in domains:
-                self._logger.info(f"DNS: Q[{query.header.id}] <- {qname_to_str(hostname)} (P)")
+    @property
+    def stats(self) -> Dict[str, float]:
+        return {**super().stats, "queued": len(self._queries_queue)}
 
-        else:
-            self._regular_pool[remote] = ExpiringAddress(addr, time())
-
-            for hostname in domains:
-                self._logger.info(f"DNS: Q[{query.header.id}] <- {qname_to_str(hostname)}")
-
-    @staticmethod
-    def _sanitize_free_pool(pool: List[socket]) -> None:
-        while pool:
-            pool.pop().close()
-
-    def _sanitize_active_pool(self, pool: Dict[UDPSocket, ExpiringAddress]) -> int:
-        current_timestamp = time()
-        expired_queries = 0
-
-        for _socket in tuple(pool.keys()):
-            if current_timestamp - pool[_socket].time > self._timeout_in_seconds:
-                self._free_pool.append(_socket)
-                del pool[_socket]
-                expired_queries += 1
-
-        return expired_queries
-
-    def _read(self, _socket: socket) -> Datagram:
-        data, addr = _socket.recvfrom(self._buff_size)
-        return Datagram(data, Address(*addr))
-
-    def _release(self, _socket: UDPSocket) -> None:
-        self._free_pool.append(_socket)
-
-    def _read_and_release(self, _socket: UDPSocket, pool: Dict[UDPSocket, ExpiringAddress]) -> Datagram:
-        data = self._read(_socket).data
-        self._release(_socket)
-        return Datagram(data, pool.pop(_socket).address)
-
-    def _parse_routed_responses(self, responses: List[Datagram]) -> Iterator[DNSDataMessage]:
-        for data, addr in responses:
-            try:
-                response = parse(data)
-
-            except DNSParserError:
-                self._logger.error("Failed to parse DNS response")
-                self._log_how_to_reproduce(data)
-
-            else:
-                for answer in response.answers:
-                    self._logger.info(f"DNS: R[{response.header.id}] {answer_to_str(answer)} (P)")
-
-                yield DNSDataMessage(response, addr)
-
-    def _parse_regular_responses(self, responses: List[Datagram]) -> None:
-        for data, addr in responses:
-            try:
-                response = parse(data)
-
-            except DNSParserError:
-                self._logger.error("Failed to parse DNS response")
-                self._log_how_to_reproduce(data)
-
-            else:
-                for answer in response.answers:
-                    self._logger.info(f"DNS: R[{response.header.id}] {answer_to_str(answer)}")
-
-    @staticmethod
-    def _send_responses(queue: List[Datagram], udp: UDPSocket) -> None:
-        for data, addr in queue:
-            udp.sendto(data, addr)
-
-    @staticmethod
-    def _ipv4_netlink_to_network(address: IPAddress, length: NetworkSize) -> Network:
-        return Network(
-            address=ipv4_str_to_int(address),
-            mask=ipv4_network_size_to_netmask(length),
-        )
+    def _read_upstream(
+        self,
+        _socket: UDPSocket,
+        regular: List[Datagram],
+        routed: List[RoutedResponse],
+        ready: List[Datagram],
+    ) -> None:
+        for data, addr in self._receiver.receive(_socket):
+            matched = self._upstream.match(_socket, data, addr, self._now)
 
-    def _ipv4_process_rtm_new_route(self, network: Network) -> None:
-        """New IPv4 route is added"""
-        self._ipv4_subnets.add(network)
-        self._logger.info(f"DNS: network added {ipv4_network_to_str(network)}")
+            if matched is None:
+                continue
 
-    def _ipv4_process_rtm_del_route(self, network: Network) -> None:
-        """An existing IPv4 route is deleted"""
-        if self._ipv4_ifname in self._preserved_ifnames:
-            self._logger.info(f"DNS: network preserved {ipv4_network_to_str(network)}")
-            return
+            ready.extend(self._accept_response(*matched, regular, routed))
 
-        try:
-            self._ipv4_subnets.remove(network)
+    def _send_responses(self, queue: List[Datagram], udp: UDPSocket) -> None:
+        if self._tcp_clients:
+            for _datagram in queue:
+                if isinstance(_datagram.target, StreamAddress):
+                    self._send_stream(_datagram)
 
-        except KeyError as e:
-            self._logger.exception(e)
-            self._logger.info(f"DNS: network does not exists {ipv4_network_to_str(network)}")
+            queue = [_datagram for _datagram in queue if not isinstance(_datagram.target, StreamAddress)]
 
-        else:
-            self._logger.info(f"DNS: network deleted {ipv4_network_to_str(network)}")
+        self._sender.send(udp, queue)
 
-    @staticmethod
-    def _ipv6_netlink_to_network(address: IPAddress, length: NetworkSize) -> Network:
-        return Network(
-            address=ipv6_str_to_int(address),
-            mask=ipv6_network_size_to_netmask(length),
-        )
+    def _register_stream(self, connection: StreamConnection) -> None:
+        self._reactor.register(connection)
 
-    def _ipv6_process_rtm_new_route(self, network: Network) -> None:
-        """New IPv6 route is added"""
-        self._ipv6_subnets.add(network)
-        self._logger.info(f"DNS: network added {ipv6_network_to_str(network)}")
+    def _unregister_stream(self, connection: StreamConnection) -> None:
+        self._reactor.unregister(connection)
 
-    def _ipv6_process_rtm_del_route(self, network: Network) -> None:
-        """An IPv6 existing route is deleted"""
-        if self._ipv6_ifname in self._preserved_ifnames:
-            self._logger.info(f"DNS: network preserved {ipv6_network_to_str(network)}")
-            return
-
-        try:
-            self._ipv6_subnets.remove(network)
-
-        except KeyError as e:
-            self._logger.exception(e)
-            self._logger.info(f"DNS: network does not exists {ipv6_network_to_str(network)}")
+    def _watch_writes(self, connection: StreamConnection) -> None:
+        self._reactor.modify(connection, connection.writes_watched)
 
+    def _read_stream_ready(
+        self,
+        connection: StreamConnection,
+        regular: List[Datagram],
+        routed: List[RoutedResponse],
+        ready: List[Datagram],
+    ) -> None:
+        if connection in self._tcp_upstream:
+            ready.extend(self._read_tcp_upstream(connection, regular, routed))
         else:
-            self._logger.info(f"DNS: network deleted {ipv6_network_to_str(network)}")
-
-    def _process_rtm_newlink(self, netlink: Netlink, message: dict) -> None:
-        attrs = dict(message["attrs"])
-        ifname = attrs["IFLA_IFNAME"]
-        state = message["state"]
-        key = ifname, state
-
-        if key in self._rtm_newlink_handlers:
-            self._rtm_newlink_handlers[key](netlink, ifname)
-
-    def _process_rtm_newlink_up(self, netlink: Netlink, ifname: str) -> None:
-        if ifname not in self._preserved_ifnames:
-            return
-
-        self._preserved_ifnames.remove(ifname)
-
-        if ifname == self._ipv4_ifname:
-            self._logger.info(f"DNS: restoring IPv4 routes via {self._ipv4_gateway}...")
-
-            for _network in self._ipv4_subnets:
-                netlink.ipv4_add_route(_network, self._ipv4_gateway)
-
-        if ifname == self._ipv6_ifname:
-            self._logger.info(f"DNS: restoring IPv6 routes via {self._ipv6_gateway}...")
-
-            for _network in self._ipv6_subnets:
-                netlink.ipv6_add_route(_network, self._ipv6_gateway)
-
-    def _process_rtm_newlink_down(self, netlink: Netlink, ifname: str) -> None:
-        self._preserved_ifnames.add(ifname)
-        self._logger.info(f"DNS: interface preserved {ifname}")
-
-    def _process_rtm_route(self, netlink: Netlink, message: dict) -> None:
-        attrs = dict(message["attrs"])
-
-        if "RTA_GATEWAY" in attrs:
-            event = message["event"]
-            family = message["family"]
-            gateway = attrs["RTA_GATEWAY"]
-            key = event, family, gateway
-
-            if key in self._rtm_route_handlers:
-                network = self._netlink_to_network[family](
-                    address=attrs["RTA_DST"],
-                    length=message["dst_len"],
-                )
-                self._rtm_route_handlers[key](network)
-
-    def _process_netlink_message(self, netlink: Netlink, message: dict) -> None:
-        event = message["event"]
-
-        if event in self._netlink_event_handlers:
-            self._netlink_event_handlers[event](netlink, message)
-
-    def _process_ipv4_updates(self, netlink: Netlink, updates: Dict[Network, bool]) -> None:
-        for network, exist in updates.items():
-            if exist:
-                netlink.ipv4_add_route(network, self._ipv4_gateway)
-            else:
-                netlink.ipv4_del_route(network, self._ipv4_gateway)
-
-    def _process_ipv6_updates(self, netlink: Netlink, updates: Dict[Network, bool]) -> None:
-        for network, exist in updates.items():
-            if exist:
-                netlink.ipv6_add_route(network, self._ipv6_gateway)
-            else:
-                netlink.ipv6_del_route(network, self._ipv6_gateway)
+            self._queries_queue.extend(self._read_stream(connection))
 
     def listen(self, addr: Address) -> None:
-        with Netlink() as netlink:
-            netlink.bind()
-            self._input_pool.append(netlink)
+        with Reactor(self._reactor_backend) as reactor, self._netlink() as netlink, self._tcp_listener(addr) as tcp:
+            self._reactor = reactor
 
-            self._logger.info("DNS: loading existing IPv4 routes...")
+            if netlink is not None:
+                reactor.register(netlink)
 
-            for _message in netlink.get_routes(family=AF_INET):
-                self._process_netlink_message(netlink, _message)
+            if tcp is not None:
+                reactor.register(tcp)
 
-            self._logger.info("DNS: loading existing IPv6 routes...")
+            with self._budget.reserve(), UDPSocket() as udp, self._upstream as upstream:
+                if self._reuse_port:
+                    udp.setsockopt(SOL_SOCKET, SO_REUSEPORT, 1)
 
-            for _message in netlink.get_routes(family=AF_INET6):
-                self._process_netlink_message(netlink, _message)
-
-            with UDPSocket() as udp:
                 udp.bind(addr)
-                self._input_pool.append(udp)
+                reactor.register(udp)
+
+                for _socket in upstream:
+                    reactor.register(_socket)
 
                 self._logger.info(f"DNS: proxy is listening at {addr.host}:{addr.port}")
 
                 while True:
                     try:
+                        regular_responses: List[Datagram] = []
+                        routed_responses: List[RoutedResponse] = []
                         ready_responses: List[Datagram] = []
-                        routed_responses: List[Datagram] = []
 
-                        r_ready, w_ready, x_ready = select(self._active_pool, [], [], self._timeout_in_seconds)
+                        ready_sockets = reactor.select(self._next_timeout())
+                        self._tick()
 
-                        for _socket in r_ready:
+                        for _socket in ready_sockets:
                             if _socket is udp:
-                                self._queries_queue.append(self._read(_socket))
+                                self._queries_queue.extend(self._receiver.receive(udp))
+
+                            elif _socket in upstream:
+                                self._read_upstream(_socket, regular_responses, routed_responses, ready_responses)
 
-                            elif _socket in self._routed_pool:
-                                routed_responses.append(self._read_and_release(_socket, self._routed_pool))
+                            elif isinstance(_socket, StreamConnection):
+                                self._read_stream_ready(_socket, regular_responses, routed_responses, ready_responses)
 
-                            elif _socket in self._regular_pool:
-                                ready_responses.append(self._read_and_release(_socket, self._regular_pool))
+                            elif _socket is tcp:
+                                self._accept_streams(tcp)
 
                             elif _socket is netlink:
                                 for _message in netlink.get():
@@ -465,33 +160,22 @@ class DNSProxy:
                             else:
                                 raise AttributeError("DNS: Unknown socket source")
 
-                        expired_queries = self._sanitize_active_pool(self._routed_pool)
-                        expired_queries += self._sanitize_active_pool(self._regular_pool)
+                        ready_responses.extend(self._answer_stale())
+                        self._expire_queries()
+                        self._upstream.retransmit(self._now)
 
-                        if expired_queries:
-                            self._logger.warning(f"DNS: {expired_queries} queries expired")
+                        if self._stats_timeout() == 0.0:
+                            self._log_stats()
 
-                        queued_queries = self._process_queued_queries()
+                        if self._prefetch_timeout() == 0.0:
+                            self._prefetch()
+
+                        queued_queries = self._process_queued_queries(ready_responses)
 
                         if queued_queries:
                             self._logger.warning(f"DNS: {queued_queries} remaining queries")
 
-                        self._sanitize_free_pool(self._free_pool)
-
-                        self._parse_regular_responses(ready_responses)
-
-                        if routed_responses:
-                            dns_data_messages = self._parse_routed_responses(routed_responses)
-
-                            ipv4_updates, ipv6_updates = self._update_routes(dns_data_messages)
-
-                            ready_responses.extend(routed_responses)
-
-                            if self._ipv4_gateway is not None:
-                                self._process_ipv4_updates(netlink, ipv4_updates)
-
-                            if self._ipv6_gateway is not None:
-                                self._process_ipv6_updates(netlink, ipv6_updates)
+                        ready_responses.extend(self._process_responses(netlink, regular_responses, routed_responses))
 
                         if ready_responses:
                             self._send_responses(ready_responses, udp)
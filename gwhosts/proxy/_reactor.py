@@ -0,0 +1,68 @@
+import selectors
+from enum import Enum
+from typing import Dict, List, Optional, Type
+
+from ._types import Selectable
+
+
+class ReactorBackend(Enum):
+    """I/O multiplexing backends
+    :param SELECT: select(2), limited by FD_SETSIZE
+    :param POLL: poll(2)
+    :param EPOLL: epoll(7), the wakeup cost does not depend on the number of registered sockets
+    """
+
+    SELECT: str = "select"
+    POLL: str = "poll"
+    EPOLL: str = "epoll"
+
+
+_SELECTORS: Dict[str, Type[selectors.BaseSelector]] = {
+    ReactorBackend.SELECT.value: selectors.SelectSelector,
+    ReactorBackend.POLL.value: getattr(selectors, "PollSelector", selectors.DefaultSelector),
+    ReactorBackend.EPOLL.value: getattr(selectors, "EpollSelector", selectors.DefaultSelector),
+}
+
+
+class Reactor:
+    """Readiness notifier for a persistent set of sockets
+
+    Sockets are registered once and stay registered until they are unregistered,
+    so a wakeup does not re-submit the whole set of sockets to the kernel.
+    """
+
+    def __init__(self, backend: ReactorBackend = ReactorBackend.EPOLL) -> None:
+        self._selector: selectors.BaseSelector = _SELECTORS[backend.value]()
+
+    def __enter__(self) -> "Reactor":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self._selector.get_map())
+
+    def __contains__(self, fileobj: Selectable) -> bool:
+        return fileobj.fileno() in self._selector.get_map()
+
+    @staticmethod
+    def _events(writable: bool) -> int:
+        return selectors.EVENT_READ | selectors.EVENT_WRITE if writable else selectors.EVENT_READ
+
+    def register(self, fileobj: Selectable, writable: bool = False) -> None:
+        """:param writable: Report the object when it is ready for writing too"""
+        self._selector.register(fileobj, self._events(writable))
+
+    def modify(self, fileobj: Selectable, writable: bool) -> None:
+        self._selector.modify(fileobj, self._events(writable))
+
+    def unregister(self, fileobj: Selectable) -> None:
+        self._selector.unregister(fileobj)
+
+    def select(self, timeout: Optional[float] = None) -> List[Selectable]:
+        """:return: Registered objects that are ready for reading, or for writing if they are registered for it"""
+        return [key.fileobj for key, events in self._selector.select(timeout)]
+
+    def close(self) -> None:
+        self._selector.close()
@@ -0,0 +1,149 @@
+from random import choices
+from socket import AF_INET, AF_UNSPEC, SOCK_DGRAM, getaddrinfo
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from ..network import Address
+
+# Smoothing factors of RFC 6298
+_RTT_ALPHA: float = 1 / 8
+_RTT_BETA: float = 1 / 4
+_LOSS_ALPHA: float = 1 / 8
+# Assumed RTT of a resolver that has not answered yet, and the lower bound of measured ones (the clock is coarse)
+_INITIAL_RTT: float = 0.1
+_MIN_RTT: float = 0.001
+_MIN_WEIGHT: float = 0.01
+
+
+def _resolve(addr: Address) -> Tuple[int, Address]:
+    """:return: Address family and numeric address of the host (IPv4 is preferred),
+        the responses are matched with the address they come from
+    :raises OSError: The host is not resolved
+    """
+    family, *_, sockaddr = min(
+        getaddrinfo(addr.host, addr.port, AF_UNSPEC, SOCK_DGRAM),
+        key=lambda info: info[0] != AF_INET,
+    )
+
+    return family, Address(*sockaddr[:2])
+
+
+class Resolver:
+    """Health of an upstream resolver
+
+    :param addr: Resolver address, a hostname is resolved once
+    """
+
+    def __init__(self, addr: Address) -> None:
+        self.family, self.addr = _resolve(addr)
+        self.srtt: float = _INITIAL_RTT
+        self.rttvar: float = _INITIAL_RTT / 2
+        self.loss: float = 0.0
+        self.failures: int = 0
+        self.sent: int = 0
+        self.answered: int = 0
+        self.timeouts: int = 0
+        self.ejected_until: float = float("-inf")
+
+    @property
+    def weight(self) -> float:
+        """:return: Selection weight, inversely proportional to the smoothed RTT and reduced by the loss rate"""
+        return max(1.0 - self.loss, _MIN_WEIGHT) / self.srtt
+
+    @property
+    def rto(self) -> float:
+        """:return: Time after which the answer is unlikely to come, SRTT + 4 * RTTVAR (RFC 6298)"""
+        return self.srtt + 4 * self.rttvar
+
+    def on_answer(self, rtt: float) -> None:
+        rtt = max(rtt, _MIN_RTT)
+
+        if self.answered:
+            self.rttvar += _RTT_BETA * (abs(self.srtt - rtt) - self.rttvar)
+            self.srtt += _RTT_ALPHA * (rtt - self.srtt)
+
+        else:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+
+        self.loss -= _LOSS_ALPHA * self.loss
+        self.failures = 0
+        self.answered += 1
+
+    def on_timeout(self) -> None:
+        self.loss += _LOSS_ALPHA * (1.0 - self.loss)
+        self.failures += 1
+        self.timeouts += 1
+
+
+class ResolverPool:
+    """Upstream resolvers with RTT-weighted selection
+
+    A resolver that has not answered `max_failures` queries in a row is ejected for `eject_seconds`
+    since the last failed query was sent. When all resolvers are ejected, the one that comes back first is used.
+
+    :param addrs: Resolver addresses
+    :param max_failures: Number of consecutive timeouts that eject a resolver
+    :param eject_seconds: Ejection duration
+    """
+
+    def __init__(self, addrs: Sequence[Address], max_failures: int = 3, eject_seconds: float = 30.0) -> None:
+        if not addrs:
+            raise ValueError("DNS: at least one upstream resolver is required")
+
+        self._resolvers: List[Resolver] = [Resolver(_addr) for _addr in addrs]
+        self._max_failures = max_failures
+        self._eject_seconds = eject_seconds
+
+    def __len__(self) -> int:
+        return len(self._resolvers)
+
+    def __iter__(self) -> Iterator[Resolver]:
+        return iter(self._resolvers)
+
+    def choose(self, now: float, exclude: Optional[Resolver] = None, family: Optional[int] = None) -> Resolver:
+        """:return: One of the healthy resolvers, the faster ones are chosen more often
+
+        :param exclude: Resolver to avoid if there are other healthy ones
+        :param family: Address family of the resolvers to choose from, any by default
+        """
+        resolvers = self._resolvers
+
+        if family is not None:
+            resolvers = [_resolver for _resolver in resolvers if _resolver.family == family]
+
+        if len(resolvers) == 1:
+            return resolvers[0]
+
+        healthy = [_resolver for _resolver in resolvers if _resolver.ejected_until <= now and _resolver is not exclude]
+
+        if not healthy and exclude is not None and exclude.ejected_until <= now:
+            return exclude
+
+        if not healthy:
+            return min(resolvers, key=lambda _resolver: _resolver.ejected_until)
+
+        if len(healthy) == 1:
+            return healthy[0]
+
+        return choices(healthy, weights=[_resolver.weight for _resolver in healthy])[0]
+
+    def timeout(self, resolver: Resolver, sent: float) -> None:
+        """Account a query sent to the resolver at `sent` that has not been answered"""
+        resolver.on_timeout()
+
+        if resolver.failures >= self._max_failures:
+            resolver.ejected_until = max(resolver.ejected_until, sent + self._eject_seconds)
+
+    def stats(self, now: float) -> Dict[str, float]:
+        stats: Dict[str, float] = {}
+
+        for resolver in self._resolvers:
+            name = f"upstream[{resolver.addr.host}:{resolver.addr.port}]"
+            stats[f"{name}.srtt_ms"] = round(resolver.srtt * 1000, 1)
+            stats[f"{name}.loss"] = round(resolver.loss, 3)
+            stats[f"{name}.sent"] = resolver.sent
+            stats[f"{name}.answered"] = resolver.answered
+            stats[f"{name}.timeouts"] = resolver.timeouts
+            stats[f"{name}.ejected"] = int(resolver.ejected_until > now)
+
+        return stats
@@ -0,0 +1,254 @@
+from logging import Logger
+from socket import AF_INET, AF_INET6
+from typing import Callable, Dict, Set, Tuple, Optional
+
+from ._types import LinkState, RTMEvent
+from ..network import IPAddress, IPBinary, Network, NetworkSize, SubnetAggregator
+from ..network.ipv4 import (
+    ipv4_str_to_int,
+    ipv4_network_size_to_netmask,
+    ipv4_network_to_str,
+    IPV4_NETMASK_MIN,
+)
+from ..network.ipv6 import (
+    ipv6_str_to_int,
+    ipv6_network_size_to_netmask,
+    ipv6_network_to_str,
+    IPV6_NETMASK_MIN,
+)
+from ..routes import Netlink
+
+
+class BaseRouter:
+    """Aggregated subnets state and kernel routes programming"""
+
+    def __init__(
+        self,
+        logger: Logger,
+        ipv4_ifname: Optional[str] = None,
+        ipv4_gateway: Optional[IPAddress] = None,
+        ipv6_ifname: Optional[str] = None,
+        ipv6_gateway: Optional[IPAddress] = None,
+    ) -> None:
+        self._ipv4_ifname = ipv4_ifname
+        self._ipv4_gateway = ipv4_gateway
+        self._ipv6_ifname = ipv6_ifname
+        self._ipv6_gateway = ipv6_gateway
+        self._logger: Logger = logger
+        self._ipv4_addresses: Set[IPAddress] = set()
+        self._ipv4_subnets = SubnetAggregator(IPV4_NETMASK_MIN)
+        self._ipv6_addresses: Set[IPAddress] = set()
+        self._ipv6_subnets = SubnetAggregator(IPV6_NETMASK_MIN)
+        self._netlink_event_handlers: Dict[RTMEvent, Callable] = {
+            RTMEvent.NEW_ROUTE.value: self._process_rtm_route,
+            RTMEvent.DEL_ROUTE.value: self._process_rtm_route,
+            RTMEvent.NEW_LINK.value: self._process_rtm_newlink,
+        }
+        rtm_route_handlers = (
+            (RTMEvent.NEW_ROUTE.value, AF_INET, ipv4_gateway, self._ipv4_process_rtm_new_route),
+            (RTMEvent.NEW_ROUTE.value, AF_INET6, ipv6_gateway, self._ipv6_process_rtm_new_route),
+            (RTMEvent.DEL_ROUTE.value, AF_INET, ipv4_gateway, self._ipv4_process_rtm_del_route),
+            (RTMEvent.DEL_ROUTE.value, AF_INET6, ipv6_gateway, self._ipv6_process_rtm_del_route),
+        )
+        self._rtm_route_handlers: Dict[Tuple[str, int, str], Callable] = {
+            (_event, _family, _gateway): _handler
+            for _event, _family, _gateway, _handler in rtm_route_handlers
+            if _gateway is not None
+        }
+        rtm_newlink_handlers = (
+            (ipv4_ifname, LinkState.UP.value, self._process_rtm_newlink_up),
+            (ipv4_ifname, LinkState.DOWN.value, self._process_rtm_newlink_down),
+            (ipv6_ifname, LinkState.UP.value, self._process_rtm_newlink_up),
+            (ipv6_ifname, LinkState.DOWN.value, self._process_rtm_newlink_down),
+        )
+        self._rtm_newlink_handlers: Dict[Tuple[str, str], Callable] = {
+            (_ifname, _state): _handler for _ifname, _state, _handler in rtm_newlink_handlers if _ifname is not None
+        }
+        self._preserved_ifnames: Set[str] = set()
+        self._netlink_to_network = {
+            AF_INET: self._ipv4_netlink_to_network,
+            AF_INET6: self._ipv6_netlink_to_network,
+        }
+
+    @property
+    def route_stats(self) -> Dict[str, float]:
+        return {
+            **{f"ipv4_{_name}": _value for _name, _value in self._ipv4_subnets.stats.items()},
+            **{f"ipv6_{_name}": _value for _name, _value in self._ipv6_subnets.stats.items()},
+        }
+
+    @property
+    def ipv4_subnets(self) -> Set[Network]:
+        return self._ipv4_subnets.subnets
+
+    def _ipv4_in_subnets(self, address: IPBinary) -> bool:
+        return self._ipv4_subnets.covers(address)
+
+    def _ipv4_update_subnets(self, addresses: Set[Network]) -> Dict[Network, bool]:
+        return self._ipv4_subnets.update(addresses)
+
+    @property
+    def ipv6_subnets(self) -> Set[Network]:
+        return self._ipv6_subnets.subnets
+
+    def _ipv6_in_subnets(self, address: IPBinary) -> bool:
+        return self._ipv6_subnets.covers(address)
+
+    def _ipv6_update_subnets(self, addresses: Set[Network]) -> Dict[Network, bool]:
+        return self._ipv6_subnets.update(addresses)
+
+    def _update_subnets(
+        self,
+        ipv4_addresses: Set[Network],
+        ipv6_addresses: Set[Network],
+    ) -> Tuple[Dict[Network, bool], Dict[Network, bool]]:
+        return (
+            self._ipv4_update_subnets(ipv4_addresses) if ipv4_addresses else {},
+            self._ipv6_update_subnets(ipv6_addresses) if ipv6_addresses else {},
+        )
+
+    @staticmethod
+    def _ipv4_netlink_to_network(address: IPAddress, length: NetworkSize) -> Network:
+        return Network(
+            address=ipv4_str_to_int(address),
+            mask=ipv4_network_size_to_netmask(length),
+        )
+
+    def _ipv4_process_rtm_new_route(self, network: Network) -> None:
+        """New IPv4 route is added"""
+        self._ipv4_subnets.add(network)
+        self._logger.info(f"DNS: network added {ipv4_network_to_str(network)}")
+
+    def _ipv4_process_rtm_del_route(self, network: Network) -> None:
+        """An existing IPv4 route is deleted"""
+        if self._ipv4_ifname in self._preserved_ifnames:
+            self._logger.info(f"DNS: network preserved {ipv4_network_to_str(network)}")
+            return
+
+        try:
+            self._ipv4_subnets.remove(network)
+
+        except KeyError as e:
+            self._logger.exception(e)
+            self._logger.info(f"DNS: network does not exists {ipv4_network_to_str(network)}")
+
+        else:
+            self._logger.info(f"DNS: network deleted {ipv4_network_to_str(network)}")
+
+    @staticmethod
+    def _ipv6_netlink_to_network(address: IPAddress, length: NetworkSize) -> Network:
+        return Network(
+            address=ipv6_str_to_int(address),
+            mask=ipv6_network_size_to_netmask(length),
+        )
+
+    def _ipv6_process_rtm_new_route(self, network: Network) -> None:
+        """New IPv6 route is added"""
+        self._ipv6_subnets.add(network)
+        self._logger.info(f"DNS: network added {ipv6_network_to_str(network)}")
+
+    def _ipv6_process_rtm_del_route(self, network: Network) -> None:
+        """An IPv6 existing route is deleted"""
+        if self._ipv6_ifname in self._preserved_ifnames:
+            self._logger.info(f"DNS: network preserved {ipv6_network_to_str(network)}")
+            return
+
+        try:
+            self._ipv6_subnets.remove(network)
+
+        except KeyError as e:
+            self._logger.exception(e)
+            self._logger.info(f"DNS: network does not exists {ipv6_network_to_str(network)}")
+
+        else:
+            self._logger.info(f"DNS: network deleted {ipv6_network_to_str(network)}")
+
+    def _process_rtm_newlink(self, netlink: Netlink, message: dict) -> None:
+        attrs = dict(message["attrs"])
+        ifname = attrs["IFLA_IFNAME"]
+        state = message["state"]
+        key = ifname, state
+
+        if key in self._rtm_newlink_handlers:
+            self._rtm_newlink_handlers[key](netlink, ifname)
+
+    def _process_rtm_newlink_up(self, netlink: Netlink, ifname: str) -> None:
+        if ifname not in self._preserved_ifnames:
+            return
+
+        self._preserved_ifnames.remove(ifname)
+
+        if ifname == self._ipv4_ifname:
+            self._logger.info(f"DNS: restoring IPv4 routes via {self._ipv4_gateway}...")
+
+            for _network in self._ipv4_subnets:
+                netlink.ipv4_add_route(_network, self._ipv4_gateway)
+
+        if ifname == self._ipv6_ifname:
+            self._logger.info(f"DNS: restoring IPv6 routes via {self._ipv6_gateway}...")
+
+            for _network in self._ipv6_subnets:
+                netlink.ipv6_add_route(_network, self._ipv6_gateway)
+
+    def _process_rtm_newlink_down(self, netlink: Netlink, ifname: str) -> None:
+        self._preserved_ifnames.add(ifname)
+        self._logger.info(f"DNS: interface preserved {ifname}")
+
+    def _process_rtm_route(self, netlink: Netlink, message: dict) -> None:
+        attrs = dict(message["attrs"])
+
+        if "RTA_GATEWAY" in attrs:
+            event = message["event"]
+            family = message["family"]
+            gateway = attrs["RTA_GATEWAY"]
+            key = event, family, gateway
+
+            if key in self._rtm_route_handlers:
+                network = self._netlink_to_network[family](
+                    address=attrs["RTA_DST"],
+                    length=message["dst_len"],
+                )
+                self._rtm_route_handlers[key](network)
+
+    def _process_netlink_message(self, netlink: Netlink, message: dict) -> None:
+        event = message["event"]
+
+        if event in self._netlink_event_handlers:
+            self._netlink_event_handlers[event](netlink, message)
+
+    def _process_ipv4_updates(self, netlink: Netlink, updates: Dict[Network, bool]) -> None:
+        for network, exist in updates.items():
+            if exist:
+                netlink.ipv4_add_route(network, self._ipv4_gateway)
+            else:
+                netlink.ipv4_del_route(network, self._ipv4_gateway)
+
+    def _process_ipv6_updates(self, netlink: Netlink, updates: Dict[Network, bool]) -> None:
+        for network, exist in updates.items():
+            if exist:
+                netlink.ipv6_add_route(network, self._ipv6_gateway)
+            else:
+                netlink.ipv6_del_route(network, self._ipv6_gateway)
+
+    def _load_routes(self, netlink: Netlink) -> None:
+        self._logger.info("DNS: loading existing IPv4 routes...")
+
+        for _message in netlink.get_routes(family=AF_INET):
+            self._process_netlink_message(netlink, _message)
+
+        self._logger.info("DNS: loading existing IPv6 routes...")
+
+        for _message in netlink.get_routes(family=AF_INET6):
+            self._process_netlink_message(netlink, _message)
+
+    def _program_routes(
+        self,
+        netlink: Netlink,
+        ipv4_updates: Dict[Network, bool],
+        ipv6_updates: Dict[Network, bool],
+    ) -> None:
+        if self._ipv4_gateway is not None:
+            self._process_ipv4_updates(netlink, ipv4_updates)
+
+        if self._ipv6_gateway is not None:
+            self._process_ipv6_updates(netlink, ipv6_updates)
@@ -0,0 +1,232 @@
+from heapq import heappop, heappush
+from itertools import count
+from random import getrandbits
+from struct import pack, unpack_from
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from ._budget import FDBudget
+from ._resolvers import ResolverPool
+from ._types import InFlightQuery
+from ..dns import key_query, truncate
+from ..network import Address, Datagram, StreamAddress, StreamConnection, TCPSocket
+
+_HEADER_SIZE: int = 12
+_PendingQuery = Tuple[InFlightQuery, List[InFlightQuery]]
+
+
+class TCPUpstream:
+    """Persistent TCP connections to the upstream resolvers for responses that do not fit into a UDP datagram
+
+    Queries are pipelined (RFC 7766): a connection carries many in-flight queries, responses are matched by ID
+    and may come in any order. Connections are opened on demand without blocking, reused while they have room
+    for more queries and closed after staying idle. The queries sent over a connection that is being established
+    wait for the connect to complete.
+
+    :param resolvers: Upstream resolvers
+    :param watch: Called with a connection once it is opened and whenever its output backlog may have changed
+    :param unwatch: Called with a connection right before it is closed
+    :param connect: Starts connecting a connection to the resolver address, StreamConnection.connect by default
+    :param max_connections: Maximum number of open connections
+    :param max_pipelined: In-flight queries per connection before another connection is opened
+    :param idle_timeout: Seconds after which a connection without in-flight queries is closed
+    :param connect_timeout: Seconds after which a connection that is not established yet is closed
+    :param budget: Open file descriptors accounting
+    """
+
+    def __init__(
+        self,
+        resolvers: ResolverPool,
+        watch: Callable[[StreamConnection], None],
+        unwatch: Callable[[StreamConnection], None],
+        connect: Optional[Callable[[StreamConnection, Address], None]] = None,
+        max_connections: int = 4,
+        max_pipelined: int = 64,
+        idle_timeout: float = 10.0,
+        connect_timeout: float = 1.0,
+        budget: Optional[FDBudget] = None,
+    ) -> None:
+        self._resolvers = resolvers
+        self._watch = watch
+        self._unwatch = unwatch
+        self._connect = StreamConnection.connect if connect is None else connect
+        self._max_connections = max_connections
+        self._max_pipelined = max_pipelined
+        self._idle_timeout = idle_timeout
+        self._connect_timeout = connect_timeout
+        self._budget = FDBudget() if budget is None else budget
+        self._connections: Dict[StreamConnection, Dict[int, _PendingQuery]] = {}
+        self._expiry: List[Tuple[float, int, StreamConnection, int, InFlightQuery]] = []
+        self._sequence = count()
+        self._forwarded: int = 0
+
+    def __len__(self) -> int:
+        return sum(len(_pending) for _pending in self._connections.values())
+
+    def __iter__(self) -> Iterator[StreamConnection]:
+        return iter(self._connections)
+
+    def __contains__(self, connection: object) -> bool:
+        return connection in self._connections
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        return {"tcp_upstream_connections": len(self._connections), "tcp_upstream_forwarded": self._forwarded}
+
+    def _open(self, now: float) -> StreamConnection:
+        resolver = self._resolvers.choose(now)
+        self._budget.acquire()
+        connection = StreamConnection(TCPSocket(resolver.family), StreamAddress(*resolver.addr), now)
+
+        try:
+            self._connect(connection, resolver.addr)
+
+        except OSError:
+            connection.close()
+            self._budget.release()
+            raise
+
+        self._connections[connection] = {}
+        self._watch(connection)
+
+        return connection
+
+    def _connection(self, now: float) -> StreamConnection:
+        """:return: The least loaded connection, a new one if all of them are loaded and there is room for it"""
+        connection = min(self._connections, key=lambda _connection: len(self._connections[_connection]), default=None)
+
+        if connection is None or (
+            len(self._connections[connection]) >= self._max_pipelined
+            and len(self._connections) < self._max_connections
+        ):
+            return self._open(now)
+
+        return connection
+
+    def _close(self, connection: StreamConnection) -> None:
+        self._unwatch(connection)
+        connection.close()
+        self._budget.release()
+        del self._connections[connection]
+
+    def abort(self, connection: StreamConnection) -> None:
+        """Close the connection that failed to be established, its in-flight queries are dropped"""
+        if connection in self._connections:
+            self._close(connection)
+
+    def close(self) -> None:
+        for connection in list(self._connections):
+            self._close(connection)
+
+        self._expiry.clear()
+
+    def send(self, key: bytes, queries: List[InFlightQuery], now: float) -> None:
+        """Forward the question of the key on behalf of the queries, the first one is the leader and the rest follow it
+
+        :raises OSError: The upstream is not reachable over TCP
+        """
+        connection = self._connection(now)
+        pending = self._connections[connection]
+        proxy_id = getrandbits(16)
+
+        while proxy_id in pending:
+            proxy_id = getrandbits(16)
+
+        try:
+            connection.send(key_query(key, proxy_id), now)
+
+        except OSError:
+            self._close(connection)
+            raise
+
+        self._watch(connection)
+        query, *followers = queries
+        pending[proxy_id] = (query, followers)
+        heappush(self._expiry, (query.time, next(self._sequence), connection, proxy_id, query))
+        self._forwarded += 1
+
+    def receive(
+        self, connection: StreamConnection, buffer: memoryview, now: float
+    ) -> List[Tuple[List[Datagram], InFlightQuery]]:
+        """Read the responses that are ready on the connection, the connection is closed if the upstream closed it
+
+        :param buffer: Reusable buffer the bytes are read into
+        :return: Responses addressed to the clients and the answered queries, the same as UpstreamChannel.match,
+            the response to the leader is in full
+        """
+        pending = self._connections[connection]
+
+        try:
+            connection.flush(now)
+            messages = connection.receive(buffer, now)
+
+        except OSError:
+            self._close(connection)
+            return []
+
+        self._watch(connection)
+        matched: List[Tuple[List[Datagram], InFlightQuery]] = []
+
+        for message in messages:
+            if len(message) < _HEADER_SIZE:
+                continue
+
+            entry = pending.pop(unpack_from("!H", message)[0], None)
+
+            if entry is None:
+                continue
+
+            query, followers = entry
+            payload = message[2:]
+            responses = [
+                Datagram(pack("!H", query.id) + payload, query.address),
+                *(
+                    Datagram(truncate(pack("!H", _query.id) + payload, _query.payload_size), _query.address)
+                    for _query in followers
+                ),
+            ]
+            matched.append((responses, query))
+
+        return matched
+
+    def _is_pending(self, connection: StreamConnection, proxy_id: int, query: InFlightQuery) -> bool:
+        entry = self._connections.get(connection, {}).get(proxy_id)
+
+        return entry is not None and entry[0] is query
+
+    @property
+    def oldest(self) -> Optional[float]:
+        """:return: Forwarding time of the oldest in-flight query, None if there are no in-flight queries"""
+        expiry = self._expiry
+
+        while expiry and not self._is_pending(*expiry[0][2:]):
+            heappop(expiry)
+
+        return expiry[0][0] if expiry else None
+
+    def expire(self, timestamp: float) -> int:
+        """Forget queries that were sent at or before the timestamp
+
+        :return: Number of expired queries
+        """
+        expiry = self._expiry
+        expired = 0
+
+        while expiry and expiry[0][0] <= timestamp:
+            _, _, connection, proxy_id, query = heappop(expiry)
+
+            if self._is_pending(connection, proxy_id, query):
+                _, followers = self._connections[connection].pop(proxy_id)
+                expired += 1 + len(followers)
+
+        return expired
+
+    def close_idle(self, now: float) -> None:
+        """Close the connections that were not established within the connect timeout and the idle ones
+
+        A connection is idle when it has no in-flight queries and was not active for the idle timeout.
+        """
+        for connection, pending in list(self._connections.items()):
+            if (connection.connecting and connection.last_active + self._connect_timeout <= now) or (
+                not pending and connection.last_active + self._idle_timeout <= now
+            ):
+                self._close(connection)
@@ -1,9 +1,9 @@
 from enum import Enum
 from socket import AF_INET, AF_INET6
-from typing import NamedTuple
+from typing import List, NamedTuple, Optional, Protocol
 
-from ..dns import DNSData
-from ..network import Address
+from ..dns import MIN_UDP_PAYLOAD_SIZE
+from ..network import Address, Datagram, IPBinary
 
 
 class RTMEvent(Enum):
@@ -23,6 +23,43 @@ class AddressFamily(Enum):
     AF_INET6: int = AF_INET6
 
 
-class DNSDataMessage(NamedTuple):
-    data: DNSData
-    address: Address
+class AnswerAddresses(NamedTuple):
+    """Addresses from the A and AAAA answers of a response
+    :param ipv4: IPv4 addresses
+    :param ipv6: IPv6 addresses
+    """
+
+    ipv4: List[IPBinary]
+    ipv6: List[IPBinary]
+
+
+class RoutedResponse(NamedTuple):
+    """Response to a query for a hostname from the proxying list
+    :param message: Upstream response in full, the routes are learned from it
+    :param response: Response fitted to the client's UDP payload size, None for a prefetched response
+    """
+
+    message: bytes
+    response: Optional[Datagram]
+
+
+class Selectable(Protocol):
+    def fileno(self) -> int: ...
+
+
+class InFlightQuery(NamedTuple):
+    """Query forwarded to the upstream resolver
+    :param id: Client's query ID
+    :param address: Client's address, None for queries made by the proxy itself
+    :param time: Time when the query was forwarded
+    :param routed: The query contains a hostname from the proxying list
+    :param key: Response cache key, None if the response is not cacheable
+    :param payload_size: UDP payload size the client can reassemble, larger responses are truncated
+    """
+
+    id: int
+    address: Optional[Address]
+    time: float
+    routed: bool
+    key: Optional[bytes] = None
+    payload_size: int = MIN_UDP_PAYLOAD_SIZE
@@ -0,0 +1,400 @@
+from heapq import heappop, heappush
+from itertools import count
+from random import getrandbits
+from struct import pack, unpack_from
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from ._budget import FDBudget
+from ._resolvers import Resolver, ResolverPool
+from ._tcp import TCPUpstream
+from ._types import InFlightQuery
+from ..dns import Flags, question_matches, truncate
+from ..network import Address, Datagram, UDPSocket
+
+_HEADER_SIZE: int = 12
+_ID_SPACE: int = 1 << 16
+
+
+class _Forwarded(NamedTuple):
+    """
+    :param query: Client's query
+    :param resolver: Resolver the query was sent to
+    :param data: Query as it was sent
+    :param hedge: Resolver the query was retransmitted to
+    :param hedged: Time when the query was retransmitted
+    :param detached: The clients are answered already, the response only refreshes the cache
+    """
+
+    query: InFlightQuery
+    resolver: Resolver
+    data: bytes
+    hedge: Optional[Resolver] = None
+    hedged: float = 0.0
+    detached: bool = False
+
+
+class RetryBudget:
+    """Caps retransmissions at a ratio of forwarded queries, so retries cannot amplify the load during an outage
+
+    :param ratio: Retransmissions allowed per forwarded query
+    :param burst: Maximum number of retransmissions saved up
+    """
+
+    def __init__(self, ratio: float = 0.1, burst: float = 10.0) -> None:
+        self._ratio = ratio
+        self._burst = burst
+        self._tokens: float = burst
+
+    def deposit(self) -> None:
+        self._tokens = min(self._tokens + self._ratio, self._burst)
+
+    def withdraw(self) -> bool:
+        """:return: A retransmission is allowed"""
+        if self._tokens < 1.0:
+            return False
+
+        self._tokens -= 1.0
+        return True
+
+
+class UpstreamChannel:
+    """Forwards queries to the upstream resolvers through a fixed set of long-lived sockets
+
+    The DNS ID of every forwarded query is replaced with a proxy-owned one, so responses
+    are matched with the queries by (socket, ID) and the client's ID is restored afterwards.
+    Queries are also kept in a min-heap ordered by the forwarding time, so expiry only touches
+    the queries that are due, answered queries are dropped from the heap lazily.
+    Queries with the same question as an in-flight one are not forwarded, they follow the in-flight
+    query and receive its response with their own IDs.
+    Every query goes to a resolver chosen by the pool, answers and timeouts are accounted to it.
+    A query that is not answered within the resolver's RTO is retransmitted once, to another resolver if there is
+    a healthy one, and the first answer wins.
+    Truncated responses to cacheable queries are re-queried over TCP when the TCP upstream is configured.
+    IPv4 and IPv6 resolvers are served by separate sets of sockets, a retransmission goes through the same socket,
+    so it stays within the family of the resolver.
+
+    :param resolvers: Upstream resolvers
+    :param sockets_count: Number of upstream sockets per address family of the resolvers
+    :param max_in_flight: Maximum number of in-flight queries per socket (half of the ID space by default,
+        so picking a random free ID takes a couple of attempts at most)
+    :param budget: Open file descriptors accounting, fewer sockets are opened when the headroom is low
+    :param retry_budget: Retransmissions budget, None disables retransmissions
+    :param min_retransmit_delay: Lower bound of the retransmission delay in seconds
+    :param tcp: Connections the truncated responses are re-queried over, None passes them to the clients
+    """
+
+    def __init__(
+        self,
+        resolvers: ResolverPool,
+        sockets_count: int = 4,
+        max_in_flight: int = _ID_SPACE // 2,
+        budget: Optional[FDBudget] = None,
+        retry_budget: Optional[RetryBudget] = None,
+        min_retransmit_delay: float = 0.01,
+        tcp: Optional[TCPUpstream] = None,
+    ) -> None:
+        self._resolvers = resolvers
+        self._budget = FDBudget() if budget is None else budget
+        self._sockets_count = sockets_count
+        self._max_in_flight = max_in_flight
+        self._sockets: List[UDPSocket] = []
+        self._retry_budget = retry_budget
+        self._min_retransmit_delay = min_retransmit_delay
+        self._in_flight: Dict[Tuple[UDPSocket, int], _Forwarded] = {}
+        self._in_flight_count: Dict[UDPSocket, int] = {}
+        self._next: int = 0
+        self._expiry: List[Tuple[float, int, UDPSocket, int, InFlightQuery]] = []
+        self._sequence = count()
+        self._leaders: Dict[bytes, Tuple[UDPSocket, int]] = {}
+        self._followers: Dict[Tuple[UDPSocket, int], List[InFlightQuery]] = {}
+        self._coalesced: int = 0
+        self._retransmits: List[Tuple[float, int, UDPSocket, int, InFlightQuery]] = []
+        self._retransmitted: int = 0
+        self._retries_throttled: int = 0
+        self._tcp = tcp
+
+    def __enter__(self) -> "UpstreamChannel":
+        self.open()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        """:return: Number of queries forwarded and not answered yet"""
+        return len(self._in_flight)
+
+    def __contains__(self, _socket: object) -> bool:
+        return _socket in self._in_flight_count
+
+    def __iter__(self) -> Iterator[UDPSocket]:
+        return iter(self._sockets)
+
+    @property
+    def capacity(self) -> int:
+        """:return: Number of queries that can be forwarded right now"""
+        return self._max_in_flight * len(self._sockets) - len(self._in_flight)
+
+    @property
+    def resolvers(self) -> ResolverPool:
+        return self._resolvers
+
+    @property
+    def coalesced(self) -> int:
+        """:return: Number of queries that followed an in-flight query with the same question"""
+        return self._coalesced
+
+    @property
+    def retransmitted(self) -> int:
+        return self._retransmitted
+
+    @property
+    def retries_throttled(self) -> int:
+        """:return: Number of retransmissions denied by the retry budget"""
+        return self._retries_throttled
+
+    def open(self) -> None:
+        families = sorted({_resolver.family for _resolver in self._resolvers})
+        sockets_count = min(self._sockets_count, self._budget.headroom // len(families))
+
+        if not sockets_count:
+            raise OverflowError("DNS: open files limit is reached")
+
+        for family in families:
+            for _ in range(sockets_count):
+                self._budget.acquire()
+                _socket = UDPSocket(family)
+                _socket.setblocking(False)
+                self._sockets.append(_socket)
+                self._in_flight_count[_socket] = 0
+
+    def close(self) -> None:
+        while self._sockets:
+            self._sockets.pop().close()
+            self._budget.release()
+
+        self._in_flight.clear()
+        self._in_flight_count.clear()
+        self._expiry.clear()
+        self._retransmits.clear()
+        self._leaders.clear()
+        self._followers.clear()
+
+    def pending(self, key: bytes) -> bool:
+        """:return: A query with the key is forwarded and not answered yet"""
+        return key in self._leaders
+
+    def overdue(self, key: bytes) -> bool:
+        """:return: A query with the key is forwarded and its clients are answered without waiting for it"""
+        leader = self._leaders.get(key)
+
+        return leader is not None and self._in_flight[leader].detached
+
+    def detach(self, query: InFlightQuery) -> List[InFlightQuery]:
+        """Stop waiting for the upstream on behalf of the clients, its response will only refresh the cache
+
+        :return: The query and its followers, nothing if the query is not pending or detached already
+        """
+        leader = None if query.key is None else self._leaders.get(query.key)
+
+        if leader is None:
+            return []
+
+        forwarded = self._in_flight[leader]
+
+        if forwarded.query is not query or forwarded.detached:
+            return []
+
+        self._in_flight[leader] = forwarded._replace(detached=True)
+
+        return [query, *self._followers.pop(leader, [])]
+
+    def _next_socket(self, family: int) -> UDPSocket:
+        for _ in range(len(self._sockets)):
+            _socket = self._sockets[self._next]
+            self._next = (self._next + 1) % len(self._sockets)
+
+            if _socket.family == family and self._in_flight_count[_socket] < self._max_in_flight:
+                return _socket
+
+        raise OverflowError("DNS: no upstream capacity left")
+
+    def _next_id(self, _socket: UDPSocket) -> int:
+        while True:
+            proxy_id = getrandbits(16)
+
+            if (_socket, proxy_id) not in self._in_flight:
+                return proxy_id
+
+    def send(self, data: bytes, query: InFlightQuery) -> None:
+        """Forward a query on behalf of the client or attach it to the in-flight query with the same key"""
+        leader = None if query.key is None else self._leaders.get(query.key)
+
+        if leader is not None:
+            self._followers.setdefault(leader, []).append(query)
+            self._coalesced += 1
+            return
+
+        resolver = self._resolvers.choose(query.time)
+        _socket = self._next_socket(resolver.family)
+        proxy_id = self._next_id(_socket)
+        data = pack("!H", proxy_id) + data[2:]
+
+        _socket.sendto(data, resolver.addr)
+
+        resolver.sent += 1
+        self._in_flight[_socket, proxy_id] = _Forwarded(query, resolver, data)
+        self._in_flight_count[_socket] += 1
+        heappush(self._expiry, (query.time, next(self._sequence), _socket, proxy_id, query))
+
+        if self._retry_budget is not None:
+            self._retry_budget.deposit()
+            retransmit_at = query.time + max(resolver.rto, self._min_retransmit_delay)
+            heappush(self._retransmits, (retransmit_at, next(self._sequence), _socket, proxy_id, query))
+
+        if query.key is not None:
+            self._leaders[query.key] = (_socket, proxy_id)
+
+    def _pop(self, _socket: UDPSocket, proxy_id: int) -> Tuple[_Forwarded, List[InFlightQuery]]:
+        """:return: Forwarded query and its followers"""
+        forwarded = self._in_flight.pop((_socket, proxy_id))
+        self._in_flight_count[_socket] -= 1
+
+        if forwarded.query.key is not None:
+            del self._leaders[forwarded.query.key]
+
+        return forwarded, self._followers.pop((_socket, proxy_id), [])
+
+    def match(
+        self,
+        _socket: UDPSocket,
+        data: bytes,
+        addr: Address,
+        now: float,
+    ) -> Optional[Tuple[List[Datagram], InFlightQuery]]:
+        """Match a response received from the socket with the in-flight query
+
+        :param now: Time when the response was received
+        :return: Responses addressed to the client and the followers (the client's one goes first) and the query,
+            None for unexpected, late or spoofed responses and for the ones re-queried over TCP.
+            A detached query is returned without the client address.
+            The response to the client is returned in full to be cached and parsed, the responses to the followers
+            that do not fit their UDP payload sizes are truncated.
+        """
+        if len(data) < _HEADER_SIZE:
+            return None
+
+        proxy_id = unpack_from("!H", data)[0]
+        forwarded = self._in_flight.get((_socket, proxy_id))
+
+        # With a few long-lived sockets the source port does not vary, so a spoofer has to guess the question too
+        if forwarded is None or not question_matches(forwarded.data, data):
+            return None
+
+        if forwarded.resolver.addr == addr:
+            forwarded.resolver.on_answer(now - forwarded.query.time)
+
+        elif forwarded.hedge is not None and forwarded.hedge.addr == addr:
+            forwarded.hedge.on_answer(now - forwarded.hedged)
+
+        else:
+            return None
+
+        query = forwarded.query._replace(address=None) if forwarded.detached else forwarded.query
+        _, followers = self._pop(_socket, proxy_id)
+
+        if self._tcp is not None and query.key is not None and unpack_from("!H", data, 2)[0] & Flags.TC.value:
+            try:
+                self._tcp.send(query.key, [query, *followers], now)
+                return None
+
+            except OSError:
+                pass
+
+        payload = data[2:]
+
+        return [
+            Datagram(pack("!H", query.id) + payload, query.address),
+            *(
+                Datagram(truncate(pack("!H", _query.id) + payload, _query.payload_size), _query.address)
+                for _query in followers
+            ),
+        ], query
+
+    def _is_pending(self, _socket: UDPSocket, proxy_id: int, query: InFlightQuery) -> bool:
+        forwarded = self._in_flight.get((_socket, proxy_id))
+
+        return forwarded is not None and forwarded.query is query
+
+    @property
+    def oldest(self) -> Optional[float]:
+        """:return: Forwarding time of the oldest in-flight query, None if there are no in-flight queries"""
+        expiry = self._expiry
+
+        while expiry and not self._is_pending(*expiry[0][2:]):
+            heappop(expiry)
+
+        return expiry[0][0] if expiry else None
+
+    def expire(self, timestamp: float) -> int:
+        """Forget queries that were sent at or before the timestamp
+
+        :return: Number of expired queries
+        """
+        expiry = self._expiry
+        expired = 0
+
+        while expiry and expiry[0][0] <= timestamp:
+            _, _, _socket, proxy_id, query = heappop(expiry)
+
+            if self._is_pending(_socket, proxy_id, query):
+                forwarded, followers = self._pop(_socket, proxy_id)
+                self._resolvers.timeout(forwarded.resolver, query.time)
+
+                if forwarded.hedge is not None and forwarded.hedge is not forwarded.resolver:
+                    self._resolvers.timeout(forwarded.hedge, forwarded.hedged)
+
+                expired += 1 + len(followers)
+
+        return expired
+
+    @property
+    def next_retransmit(self) -> Optional[float]:
+        """:return: Time of the earliest retransmission, None if there is nothing to retransmit"""
+        retransmits = self._retransmits
+
+        while retransmits and not self._is_pending(*retransmits[0][2:]):
+            heappop(retransmits)
+
+        return retransmits[0][0] if retransmits else None
+
+    def retransmit(self, now: float) -> int:
+        """Retransmit the queries that are not answered within the RTO of their resolvers
+
+        :return: Number of retransmitted queries
+        """
+        retransmits = self._retransmits
+        retransmitted = 0
+
+        while retransmits and retransmits[0][0] <= now:
+            _, _, _socket, proxy_id, query = heappop(retransmits)
+
+            if not self._is_pending(_socket, proxy_id, query):
+                continue
+
+            if not self._retry_budget.withdraw():
+                self._retries_throttled += 1
+                continue
+
+            forwarded = self._in_flight[_socket, proxy_id]
+            hedge = self._resolvers.choose(now, exclude=forwarded.resolver, family=_socket.family)
+
+            _socket.sendto(forwarded.data, hedge.addr)
+
+            hedge.sent += 1
+            self._in_flight[_socket, proxy_id] = forwarded._replace(hedge=hedge, hedged=now)
+            retransmitted += 1
+
+        self._retransmitted += retransmitted
+
+        return retransmitted
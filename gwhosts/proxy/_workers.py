@@ -0,0 +1,133 @@
+import ctypes
+from multiprocessing import get_context
+from multiprocessing.connection import Connection
+from os import getpid, getppid
+from signal import SIGINT, SIGTERM, signal
+from typing import Callable, List, NoReturn, Set
+
+from ._base import BaseDNSProxy
+from ._reactor import Reactor, ReactorBackend
+from ._router import BaseRouter
+from ..network import Address, Network
+from ..routes import Netlink
+
+# prctl(2) option that delivers a signal to the process when its parent dies
+_PR_SET_PDEATHSIG: int = 1
+_libc = ctypes.CDLL(None, use_errno=True)
+
+
+class RouteOwner(BaseRouter):
+    """Programs routes on behalf of the worker processes
+
+    Workers send the addresses learned from routed responses over pipes,
+    the owner keeps the only netlink socket and the aggregated subnets,
+    so routing decisions do not depend on which worker answered a query.
+    """
+
+    def __init__(self, *args, reactor: ReactorBackend = ReactorBackend.EPOLL, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._reactor_backend = reactor
+
+    def _learn_addresses(self, netlink: Netlink, pipe: Connection) -> None:
+        ipv4_addresses: Set[Network] = set()
+        ipv6_addresses: Set[Network] = set()
+
+        try:
+            while pipe.poll():
+                _ipv4_addresses, _ipv6_addresses = pipe.recv()
+                ipv4_addresses.update(_net for _net in _ipv4_addresses if not self._ipv4_in_subnets(_net.address))
+                ipv6_addresses.update(_net for _net in _ipv6_addresses if not self._ipv6_in_subnets(_net.address))
+
+        finally:
+            self._program_routes(netlink, *self._update_subnets(ipv4_addresses, ipv6_addresses))
+
+    def serve(self, pipes: List[Connection]) -> None:
+        """Serve the workers until all of them exit"""
+        with Reactor(self._reactor_backend) as reactor, Netlink() as netlink:
+            netlink.bind()
+            reactor.register(netlink)
+            self._load_routes(netlink)
+
+            for pipe in pipes:
+                reactor.register(pipe)
+
+            self._logger.info(f"DNS: programming routes for {len(pipes)} workers")
+
+            while len(reactor) > 1:
+                try:
+                    for _ready in reactor.select():
+                        if _ready is netlink:
+                            for _message in netlink.get():
+                                self._process_netlink_message(netlink, _message)
+
+                            continue
+
+                        try:
+                            self._learn_addresses(netlink, _ready)
+
+                        except EOFError:
+                            reactor.unregister(_ready)
+                            self._logger.error("DNS: worker exited")
+
+                except Exception as e:
+                    self._logger.exception(e)
+
+
+def _raise_exit(signum: int, frame: object) -> NoReturn:
+    """Turn a termination signal into an exception, so the workers are stopped on the way out"""
+    raise SystemExit(128 + signum)
+
+
+def _run_worker(proxy: BaseDNSProxy, addr: Address, owner_pid: int) -> None:
+    """Run the proxy until the owner dies, even if the owner is killed and has no chance to stop the workers"""
+    _libc.prctl(_PR_SET_PDEATHSIG, SIGTERM)
+
+    # The owner may have died before the parent death signal was armed
+    if getppid() != owner_pid:
+        return
+
+    proxy.listen(addr)
+
+
+def listen_with_workers(
+    factory: Callable[..., BaseDNSProxy],
+    owner: RouteOwner,
+    addr: Address,
+    workers: int,
+) -> None:
+    """Run worker processes listening at the same address with SO_REUSEPORT
+
+    The workers are stopped when the owner exits or receives SIGTERM or SIGINT,
+    and they exit on their own when the owner dies.
+
+    :param factory: Creates a proxy, accepts `reuse_port` and `route_pipe` keyword arguments
+    :param owner: Programs routes for all workers in the current process
+    :param addr: Listening address
+    :param workers: Number of worker processes
+    """
+    context = get_context("fork")
+    pipes: List[Connection] = []
+    processes = []
+    handlers = {_signum: signal(_signum, _raise_exit) for _signum in (SIGTERM, SIGINT)}
+
+    try:
+        for _ in range(workers):
+            reader, writer = context.Pipe(duplex=False)
+            proxy = factory(reuse_port=True, route_pipe=writer)
+            process = context.Process(target=_run_worker, args=(proxy, addr, getpid()), daemon=True)
+            process.start()
+            writer.close()
+
+            pipes.append(reader)
+            processes.append(process)
+
+        owner.serve(pipes)
+
+    finally:
+        # A repeated signal does not interrupt the cleanup, the workers die with the owner anyway
+        for _signum, _handler in handlers.items():
+            signal(_signum, _handler)
+
+        for process in processes:
+            process.terminate()
+            process.join()
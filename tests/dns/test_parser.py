@@ -1,7 +1,8 @@
 import pytest
 
 from gwhosts.dns import DNSData, Header, Question, Addition, QName, Answer, RRType, parse
-from gwhosts.dns import DNSParserInvalidLabelLengthError
+from gwhosts.dns import DNSParserError, DNSParserInvalidLabelLengthError
+from gwhosts.dns._exceptions import DNSParserRecursionError
 
 
 @pytest.mark.parametrize(
@@ -153,3 +154,38 @@ def test_parse_invalid_label_length_error(length: int) -> None:
         parse(raw)
 
     assert str(exception.value) == f"Invalid label length {length}"
+
+
+@pytest.mark.parametrize(
+    "raw",
+    (
+        b"\x68\x52\x81\x80\x00\x01",
+        b"\x68\x52\x81\x80\x00\x01\x00\x00\x00\x00\x00\x00\x03\x77\x77\x77\x07\x79\x6f\x75",
+        b"\x68\x52\x81\x80\x00\x01\x00\x00\x00\x00\x00\x00\x03\x77\x77\x77\x00\x00\x01",
+        b"\x68\x52\x81\x80\x00\x00\x00\x01\x00\x00\x00\x00\x00\x00\x01\x00\x01\x00\x00\x07\x8d\x00\x04\xac\xd9",
+    ),
+    ids=("header", "name", "question", "rr_data"),
+)
+def test_parse_truncated(raw: bytes) -> None:
+    with pytest.raises(DNSParserError):
+        parse(raw)
+
+
+def test_parse_pointers_loop() -> None:
+    raw = b"\x68\x52\x81\x80\x00\x01\x00\x00\x00\x00\x00\x00\x03\x77\x77\x77\xc0\x0c\x00\x01\x00\x01"
+
+    with pytest.raises(DNSParserRecursionError):
+        parse(raw)
+
+
+def test_parse_compressed_names() -> None:
+    raw = (
+        b"\x68\x52\x81\x80\x00\x01\x00\x02\x00\x00\x00\x00\x03\x77\x77\x77\x07\x79\x6f\x75\x74\x75\x62\x65\x03\x63\x6f"
+        b"\x6d\x00\x00\x01\x00\x01\xc0\x10\x00\x01\x00\x01\x00\x00\x07\x8d\x00\x04\xac\xd9\x13\x4e\x01\x6d\xc0\x10\x00"
+        b"\x01\x00\x01\x00\x00\x07\x8d\x00\x04\xac\xd9\x10\x4e"
+    )
+
+    assert [_answer.name for _answer in parse(raw).answers] == [
+        QName((b"youtube", b"com")),
+        QName((b"m", b"youtube", b"com")),
+    ]
@@ -0,0 +1,68 @@
+import pytest
+
+from gwhosts.dns import Addition, Answer, Authority, DNSData, DNSDataView, DNSParserError, Header, QName, Question
+from gwhosts.dns import RRType, parse, serialize
+
+_NAME = QName((b"example", b"com"))
+_RAW = serialize(
+    DNSData(
+        header=Header(id=1, flags=0b10000001_10000000, questions=1, answers=2, authorities=1, additions=1),
+        questions=[Question(name=_NAME, rr_type=RRType.A.value, rr_class=1)],
+        answers=[
+            Answer(
+                name=_NAME, rr_type=RRType.A.value, rr_class=1, ttl=300, rr_data_length=4, rr_data=b"\x0a\x00\x00\x01"
+            ),
+            Answer(
+                name=_NAME, rr_type=RRType.A.value, rr_class=1, ttl=300, rr_data_length=4, rr_data=b"\x0a\x00\x00\x02"
+            ),
+        ],
+        authorities=[
+            Authority(name=_NAME, rr_type=RRType.SOA.value, rr_class=1, ttl=60, rr_data_length=3, rr_data=b"soa"),
+        ],
+        additions=[
+            Addition(name=QName(()), rr_type=RRType.OPT.value, rr_class=1232, ttl=0, rr_data_length=0, rr_data=b""),
+        ],
+    )
+)
+
+
+def test_sections() -> None:
+    view = DNSDataView(_RAW)
+    data = parse(_RAW)
+
+    assert view.header == data.header
+    assert view.questions == data.questions
+    assert view.answers == data.answers
+    assert view.authorities == data.authorities
+    assert view.additions == data.additions
+    assert serialize(view) == _RAW
+
+
+def test_decode_on_access() -> None:
+    view = DNSDataView(_RAW)
+
+    assert view.additions == parse(_RAW).additions
+    assert view.additions is view.additions
+    assert view._questions is None
+    assert view._answers is None
+    assert view._authorities is None
+
+
+def test_malformed_header() -> None:
+    with pytest.raises(DNSParserError):
+        DNSDataView(_RAW[:6])
+
+
+@pytest.mark.parametrize(
+    ("raw", "section"),
+    (
+        (_RAW[:-1], "additions"),
+        (_RAW[:12] + b"\x07example\x50com\x00" + _RAW[25:], "answers"),
+        (_RAW[:12] + b"\xc0\x0c" + _RAW[25:], "questions"),
+    ),
+)
+def test_malformed_section(raw: bytes, section: str) -> None:
+    view = DNSDataView(raw)
+
+    with pytest.raises(DNSParserError):
+        getattr(view, section)
@@ -0,0 +1,187 @@
+from typing import Optional
+
+import pytest
+
+from gwhosts.dns import Addition, Answer, DNSData, DNSParserError, Header, QName, Question, RRType
+from gwhosts.dns import WireRecord, limit_udp_payload_size, question_key, scan, serialize, standard_question, truncate
+from gwhosts.dns import answer_addresses, question_matches, udp_payload_size
+
+_QUESTION = Question(name=QName((b"example", b"com")), rr_type=RRType.A.value, rr_class=1)
+_RAW_QUESTION = b"\x07example\x03com\x00\x00\x01\x00\x01"
+
+
+def _message(answers: int = 0, questions: int = 1) -> bytes:
+    return serialize(
+        DNSData(
+            header=Header(
+                id=1, flags=0b10000001_10000000, questions=questions, answers=answers, authorities=0, additions=1
+            ),
+            questions=[_QUESTION] * questions,
+            answers=[
+                Answer(
+                    name=QName((b"example", b"com")),
+                    rr_type=RRType.A.value,
+                    rr_class=1,
+                    ttl=300 + idx,
+                    rr_data_length=4,
+                    rr_data=bytes((10, 0, 0, idx)),
+                )
+                for idx in range(answers)
+            ],
+            authorities=[],
+            additions=[
+                Addition(
+                    name=QName(()), rr_type=RRType.OPT.value, rr_class=1232, ttl=0, rr_data_length=0, rr_data=b""
+                ),
+            ],
+        )
+    )
+
+
+def test_scan() -> None:
+    raw = _message(answers=2)
+    layout = scan(raw)
+
+    assert raw[slice(*layout.question)] == _RAW_QUESTION
+    assert [raw[_offset : _offset + 4] for _offset in layout.ttls] == [b"\x00\x00\x01\x2c", b"\x00\x00\x01\x2d"]
+    assert [raw[slice(*_answer.rr_data)] for _answer in layout.answers] == [b"\x0a\x00\x00\x00", b"\x0a\x00\x00\x01"]
+    assert [_answer.ttl for _answer in layout.answers] == layout.ttls
+    assert layout.authorities == []
+
+
+def test_scan_compressed() -> None:
+    raw = b"\x00\x01\x81\x80\x00\x01\x00\x01\x00\x00\x00\x00" + _RAW_QUESTION
+    raw += b"\xc0\x0c\x00\x01\x00\x01\x00\x00\x00\x3c\x00\x04\x0a\x00\x00\x01"
+    layout = scan(raw)
+
+    assert layout.ttls == [len(raw) - 10]
+    assert layout.answers == [WireRecord(rr_type=RRType.A.value, ttl=len(raw) - 10, rr_data=(len(raw) - 4, len(raw)))]
+
+
+@pytest.mark.parametrize("raw", (_message(answers=1)[:-15], b"\x00\x01\x81\x80", _message()[:12] + b"\x50"))
+def test_scan_invalid(raw: bytes) -> None:
+    with pytest.raises(DNSParserError):
+        scan(raw)
+
+
+def _query(flags: bytes = b"\x01\x00", questions: int = 1) -> bytes:
+    """:return: Query with the OPT record of _message"""
+    return b"\x00\x01" + flags + _message(questions=questions)[4:]
+
+
+@pytest.mark.parametrize(
+    ("raw", "key"),
+    (
+        (_query(), _RAW_QUESTION + b"\x01"),
+        (_query()[:-6] + b"\x00\x00\x80\x00" + _query()[-2:], _RAW_QUESTION + b"\x03"),
+        (_query(b"\x01\x10"), _RAW_QUESTION + b"\x05"),
+        (b"\x00\x01\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00" + _RAW_QUESTION, _RAW_QUESTION + b"\x00"),
+        (_message(), None),
+        (_query(b"\x29\x00"), None),
+        (_query(questions=2), None),
+        (_query(questions=0), None),
+        (_query()[:20], None),
+        (_query()[:-1], None),
+        (_query()[:12] + b"\xc0\x0c\x00\x01\x00\x01", None),
+        (b"\x00\x01", None),
+    ),
+    ids=(
+        "edns",
+        "do",
+        "cd",
+        "plain",
+        "response",
+        "notify",
+        "questions",
+        "no question",
+        "truncated question",
+        "truncated opt",
+        "compressed",
+        "header",
+    ),
+)
+def test_question_key(raw: bytes, key: Optional[bytes]) -> None:
+    assert question_key(raw) == key
+
+
+@pytest.mark.parametrize(
+    ("response", "matches"),
+    (
+        (_message(), True),
+        (_message().replace(b"example", b"Example"), False),
+        (_message().replace(b"\x00\x01\x00\x01\x00\x00\x29", b"\x00\x1c\x00\x01\x00\x00\x29"), False),
+        (_message(questions=0), False),
+        (_message()[:12], False),
+    ),
+    ids=("same", "case", "type", "no question", "header"),
+)
+def test_question_matches(response: bytes, matches: bool) -> None:
+    assert question_matches(_query(), response) is matches
+
+
+def test_question_matches_questions() -> None:
+    query = _query(questions=2)
+
+    assert question_matches(query, _message(questions=2))
+    assert not question_matches(query, _message(questions=0))
+    assert not question_matches(query[:20], _message(questions=2))
+
+
+@pytest.mark.parametrize(
+    ("raw", "question"),
+    (
+        (b"\x00\x01\x01\x00" + _message()[4:], _QUESTION),
+        (_message(), None),
+        (b"\x00\x01\x29\x00" + _message()[4:], None),
+        (b"\x00\x01\x01\x00" + _message(questions=2)[4:], None),
+        (b"\x00\x01\x01\x00" + _message()[4:20], None),
+        (b"\x00\x01\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00\xc0\x0c\x00\x01\x00\x01", None),
+        (b"\x00\x01", None),
+    ),
+    ids=("query", "response", "notify", "questions", "truncated", "compressed", "header"),
+)
+def test_standard_question(raw: bytes, question: Optional[Question]) -> None:
+    assert standard_question(raw) == question
+
+
+def test_udp_payload_size() -> None:
+    raw = _message()
+    query = raw[:10] + b"\x00\x00" + raw[12 : 12 + len(_RAW_QUESTION)]
+
+    assert udp_payload_size(raw) == 1232
+    assert udp_payload_size(_message(answers=1)) == 1232
+    assert udp_payload_size(query) == 512
+    assert udp_payload_size(raw[:-3]) == 512
+    assert udp_payload_size(b"\x00\x01") == 512
+
+
+def test_limit_udp_payload_size() -> None:
+    raw = _message()
+
+    assert limit_udp_payload_size(raw, 4096) == raw
+    assert udp_payload_size(limit_udp_payload_size(raw, 1024)) == 1024
+    assert len(limit_udp_payload_size(raw, 1024)) == len(raw)
+
+
+def test_truncate() -> None:
+    raw = _message(answers=40)
+    truncated = truncate(raw, 512)
+
+    assert truncate(raw, len(raw)) is raw
+    assert truncated == raw[:2] + b"\x83\x80\x00\x01\x00\x00\x00\x00\x00\x00" + _RAW_QUESTION
+
+
+def test_answer_addresses() -> None:
+    raw = _message(answers=2)
+    raw = raw[:6] + b"\x00\x04\x00\x00\x00\x00" + raw[12:-11]
+    raw += b"\xc0\x0c\x00\x1c\x00\x01\x00\x00\x01\x2c\x00\x10" + bytes(range(16))
+    raw += b"\xc0\x0c\x00\x05\x00\x01\x00\x00\x01\x2c\x00\x02\xc0\x0c"
+
+    assert answer_addresses(raw) == ([0x0A000000, 0x0A000001], [0x000102030405060708090A0B0C0D0E0F])
+    assert answer_addresses(_message()) == ([], [])
+
+
+@pytest.mark.parametrize("raw", (_message(answers=1)[:-15], _message(answers=1)[:40], b"\x00\x01"))
+def test_answer_addresses_invalid(raw: bytes) -> None:
+    with pytest.raises(DNSParserError):
+        answer_addresses(raw)
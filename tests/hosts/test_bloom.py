@@ -0,0 +1,74 @@
+from random import Random
+from typing import List
+from zlib import crc32
+
+import pytest
+
+from gwhosts.dns import QName
+from gwhosts.hosts import HostnameFilter, HostnameTrie
+
+
+def _random_hostnames(random: Random, count: int, labels: int) -> List[QName]:
+    return [QName(random.randbytes(4).hex().encode() for _ in range(labels)) for _ in range(count)]
+
+
+def test_contains() -> None:
+    random = Random(0)
+    hostnames = _random_hostnames(random, 1000, 2) + _random_hostnames(random, 1000, 3)
+    unlisted = _random_hostnames(random, 1000, 3)
+    prefilter = HostnameTrie(hostnames).build_prefilter()
+
+    assert all(_hostname in prefilter for _hostname in hostnames)
+    assert all(QName((b"www", *_hostname)) in prefilter for _hostname in hostnames)
+    assert sum(_hostname in prefilter for _hostname in unlisted) < 50
+    assert prefilter.false_positive_rate < 0.01
+
+
+def test_top_level() -> None:
+    hostnames = [QName((b"localhost",)), QName((b"example", b"com"))]
+    prefilter = HostnameTrie(hostnames).build_prefilter()
+
+    assert QName((b"localhost",)) in prefilter
+    assert QName((b"www", b"localhost")) in prefilter
+    assert QName((b"www", b"example", b"com")) in prefilter
+    assert QName((b"com",)) not in prefilter
+
+
+def test_short_names() -> None:
+    prefilter = HostnameFilter(1)
+    prefilter.add(crc32(b"example", crc32(b"com")), 2)
+
+    assert QName((b"com",)) not in prefilter
+    assert QName(()) not in prefilter
+    assert QName((b"example", b"com")) in prefilter
+
+
+def test_empty() -> None:
+    prefilter = HostnameFilter(0)
+
+    assert prefilter.size == 8
+    assert prefilter.false_positive_rate == 0.0
+    assert QName((b"example", b"com")) not in prefilter
+
+
+def test_dump() -> None:
+    random = Random(0)
+    hostnames = _random_hostnames(random, 1000, 2)
+    names = hostnames + _random_hostnames(random, 1000, 3)
+    prefilter = HostnameTrie(hostnames).build_prefilter()
+    dumped = bytearray(prefilter.dump())
+    loaded = HostnameFilter.load(memoryview(dumped))
+
+    assert loaded.size == prefilter.size
+    assert [_name in loaded for _name in names] == [_name in prefilter for _name in names]
+
+    loaded.release()
+    dumped.clear()
+
+
+@pytest.mark.parametrize(
+    "data", (b"", b"\x02\x00\x00\x00\x03\x00\x00\x00" + bytes(24), b"\x02\x00\x00\x00\x01\x00\x00\x00")
+)
+def test_load_malformed(data: bytes) -> None:
+    with pytest.raises(ValueError, match="Malformed"):
+        HostnameFilter.load(data)
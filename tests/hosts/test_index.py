@@ -0,0 +1,111 @@
+import gzip
+from pathlib import Path
+from random import Random
+from sys import byteorder
+from typing import List
+
+import pytest
+
+from gwhosts.dns import QName
+from gwhosts.hosts import HostnameIndex, HostnameTrie, compile_index, is_hostname_index, read_hostsfile
+
+
+def _random_hostnames(random: Random, count: int) -> List[QName]:
+    return [
+        QName(random.randbytes(random.randint(1, 4)).hex().encode() for _ in range(random.randint(1, 4)))
+        for _ in range(count)
+    ]
+
+
+@pytest.fixture()
+def index_path(tmp_path: Path) -> str:
+    return str(tmp_path / "hostnames.idx")
+
+
+def test_contains(index_path: str) -> None:
+    random = Random(0)
+    hostnames = _random_hostnames(random, 1000)
+    names = [QName((b"www", *_hostname)) for _hostname in hostnames] + _random_hostnames(random, 1000)
+    trie = HostnameTrie(hostnames)
+
+    assert compile_index(hostnames, index_path) == len(trie)
+
+    index = HostnameIndex(index_path)
+
+    assert len(index) == len(trie)
+    assert all(_hostname in index for _hostname in hostnames)
+    assert [_name in index for _name in names] == [_name in trie for _name in names]
+
+    index.close()
+
+
+def test_subdomains(index_path: str) -> None:
+    hostnames = [QName((b"www", b"example", b"com")), QName((b"example", b"com")), QName((b"example", b"com"))]
+
+    assert compile_index(hostnames, index_path) == 1
+
+    index = HostnameIndex(index_path, memo_size=0)
+
+    assert QName((b"api", b"example", b"com")) in index
+    assert QName((b"example", b"com")) in index
+    assert QName((b"example", b"org")) not in index
+    assert QName((b"com",)) not in index
+    assert index.stats["hostname_prefilter_rejected"] == 2
+    # The prefilter is not copied out of the mapped pages
+    assert isinstance(index.prefilter._blocks, memoryview) is (byteorder == "little")
+
+    index.close()
+
+
+def test_empty(index_path: str) -> None:
+    assert compile_index([], index_path) == 0
+
+    index = HostnameIndex(index_path)
+
+    assert len(index) == 0
+    assert QName((b"example", b"com")) not in index
+
+    index.close()
+
+
+@pytest.mark.parametrize(
+    ("data", "error"),
+    (
+        (b"", "empty"),
+        (b"GWHI", "not a hostname index"),
+        (b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00", "not a hostname index"),
+        (b"GWHI\x02\x00\x00\x00\x00\x00\x00\x00\x10\x00\x00\x00", "version 1"),
+        (
+            b"GWHI\x01\x00\x00\x00\x00\x00\x00\x00\x08\x00\x00\x00\x01\x00\x00\x00\x03\x00\x00\x00\x00\x00\x00\x00",
+            "Malformed hostname filter",
+        ),
+    ),
+)
+def test_malformed(index_path: str, data: bytes, error: str) -> None:
+    Path(index_path).write_bytes(data)
+
+    with pytest.raises(ValueError, match=error):
+        HostnameIndex(index_path)
+
+
+def test_truncated(index_path: str) -> None:
+    compile_index([QName((b"example", b"com"))], index_path)
+    data = Path(index_path).read_bytes()
+    Path(index_path).write_bytes(data[:-1])
+
+    with pytest.raises(ValueError, match="truncated"):
+        HostnameIndex(index_path)
+
+
+def test_hostsfile(tmp_path: Path, index_path: str) -> None:
+    hostsfile = str(tmp_path / "hostnames.gz")
+
+    with gzip.open(hostsfile, "w") as _file:
+        _file.write(b"example.com\n\nwww.example.org\n")
+
+    assert read_hostsfile(hostsfile) == [QName((b"example", b"com")), QName((b"www", b"example", b"org"))]
+    assert not is_hostname_index(hostsfile)
+
+    compile_index(read_hostsfile(hostsfile), index_path)
+
+    assert is_hostname_index(index_path)
@@ -0,0 +1,88 @@
+from typing import Set
+
+import pytest
+
+from gwhosts.dns import QName
+from gwhosts.hosts import BaseHostnames, HostnameTrie
+
+
+def _qname(name: str) -> QName:
+    return QName(name.encode().split(b"."))
+
+
+@pytest.mark.parametrize(
+    ("hostname", "listed"),
+    [
+        ("example.com", True),
+        ("www.example.com", True),
+        ("a.b.example.com", True),
+        ("com", False),
+        ("example.org", False),
+        ("notexample.com", False),
+        ("example.com.org", False),
+        ("api.test.net", True),
+        ("test.net", False),
+        ("other.test.net", False),
+    ],
+)
+def test_contains(hostname: str, listed: bool) -> None:
+    hostnames = {_qname("example.com"), _qname("api.test.net")}
+    trie = HostnameTrie(hostnames)
+
+    assert (_qname(hostname) in trie) is listed
+    assert hostnames == {_qname("example.com"), _qname("api.test.net")}
+
+
+@pytest.mark.parametrize(
+    "hostnames",
+    [
+        ["www.example.com", "example.com", "api.example.com"],
+        ["example.com", "www.example.com", "example.com"],
+    ],
+)
+def test_len(hostnames: Set[str]) -> None:
+    trie = HostnameTrie(_qname(_hostname) for _hostname in hostnames)
+
+    assert len(trie) == 1
+    assert _qname("other.example.com") in trie
+
+
+def test_empty() -> None:
+    trie = HostnameTrie([QName(())])
+
+    assert len(trie) == 0
+    assert QName(()) not in trie
+    assert _qname("example.com") not in trie
+
+
+def test_memo() -> None:
+    trie = HostnameTrie({_qname("example.com")}, memo_size=2)
+
+    assert _qname("www.example.com") in trie
+    assert _qname("api.example.com") in trie
+    assert _qname("www.example.com") in trie
+    assert _qname("mail.example.com") in trie
+    assert _qname("api.example.com") in trie
+    assert _qname("example.org") not in trie
+
+    assert trie.stats == {
+        "hostnames": 1,
+        "hostname_memo_entries": 2,
+        "hostname_memo_hits": 1,
+        "hostname_memo_misses": 5,
+    }
+
+
+def test_memo_disabled() -> None:
+    trie = HostnameTrie({_qname("example.com")}, memo_size=0)
+
+    assert _qname("www.example.com") in trie
+    assert _qname("www.example.com") in trie
+
+    assert trie.stats["hostname_memo_entries"] == 0
+    assert trie.stats["hostname_memo_misses"] == 2
+
+
+def test_match_is_abstract() -> None:
+    with pytest.raises(TypeError, match="_match"):
+        BaseHostnames(0)
@@ -0,0 +1,66 @@
+from select import select
+from socket import AF_INET6
+from typing import Iterator, Type
+
+import pytest
+
+from gwhosts.network import (
+    MMSG_SUPPORTED,
+    Address,
+    Datagram,
+    DatagramReceiver,
+    DatagramSender,
+    MMsgDatagramReceiver,
+    MMsgDatagramSender,
+    UDPSocket,
+)
+
+_IMPLEMENTATIONS = [(DatagramReceiver, DatagramSender)]
+
+if MMSG_SUPPORTED:
+    _IMPLEMENTATIONS.append((MMsgDatagramReceiver, MMsgDatagramSender))
+
+
+@pytest.fixture()
+def receiving_socket() -> Iterator[UDPSocket]:
+    with UDPSocket() as _socket:
+        _socket.bind(("127.0.0.1", 0))
+        yield _socket
+
+
+@pytest.mark.parametrize(("receiver_class", "sender_class"), _IMPLEMENTATIONS)
+def test_send_and_receive(
+    receiving_socket: UDPSocket,
+    receiver_class: Type[DatagramReceiver],
+    sender_class: Type[DatagramSender],
+) -> None:
+    addr = Address(*receiving_socket.getsockname())
+    receiver = receiver_class(buff_size=8, batch_size=4)
+    sender = sender_class(batch_size=3)
+    datagrams = [Datagram(bytes([idx]) * idx, addr) for idx in range(1, 8)]
+
+    assert receiver.receive(receiving_socket) == []
+
+    with UDPSocket() as sending_socket:
+        sending_socket.bind(("127.0.0.1", 0))
+        source = Address(*sending_socket.getsockname())
+        sender.send(sending_socket, datagrams)
+
+    select([receiving_socket], [], [], 1)
+
+    assert receiver.receive(receiving_socket) == [Datagram(data, source) for data, _ in datagrams[:4]]
+    assert receiver.receive(receiving_socket) == [Datagram(data, source) for data, _ in datagrams[4:]]
+    assert receiver.receive(receiving_socket) == []
+
+
+@pytest.mark.parametrize("receiver_class", [receiver_class for receiver_class, _ in _IMPLEMENTATIONS])
+def test_receive_ipv6(receiver_class: Type[DatagramReceiver]) -> None:
+    with UDPSocket(AF_INET6) as receiving_socket, UDPSocket(AF_INET6) as sending_socket:
+        receiving_socket.bind(("::1", 0))
+        sending_socket.bind(("::1", 0))
+        sending_socket.sendto(b"data", receiving_socket.getsockname())
+        select([receiving_socket], [], [], 1)
+
+        assert receiver_class().receive(receiving_socket) == [
+            Datagram(b"data", Address(*sending_socket.getsockname()[:2]))
+        ]
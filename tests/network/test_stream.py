@@ -0,0 +1,81 @@
+from socket import AF_UNIX, SOCK_STREAM, socketpair
+
+import pytest
+
+from gwhosts.network import StreamAddress, StreamConnection
+
+_PEER = StreamAddress("127.0.0.1", 12345)
+
+
+def test_receive() -> None:
+    local, remote = socketpair(AF_UNIX, SOCK_STREAM)
+    buffer = memoryview(bytearray(1024))
+
+    with local, remote:
+        connection = StreamConnection(local, _PEER, 0.0)
+
+        assert connection.receive(buffer, 1.0) == []
+
+        remote.sendall(b"\x00\x03abc\x00\x02d")
+
+        assert connection.receive(buffer, 2.0) == [b"abc"]
+        assert connection.last_active == 2.0
+
+        remote.sendall(b"e\x00\x00")
+
+        assert connection.receive(buffer, 3.0) == [b"de", b""]
+
+
+def test_receive_closed() -> None:
+    local, remote = socketpair(AF_UNIX, SOCK_STREAM)
+    remote.close()
+
+    with local:
+        connection = StreamConnection(local, _PEER, 0.0)
+
+        with pytest.raises(ConnectionError):
+            connection.receive(memoryview(bytearray(1024)), 1.0)
+
+
+def test_send_backlog() -> None:
+    local, remote = socketpair(AF_UNIX, SOCK_STREAM)
+    message = bytes(60000)
+
+    with local, remote:
+        connection = StreamConnection(local, _PEER, 0.0)
+
+        while not connection.backlog:
+            connection.send(message, 1.0)
+
+        remote.setblocking(False)
+
+        while connection.backlog:
+            try:
+                remote.recv(1 << 20)
+
+            except BlockingIOError:
+                pass
+
+            connection.flush(2.0)
+
+        assert not connection.backlog
+        assert connection.last_active == 2.0
+
+
+def test_send_limit() -> None:
+    local, remote = socketpair(AF_UNIX, SOCK_STREAM)
+    message = bytes(60000)
+
+    with local, remote:
+        connection = StreamConnection(local, _PEER, 0.0)
+
+        while not connection.backlog:
+            connection.send(message, 1.0)
+
+        assert connection.last_active == 1.0
+
+        with pytest.raises(ConnectionError):
+            for idx in range(5):
+                connection.send(message, 2.0 + idx)
+
+        assert connection.last_active == 1.0
@@ -1,6 +1,9 @@
-from socket import AF_INET, SOCK_DGRAM
+from socket import AF_INET, SOCK_DGRAM, SOCK_STREAM
 
 from gwhosts.network import (
+    Address,
+    StreamAddress,
+    TCPSocket,
     UDPSocket,
 )
 
@@ -10,3 +13,16 @@ def test_udp_socket() -> None:
 
     assert udp_socket.type == SOCK_DGRAM
     assert udp_socket.family == AF_INET
+
+
+def test_tcp_socket() -> None:
+    with TCPSocket() as tcp_socket:
+        assert tcp_socket.type == SOCK_STREAM
+        assert tcp_socket.family == AF_INET
+
+
+def test_stream_address() -> None:
+    address = StreamAddress("127.0.0.1", 53)
+
+    assert address == Address("127.0.0.1", 53)
+    assert not isinstance(Address("127.0.0.1", 53), StreamAddress)
@@ -0,0 +1,113 @@
+from random import Random
+from typing import Callable, Dict, Set
+
+import pytest
+
+from gwhosts.network import Network, SubnetAggregator
+from gwhosts.network.ipv4 import IPV4_NETMASK_MAX, IPV4_NETMASK_MIN, ipv4_reduce_subnets, ipv4_str_to_network
+from gwhosts.network.ipv6 import IPV6_NETMASK_MAX, IPV6_NETMASK_MIN, ipv6_reduce_subnets
+
+_Updates = Callable[[Set[Network], Set[Network]], Dict[Network, bool]]
+
+
+def _ipv4_updates(subnets: Set[Network], addresses: Set[Network]) -> Dict[Network, bool]:
+    reduced = set(ipv4_reduce_subnets(addresses.union(subnets)))
+
+    return {_subnet: _subnet in reduced for _subnet in subnets.symmetric_difference(reduced)}
+
+
+def _ipv6_updates(subnets: Set[Network], addresses: Set[Network]) -> Dict[Network, bool]:
+    reduced = set(ipv6_reduce_subnets(addresses.union(subnets)))
+
+    return {_subnet: _subnet in reduced for _subnet in subnets.symmetric_difference(reduced)}
+
+
+def _apply(aggregator: SubnetAggregator, updates: Dict[Network, bool]) -> None:
+    for subnet, exists in updates.items():
+        if exists:
+            aggregator.add(subnet)
+        else:
+            aggregator.remove(subnet)
+
+
+def test_update() -> None:
+    aggregator = SubnetAggregator(IPV4_NETMASK_MIN)
+    addresses = {ipv4_str_to_network("192.168.1.1"), ipv4_str_to_network("10.0.0.1")}
+
+    assert aggregator.update(addresses) == dict.fromkeys(addresses, True)
+
+    _apply(aggregator, aggregator.update(addresses))
+
+    assert aggregator.update(addresses) == {}
+    assert aggregator.update({ipv4_str_to_network("192.168.1.2")}) == {
+        ipv4_str_to_network("192.168.1.1"): False,
+        ipv4_str_to_network("192.168.1.0/24"): True,
+    }
+    assert aggregator.subnets == addresses
+
+
+def test_remove() -> None:
+    aggregator = SubnetAggregator(IPV4_NETMASK_MIN)
+    subnet = ipv4_str_to_network("192.168.1.1")
+    aggregator.add(subnet)
+    aggregator.remove(subnet)
+
+    assert list(aggregator) == []
+    assert aggregator._branches == {}
+
+    with pytest.raises(KeyError):
+        aggregator.remove(subnet)
+
+
+@pytest.mark.parametrize(
+    ("netmask_min", "netmask_max", "bits", "updates"),
+    (
+        (IPV4_NETMASK_MIN, IPV4_NETMASK_MAX, 32, _ipv4_updates),
+        (IPV6_NETMASK_MIN, IPV6_NETMASK_MAX, 128, _ipv6_updates),
+    ),
+    ids=("ipv4", "ipv6"),
+)
+def test_same_as_reduce(netmask_min: int, netmask_max: int, bits: int, updates: _Updates) -> None:
+    random = Random(0)
+    aggregator = SubnetAggregator(netmask_min)
+    # Few prefixes, so the addresses share branches and aggregate at every level
+    prefixes = [random.getrandbits(bits) & (netmask_min | netmask_min >> 8) for _ in range(8)]
+
+    for _ in range(200):
+        addresses = {
+            Network(
+                random.choice(prefixes)
+                | random.getrandbits(bits)
+                & ~netmask_min
+                & random.choice((netmask_max >> 8, netmask_max >> 16, netmask_max >> 24)),
+                netmask_max,
+            )
+            for _ in range(random.randint(1, 4))
+        }
+        expected = updates(set(aggregator.subnets), addresses)
+
+        assert aggregator.update(addresses) == expected
+
+        _apply(aggregator, expected)
+
+
+def test_covers() -> None:
+    aggregator = SubnetAggregator(IPV4_NETMASK_MIN)
+    subnet = ipv4_str_to_network("192.168.0.0/16")
+    address = ipv4_str_to_network("192.168.1.1").address
+
+    assert not aggregator.covers(address)
+
+    aggregator.add(ipv4_str_to_network("192.168.1.1"))
+    aggregator.add(subnet)
+    aggregator.add(subnet)
+
+    assert aggregator.covers(address)
+    assert aggregator.covers(ipv4_str_to_network("192.168.2.1").address)
+    assert not aggregator.covers(ipv4_str_to_network("192.169.1.1").address)
+
+    aggregator.remove(subnet)
+
+    assert not aggregator.covers(ipv4_str_to_network("192.168.2.1").address)
+    assert aggregator.covers(address)
+    assert aggregator.stats == {"subnets": 1, "lookup_hits": 3, "lookup_misses": 3}
@@ -0,0 +1,57 @@
+from logging import getLogger
+
+import pytest
+from pytest_mock import MockerFixture
+
+from gwhosts.dns import QName
+from gwhosts.network import Address, Datagram
+from gwhosts.proxy import AsyncDNSProxy
+from gwhosts.proxy._types import InFlightQuery, RoutedResponse
+
+_logger = getLogger("pytest")
+_CLIENT = Address("127.0.0.1", 12345)
+_UPSTREAM = Address("127.0.0.1", 65053)
+
+
+@pytest.fixture()
+def proxy() -> AsyncDNSProxy:
+    return AsyncDNSProxy(
+        hostnames={QName((b"example", b"com"))},
+        logger=_logger,
+        to_addr=_UPSTREAM,
+    )
+
+
+def test_uvloop_is_not_installed(mocker: MockerFixture) -> None:
+    mocker.patch("gwhosts.proxy._asyncio.uvloop", None)
+
+    with pytest.raises(ImportError):
+        AsyncDNSProxy(hostnames=set(), logger=_logger, use_uvloop=True)
+
+
+@pytest.mark.parametrize("routed", (False, True))
+def test_on_response(mocker: MockerFixture, proxy: AsyncDNSProxy, routed: bool) -> None:
+    answer = b"\x00\x00\x01\x00\x01\x00\x00\x00\x3c\x00\x04\x0a\x00\x00\x01"
+    response = Datagram(b"\x12\x34\x81\x80\x00\x00\x00\x01\x00\x00\x00\x00" + answer, _CLIENT)
+    query = InFlightQuery(id=0x1234, address=_CLIENT, time=0.0, routed=routed)
+    mocker.patch.object(proxy._upstream, "match", return_value=([response], query))
+    process_responses = mocker.patch.object(proxy, "_process_responses", return_value=[response])
+    proxy._listener = mocker.Mock()
+
+    proxy._on_response(mocker.sentinel.socket, b"", _UPSTREAM)
+
+    if routed:
+        process_responses.assert_called_once_with(None, [], [RoutedResponse(response.data, response)])
+    else:
+        process_responses.assert_called_once_with(None, [response], [])
+
+    proxy._listener.sendto.assert_called_once_with(*response)
+
+
+def test_on_late_response(mocker: MockerFixture, proxy: AsyncDNSProxy) -> None:
+    mocker.patch.object(proxy._upstream, "match", return_value=None)
+    proxy._listener = mocker.Mock()
+
+    proxy._on_response(mocker.sentinel.socket, b"", _UPSTREAM)
+
+    proxy._listener.sendto.assert_not_called()
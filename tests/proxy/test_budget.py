@@ -0,0 +1,43 @@
+from resource import RLIMIT_NOFILE, getrlimit
+
+import pytest
+
+from gwhosts.proxy._budget import FDBudget
+
+
+def test_limit() -> None:
+    budget = FDBudget(reserved=16)
+
+    assert budget.limit == getrlimit(RLIMIT_NOFILE)[0]
+    assert budget.headroom == budget.limit - 16
+
+
+def test_acquire_and_release() -> None:
+    budget = FDBudget()
+    headroom = budget.headroom
+
+    budget.acquire(2)
+    assert budget.used == 2
+    assert budget.headroom == headroom - 2
+
+    budget.release(2)
+    assert budget.used == 0
+    assert budget.headroom == headroom
+
+
+def test_acquire_over_limit() -> None:
+    budget = FDBudget()
+
+    with pytest.raises(OverflowError):
+        budget.acquire(budget.headroom + 1)
+
+    assert budget.used == 0
+
+
+def test_reserve() -> None:
+    budget = FDBudget()
+
+    with budget.reserve():
+        assert budget.used == 1
+
+    assert budget.used == 0
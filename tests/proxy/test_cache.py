@@ -0,0 +1,171 @@
+from struct import pack, unpack_from
+
+import pytest
+
+from gwhosts.dns import Answer, Authority, DNSData, Header, QName, Question, RRType, scan, serialize
+from gwhosts.proxy._cache import ResponseCache
+
+_KEY = b"\x07example\x03com\x00\x00\x01\x00\x01"
+_NOERROR = 0b10000001_10000000
+_NXDOMAIN = 0b10000001_10000011
+_TRUNCATED = 0b10000011_10000000
+_SERVFAIL = 0b10000001_10000010
+_SOA_NAMES = b"\x01a\x03com\x00\x05admin\x03com\x00"
+
+
+def _response(
+    addresses=((10, 0, 0, 1),),
+    ttl: int = 300,
+    flags: int = _NOERROR,
+    name: bytes = b"example",
+    soa: tuple = (),
+) -> bytes:
+    return serialize(
+        DNSData(
+            header=Header(id=1, flags=flags, questions=1, answers=len(addresses), authorities=len(soa), additions=0),
+            questions=[Question(name=QName((name, b"com")), rr_type=RRType.A.value, rr_class=1)],
+            answers=[
+                Answer(
+                    name=QName((name, b"com")),
+                    rr_type=RRType.A.value,
+                    rr_class=1,
+                    ttl=ttl,
+                    rr_data_length=4,
+                    rr_data=bytes(_address),
+                )
+                for _address in addresses
+            ],
+            authorities=[
+                Authority(
+                    name=QName((b"com",)),
+                    rr_type=RRType.SOA.value,
+                    rr_class=1,
+                    ttl=_soa_ttl,
+                    rr_data_length=len(_SOA_NAMES) + 20,
+                    rr_data=_SOA_NAMES + pack("!IIIII", 1, 7200, 900, 1209600, _minimum),
+                )
+                for _soa_ttl, _minimum in soa
+            ],
+            additions=[],
+        )
+    )
+
+
+def _ttls(data: bytes) -> list:
+    return [unpack_from("!I", data, _offset)[0] for _offset in scan(data).ttls]
+
+
+def test_get() -> None:
+    cache = ResponseCache()
+    cache.put(_KEY, _response(ttl=300), 100.0)
+    cached = cache.get(_KEY, b"\xab\xcd", 130.5)
+
+    assert cached[:2] == b"\xab\xcd"
+    assert _ttls(cached) == [270]
+    assert cached[2:] != _response()[2:]
+    assert cache.stats["cache_hits"] == 1
+
+
+def test_get_expired() -> None:
+    cache = ResponseCache()
+    cache.put(_KEY, _response(ttl=30), 100.0)
+
+    assert cache.get(_KEY, b"\x00\x01", 130.0) is None
+    assert cache.get(b"unknown", b"\x00\x01", 100.0) is None
+    assert cache.stats["cache_misses"] == 2
+    assert len(cache) == 1
+
+
+@pytest.mark.parametrize(
+    "response",
+    (
+        _response(addresses=()),
+        _response(flags=_NXDOMAIN),
+        _response(addresses=(), flags=_SERVFAIL, soa=((900, 300),)),
+        _response(flags=_TRUNCATED),
+        _response(ttl=0),
+        b"\x00\x01\x81\x80",
+    ),
+)
+def test_not_cacheable(response: bytes) -> None:
+    cache = ResponseCache()
+    cache.put(_KEY, response, 100.0)
+
+    assert len(cache) == 0
+    assert cache.size == 0
+
+
+def test_answers_changed() -> None:
+    cache = ResponseCache()
+
+    assert cache.put(_KEY, _response(addresses=((10, 0, 0, 1), (10, 0, 0, 2))), 100.0) is True
+    assert cache.put(_KEY, _response(addresses=((10, 0, 0, 2), (10, 0, 0, 1)), ttl=60), 500.0) is False
+    assert cache.put(_KEY, _response(addresses=((10, 0, 0, 3),)), 600.0) is True
+
+
+def test_eviction() -> None:
+    response = _response()
+    entry_size = len(_KEY) + 1 + len(response) + 256
+    cache = ResponseCache(max_size=2 * entry_size)
+
+    for idx in range(3):
+        cache.put(_KEY + bytes([idx]), response, 100.0)
+
+        if idx == 1:
+            cache.get(_KEY + b"\x00", b"\x00\x01", 100.0)
+
+    assert len(cache) == 2
+    assert cache.get(_KEY + b"\x00", b"\x00\x01", 100.0) is not None
+    assert cache.get(_KEY + b"\x01", b"\x00\x01", 100.0) is None
+    assert cache.size == 2 * entry_size
+
+
+def test_disabled() -> None:
+    cache = ResponseCache(max_size=0)
+    cache.put(_KEY, _response(), 100.0)
+
+    assert len(cache) == 0
+
+
+@pytest.mark.parametrize(("flags", "addresses"), ((_NXDOMAIN, ()), (_NOERROR, ())))
+@pytest.mark.parametrize(("soa_ttl", "minimum", "ttl"), ((900, 300, 300), (60, 300, 60)))
+def test_negative(flags: int, addresses: tuple, soa_ttl: int, minimum: int, ttl: int) -> None:
+    cache = ResponseCache(negative_max_size=1024)
+    cache.put(_KEY, _response(addresses=addresses, flags=flags, soa=((soa_ttl, minimum),)), 100.0)
+    cached = cache.get(_KEY, b"\xab\xcd", 110.0)
+
+    assert cached[:2] == b"\xab\xcd"
+    assert _ttls(cached) == [soa_ttl - 10]
+    assert cache.get(_KEY, b"\xab\xcd", 100.0 + ttl) is None
+    assert cache.stats["negative_cache_entries"] == 1
+    assert cache.stats["cache_entries"] == 0
+
+
+def test_negative_budget() -> None:
+    cache = ResponseCache(negative_max_size=0)
+    cache.put(_KEY, _response(addresses=(), flags=_NXDOMAIN, soa=((900, 300),)), 100.0)
+
+    assert len(cache) == 0
+
+
+def test_stale() -> None:
+    cache = ResponseCache(max_stale=3600.0)
+    cache.put(_KEY, _response(ttl=300), 100.0)
+
+    assert cache.stale(_KEY, b"\xab\xcd", 200.0) is None
+
+    stale = cache.stale(_KEY, b"\xab\xcd", 500.0)
+
+    assert stale[:2] == b"\xab\xcd"
+    assert _ttls(stale) == [30]
+    assert cache.stale(_KEY, b"\xab\xcd", 4001.0) is None
+    assert cache.stats["stale_hits"] == 1
+
+
+@pytest.mark.parametrize("response", (_response(addresses=(), flags=_SERVFAIL), b"\x00\x01\x81\x80"))
+def test_keep_stale_on_failure(response: bytes) -> None:
+    cache = ResponseCache()
+    cache.put(_KEY, _response(ttl=300), 100.0)
+
+    assert cache.put(_KEY, response, 500.0) is False
+    assert cache.has_stale(_KEY, 500.0)
@@ -0,0 +1,75 @@
+from gwhosts.proxy._cache import ResponseCache
+from gwhosts.proxy._prefetch import Prefetcher, TokenBucket
+
+_KEY = b"\x07example\x03com\x00\x00\x01\x00\x01"
+_RESPONSE = (
+    b"\x00\x01\x81\x80\x00\x01\x00\x01\x00\x00\x00\x00"
+    + _KEY
+    + b"\xc0\x0c\x00\x01\x00\x01\x00\x00\x00\x64\x00\x04\x0a\x00\x00\x01"
+)
+
+
+def test_token_bucket() -> None:
+    bucket = TokenBucket(rate=2.0, burst=2.0)
+
+    assert [bucket.take(100.0) for _ in range(3)] == [True, True, False]
+    assert bucket.take(100.25) is False
+    assert bucket.take(100.5) is True
+
+
+def test_due() -> None:
+    cache = ResponseCache()
+    cache.put(_KEY, _RESPONSE, 100.0)
+    prefetcher = Prefetcher(top=1, lead=5.0)
+    prefetcher.track(_KEY)
+
+    assert prefetcher.due(190.0, cache) == []
+    assert prefetcher.due(195.0, cache) == [_KEY]
+    assert prefetcher.due(200.0, cache) == []
+    assert prefetcher.stats["prefetched"] == 1
+
+
+def test_due_top() -> None:
+    cache = ResponseCache()
+    prefetcher = Prefetcher(top=1)
+
+    for key in (_KEY, _KEY + b"\x00"):
+        cache.put(key, _RESPONSE, 100.0)
+        prefetcher.track(key)
+
+    prefetcher.hit(_KEY + b"\x00")
+
+    assert prefetcher.due(196.0, cache) == [_KEY + b"\x00"]
+
+
+def test_due_throttled() -> None:
+    cache = ResponseCache()
+    prefetcher = Prefetcher(top=2, qps=1.0)
+
+    for key in (_KEY, _KEY + b"\x00"):
+        cache.put(key, _RESPONSE, 100.0)
+        prefetcher.track(key)
+
+    assert len(prefetcher.due(196.0, cache)) == 1
+    assert prefetcher.stats["prefetch_throttled"] == 1
+
+
+def test_decay() -> None:
+    prefetcher = Prefetcher(top=1, decay_interval=60.0)
+    prefetcher.track(_KEY)
+    prefetcher.track(_KEY + b"\x00")
+    prefetcher.hit(_KEY + b"\x00")
+    prefetcher.hit(b"untracked")
+
+    prefetcher.due(0.0, ResponseCache())
+    prefetcher.due(60.0, ResponseCache())
+
+    assert len(prefetcher) == 1
+
+
+def test_disabled() -> None:
+    prefetcher = Prefetcher(top=0)
+    prefetcher.track(_KEY)
+
+    assert not prefetcher.enabled
+    assert len(prefetcher) == 0
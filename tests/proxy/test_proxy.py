@@ -1,13 +1,18 @@
 import pytest
 from gwhosts.proxy import DNSProxy
-from gwhosts.dns import QName
-from gwhosts.network import UDPSocket
+from gwhosts.dns import Flags, QName, question_key
 from logging import getLogger
+from struct import unpack_from
+
 from pytest_mock import MockerFixture
-from typing import List
 
+from gwhosts.network import Address, Datagram, Network
+from gwhosts.network.ipv4 import IPV4_NETMASK_MAX
+from gwhosts.proxy._base import BaseDNSProxy
+from gwhosts.proxy._types import AnswerAddresses, InFlightQuery, RoutedResponse
 
 _logger = getLogger("pytest")
+_CLIENT = Address("127.0.0.1", 12345)
 
 
 @pytest.fixture()
@@ -18,35 +23,234 @@ def proxy() -> DNSProxy:
     )
 
 
-@pytest.mark.parametrize("listdir", ([], ["0"], ["0", "1"], ["0", "1", "2"], ["0", "1", "2", "3"]))
-def test_open_files_count(mocker: MockerFixture, proxy: DNSProxy, listdir: List[str]) -> None:
-    mock_os_listdir = mocker.patch("os.listdir", return_value=listdir)
+@pytest.mark.parametrize(
+    ("hostname", "exists"),
+    (
+        (QName((b"something", b"example", b"com")), True),
+        (QName((b"example", b"com")), True),
+        (QName((b"something", b"com")), False),
+        (QName((b"com",)), False),
+    ),
+)
+def test_hostname_exists(proxy: DNSProxy, hostname: QName, exists: bool) -> None:
+    assert proxy._hostname_exists(hostname) is exists
+
+
+def test_engine_hooks_are_abstract() -> None:
+    with pytest.raises(TypeError, match="_register_stream"):
+        BaseDNSProxy(hostnames=set(), logger=_logger)
+
+
+def test_stats(proxy: DNSProxy) -> None:
+    with proxy._upstream:
+        stats = proxy.stats
+
+    assert stats["fds_used"] == 4
+    assert stats["fds_headroom"] == proxy._budget.limit - 16 - 4
+    assert stats["in_flight"] == 0
+    assert stats["queued"] == 0
+    assert stats["ipv4_subnets"] == stats["ipv6_subnets"] == 0
+    assert stats["hostnames"] == 1
+
+
+def test_route_request_from_cache(proxy: DNSProxy) -> None:
+    query = b"\xab\xcd\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00\x07example\x03com\x00\x00\x01\x00\x01"
+    response = b"\x00\x01\x81\x80\x00\x01\x00\x01\x00\x00\x00\x00" + query[12:]
+    response += b"\xc0\x0c\x00\x01\x00\x01\x00\x00\x00\x3c\x00\x04\x0a\x00\x00\x01"
+    proxy._cache.put(question_key(query), response, proxy._now)
 
-    assert proxy._open_files_count == len(listdir)
-    mock_os_listdir.assert_called_once_with("/proc/self/fd")
+    assert proxy._route_request(Datagram(query, _CLIENT)) == Datagram(b"\xab\xcd" + response[2:], _CLIENT)
 
 
-def test_active_pool(proxy: DNSProxy) -> None:
-    pass
+def test_accept_routed_response(proxy: DNSProxy) -> None:
+    key = b"\x07example\x03com\x00\x00\x01\x00\x01"
+    response = b"\x00\x01\x81\x80\x00\x01\x00\x01\x00\x00\x00\x00" + key
+    response += b"\xc0\x0c\x00\x01\x00\x01\x00\x00\x00\x3c\x00\x04\x0a\x00\x00\x01"
+    query = InFlightQuery(id=1, address=_CLIENT, time=0.0, routed=True, key=key)
+    network = Network(0x0A000001, IPV4_NETMASK_MAX)
 
+    # Routed, unchanged and routed already, unchanged and its route is deleted since
+    for expected_routed in (1, 0, 1):
+        regular, routed = [], []
+        assert proxy._accept_response([Datagram(response, _CLIENT)], query, regular, routed) == []
 
-def test_get_socket(proxy: DNSProxy) -> None:
-    free_pool_socket = UDPSocket()
-    proxy._free_pool = [free_pool_socket]
+        assert len(routed) == expected_routed
+        assert len(regular) == 1 - expected_routed
 
-    assert proxy._get_socket() is free_pool_socket
-    assert len(proxy._free_pool) == 0
-    assert proxy._get_socket() is not free_pool_socket
+        if expected_routed:
+            proxy._ipv4_process_rtm_new_route(network)
+        else:
+            proxy._ipv4_process_rtm_del_route(network)
 
 
 @pytest.mark.parametrize(
-    ("hostname", "exists"),
+    ("flags", "query"),
     (
-        (QName((b"something", b"example", b"com")), True),
-        (QName((b"example", b"com")), True),
-        (QName((b"something", b"com")), False),
-        (QName((b"com",)), False),
+        (b"\x00", b"\x00\x00\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00\x07example\x03com\x00\x00\x01\x00\x01"),
+        (
+            b"\x07",
+            b"\x00\x00\x01\x10\x00\x01\x00\x00\x00\x00\x00\x01\x07example\x03com\x00\x00\x01\x00\x01"
+            b"\x00\x00\x29\x10\x00\x00\x00\x80\x00\x00\x00",
+        ),
     ),
+    ids=("plain", "dnssec"),
 )
-def test_hostname_exists(proxy: DNSProxy, hostname: QName, exists: bool) -> None:
-    assert proxy._hostname_exists(hostname) is exists
+def test_prefetch(mocker: MockerFixture, flags: bytes, query: bytes) -> None:
+    proxy = DNSProxy(hostnames=set(), logger=_logger, prefetch_top=1)
+    key = b"\x07example\x03com\x00\x00\x01\x00\x01" + flags
+    mocker.patch.object(proxy._prefetcher, "due", return_value=[key])
+    send = mocker.patch.object(proxy._upstream, "send")
+    mocker.patch.object(proxy._upstream, "_sockets", [mocker.sentinel.socket])
+
+    proxy._prefetch()
+
+    send.assert_called_once_with(query, InFlightQuery(0, None, proxy._now, True, key))
+    assert question_key(query) == key
+
+
+def test_accept_oversized_routed_response(proxy: DNSProxy) -> None:
+    key = b"\x07example\x03com\x00\x00\x01\x00\x01"
+    response = b"\x00\x01\x81\x80\x00\x01\x00\x3c\x00\x00\x00\x00" + key
+    response += b"".join(
+        b"\xc0\x0c\x00\x01\x00\x01\x00\x00\x00\x3c\x00\x04\x0a\x00\x00" + bytes((_idx,)) for _idx in range(60)
+    )
+    query = InFlightQuery(id=1, address=_CLIENT, time=0.0, routed=True, key=key, payload_size=512)
+    regular, routed = [], []
+
+    proxy._accept_response([Datagram(response, _CLIENT)], query, regular, routed)
+    ((message, (data, addr)),) = routed
+
+    assert len(response) == 989
+    assert message == response
+    assert len(data) <= 512
+    assert unpack_from("!H", data, 2)[0] & Flags.TC.value
+    assert list(proxy._parse_routed_responses(routed)) == [
+        AnswerAddresses([0x0A000000 + _idx for _idx in range(60)], [])
+    ]
+    assert proxy._cache.get(key, b"\x00\x01", proxy._now) == response
+
+
+def test_accept_prefetched_response(mocker: MockerFixture, proxy: DNSProxy) -> None:
+    key = b"\x07example\x03com\x00\x00\x01\x00\x01"
+    response = b"\x00\x00\x81\x80\x00\x01\x00\x01\x00\x00\x00\x00" + key
+    response += b"\xc0\x0c\x00\x01\x00\x01\x00\x00\x00\x3c\x00\x04\x0a\x00\x00\x01"
+    query = InFlightQuery(id=0, address=None, time=0.0, routed=True, key=key)
+
+    for routed_already in (False, True):
+        mocker.patch.object(proxy, "_ipv4_in_subnets", return_value=routed_already)
+        regular, routed = [], []
+        proxy._accept_response([Datagram(response, None)], query, regular, routed)
+
+        assert regular == []
+        assert routed == ([] if routed_already else [RoutedResponse(response, None)])
+
+    mocker.patch.object(proxy, "_parse_routed_responses")
+    mocker.patch.object(proxy, "_update_routes", return_value=({}, {}))
+    mocker.patch.object(proxy, "_program_routes")
+
+    assert proxy._process_responses(None, [], [RoutedResponse(b"", None)]) == []
+
+
+def test_answer_stale(mocker: MockerFixture) -> None:
+    proxy = DNSProxy(hostnames=set(), logger=_logger, serve_stale_after=1.0)
+    query = b"\xab\xcd\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00\x07example\x03com\x00\x00\x01\x00\x01"
+    response = b"\x00\x01\x81\x80\x00\x01\x00\x01\x00\x00\x00\x00" + query[12:]
+    response += b"\xc0\x0c\x00\x01\x00\x01\x00\x00\x00\x3c\x00\x04\x0a\x00\x00\x01"
+    proxy._cache.put(question_key(query), response, proxy._now - 120.0)
+    mocker.patch.object(proxy._upstream, "send")
+    detach = mocker.patch.object(proxy._upstream, "detach", side_effect=lambda _query: [_query])
+
+    assert proxy._route_request(Datagram(query, _CLIENT)) is None
+    assert proxy._stale_timeout() == 1.0
+    assert proxy._answer_stale() == []
+
+    proxy._now += 1.0
+    (stale,) = proxy._answer_stale()
+
+    detach.assert_called_once()
+    assert stale.target == _CLIENT
+    assert stale.data[:2] == b"\xab\xcd"
+    assert proxy._stale_timeout() is None
+
+
+def test_answer_stale_on_servfail(proxy: DNSProxy) -> None:
+    proxy._serve_stale_after = 1.0
+    key = b"\x07example\x03com\x00\x00\x01\x00\x01"
+    response = b"\x00\x01\x81\x80\x00\x01\x00\x01\x00\x00\x00\x00" + key
+    response += b"\xc0\x0c\x00\x01\x00\x01\x00\x00\x00\x3c\x00\x04\x0a\x00\x00\x01"
+    servfail = b"\x00\x01\x81\x82\x00\x01\x00\x00\x00\x00\x00\x00" + key
+    proxy._cache.put(key, response, proxy._now - 120.0)
+    query = InFlightQuery(id=1, address=_CLIENT, time=0.0, routed=True, key=key)
+    regular, routed = [], []
+
+    proxy._accept_response([Datagram(servfail, _CLIENT)], query, regular, routed)
+
+    assert routed == []
+    assert regular == [
+        Datagram(response[:6] + response[6:].replace(b"\x00\x00\x00\x3c", b"\x00\x00\x00\x1e"), _CLIENT)
+    ]
+
+
+def test_route_request_limits_udp_payload_size(mocker: MockerFixture) -> None:
+    proxy = DNSProxy(hostnames=set(), logger=_logger, buff_size=1232)
+    send = mocker.patch.object(proxy._upstream, "send")
+    query = b"\xab\xcd\x01\x00\x00\x01\x00\x00\x00\x00\x00\x01\x07example\x03com\x00\x00\x01\x00\x01"
+    opt = b"\x00\x00\x29{}\x00\x00\x00\x00\x00\x00"
+
+    proxy._route_request(Datagram(query + opt.replace(b"{}", b"\x10\x00"), _CLIENT))
+
+    data, in_flight = send.call_args.args
+
+    assert data == query + opt.replace(b"{}", b"\x04\xd0")
+    assert in_flight.payload_size == 4096
+
+
+@pytest.mark.parametrize(
+    ("question", "routed"),
+    (
+        (b"\x07example\x03com\x00\x00\x01\x00\x01", True),
+        (b"\x03www\x07example\x03com\x00\x00\x1c\x00\x01", True),
+        (b"\x07example\x03com\x00\x00\x41\x00\x01", True),
+        (b"\x07example\x03com\x00\x00\x0f\x00\x01", False),
+        (b"\x07example\x03org\x00\x00\x01\x00\x01", False),
+    ),
+)
+def test_route_request_by_type(mocker: MockerFixture, proxy: DNSProxy, question: bytes, routed: bool) -> None:
+    send = mocker.patch.object(proxy._upstream, "send")
+
+    assert (
+        proxy._route_request(Datagram(b"\xab\xcd\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00" + question, _CLIENT)) is None
+    )
+
+    _, in_flight = send.call_args.args
+
+    assert in_flight.id == 0xABCD
+    assert in_flight.routed is routed
+
+
+def test_route_request_malformed(mocker: MockerFixture, proxy: DNSProxy) -> None:
+    send = mocker.patch.object(proxy._upstream, "send")
+
+    assert (
+        proxy._route_request(Datagram(b"\xab\xcd\x01\x00\x00\x02\x00\x00\x00\x00\x00\x00\x07example", _CLIENT)) is None
+    )
+    send.assert_not_called()
+
+
+def test_parse_routed_responses(proxy: DNSProxy) -> None:
+    response = b"\x00\x01\x81\x80\x00\x01\x00\x01\x00\x00\x00\x00\x07example\x03com\x00\x00\x01\x00\x01"
+    response += b"\xc0\x0c\x00\x01\x00\x01\x00\x00\x00\x3c\x00\x04\x0a\x00\x00\x01"
+
+    responses = [RoutedResponse(response, Datagram(response, _CLIENT)), RoutedResponse(b"\x00", None)]
+
+    assert list(proxy._parse_routed_responses(responses)) == [AnswerAddresses([0x0A000001], [])]
+
+
+@pytest.mark.parametrize("logging", (True, False))
+def test_parse_regular_responses(mocker: MockerFixture, proxy: DNSProxy, logging: bool) -> None:
+    mocker.patch.object(proxy._logger, "isEnabledFor", return_value=logging)
+    log_answers = mocker.patch.object(proxy, "_log_answers")
+
+    proxy._parse_regular_responses([Datagram(b"\x00\x01", _CLIENT)])
+
+    assert log_answers.called is logging
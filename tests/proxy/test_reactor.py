@@ -0,0 +1,40 @@
+from socket import AF_UNIX, SOCK_DGRAM, socketpair
+
+import pytest
+
+from gwhosts.network import UDPSocket
+from gwhosts.proxy import Reactor, ReactorBackend
+
+
+@pytest.mark.parametrize("backend", ReactorBackend)
+def test_reactor_select(backend: ReactorBackend) -> None:
+    reader, writer = socketpair(AF_UNIX, SOCK_DGRAM)
+    idle = UDPSocket()
+
+    with reader, writer, idle, Reactor(backend) as reactor:
+        reactor.register(reader)
+        reactor.register(idle)
+
+        assert reactor.select(0) == []
+
+        writer.send(b"ready")
+
+        assert reactor.select(0) == [reader]
+
+
+@pytest.mark.parametrize("backend", ReactorBackend)
+def test_reactor_unregister(backend: ReactorBackend) -> None:
+    reader, writer = socketpair(AF_UNIX, SOCK_DGRAM)
+
+    with reader, writer, Reactor(backend) as reactor:
+        reactor.register(reader)
+
+        assert reader in reactor
+        assert len(reactor) == 1
+
+        reactor.unregister(reader)
+        writer.send(b"ready")
+
+        assert reader not in reactor
+        assert len(reactor) == 0
+        assert reactor.select(0) == []
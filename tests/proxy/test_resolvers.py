@@ -0,0 +1,89 @@
+from collections import Counter
+
+import pytest
+
+from gwhosts.network import Address
+from gwhosts.proxy._resolvers import Resolver, ResolverPool
+
+_FAST = Address("127.0.0.1", 53)
+_SLOW = Address("127.0.0.2", 53)
+
+
+def test_resolve_hostname() -> None:
+    assert Resolver(Address("localhost", 8053)).addr == Address("127.0.0.1", 8053)
+
+
+def test_srtt() -> None:
+    resolver = Resolver(_FAST)
+    resolver.on_answer(0.010)
+    resolver.on_answer(0.090)
+
+    assert resolver.srtt == pytest.approx(0.020)
+
+
+def test_rto() -> None:
+    resolver = Resolver(_FAST)
+    resolver.on_answer(0.010)
+
+    assert resolver.rto == pytest.approx(0.030)
+
+    resolver.on_answer(0.010)
+
+    assert resolver.rto == pytest.approx(0.025)
+
+
+def test_loss() -> None:
+    resolver = Resolver(_FAST)
+    resolver.on_timeout()
+
+    assert resolver.loss == pytest.approx(1 / 8)
+    assert resolver.failures == 1
+
+    resolver.on_answer(0.010)
+
+    assert resolver.loss == pytest.approx(7 / 64)
+    assert resolver.failures == 0
+
+
+def test_no_resolvers() -> None:
+    with pytest.raises(ValueError):
+        ResolverPool([])
+
+
+def test_choose_faster() -> None:
+    pool = ResolverPool([_FAST, _SLOW])
+    fast, slow = pool
+    fast.on_answer(0.005)
+    slow.on_answer(0.050)
+
+    chosen = Counter(pool.choose(0.0).addr for _ in range(1000))
+
+    assert chosen[_FAST] > 3 * chosen[_SLOW] > 0
+
+
+def test_eject() -> None:
+    pool = ResolverPool([_FAST, _SLOW], max_failures=2, eject_seconds=30.0)
+    fast, slow = pool
+
+    for sent in (10.0, 11.0):
+        pool.timeout(fast, sent)
+
+    assert {pool.choose(20.0).addr for _ in range(100)} == {_SLOW}
+    assert pool.stats(20.0)["upstream[127.0.0.1:53].ejected"] == 1
+    assert pool.stats(41.0)["upstream[127.0.0.1:53].ejected"] == 0
+
+    for sent in (12.0, 13.0):
+        pool.timeout(slow, sent)
+
+    assert pool.choose(20.0) is fast
+
+
+def test_choose_excluded() -> None:
+    pool = ResolverPool([_FAST, _SLOW])
+    fast, slow = pool
+
+    assert {pool.choose(0.0, exclude=fast) for _ in range(100)} == {slow}
+
+    slow.ejected_until = 1.0
+
+    assert pool.choose(0.0, exclude=fast) is fast
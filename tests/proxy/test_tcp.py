@@ -0,0 +1,186 @@
+from select import select
+from socket import AF_INET6
+from struct import pack, unpack_from
+from typing import Iterator, Set
+
+import pytest
+
+from gwhosts.network import Address, StreamConnection, TCPSocket
+from gwhosts.proxy._resolvers import ResolverPool
+from gwhosts.proxy._tcp import TCPUpstream
+from gwhosts.proxy._types import InFlightQuery
+
+_QUESTION = b"\x07example\x03com\x00\x00\x01\x00\x01"
+_KEY = _QUESTION + b"\x00"
+_CLIENT = Address("127.0.0.1", 12345)
+_FOLLOWER = Address("127.0.0.1", 12346)
+
+
+@pytest.fixture()
+def resolver() -> Iterator[TCPSocket]:
+    with TCPSocket() as _socket:
+        _socket.bind(("127.0.0.1", 0))
+        _socket.listen(4)
+        _socket.settimeout(1)
+        yield _socket
+
+
+@pytest.fixture()
+def watched() -> Set[StreamConnection]:
+    return set()
+
+
+@pytest.fixture()
+def tcp(resolver: TCPSocket, watched: Set[StreamConnection]) -> Iterator[TCPUpstream]:
+    upstream = TCPUpstream(
+        ResolverPool([Address(*resolver.getsockname())]),
+        watch=watched.add,
+        unwatch=watched.discard,
+        max_connections=2,
+        max_pipelined=1,
+    )
+    yield upstream
+    upstream.close()
+
+
+def _read_query(connection) -> bytes:
+    length = unpack_from("!H", connection.recv(2))[0]
+    return connection.recv(length)
+
+
+def _connect(tcp: TCPUpstream, connection: StreamConnection) -> None:
+    """Wait for the connect to complete and flush the queued queries"""
+    select([], [connection], [], 1)
+
+    assert tcp.receive(connection, memoryview(bytearray(1024)), 1.0) == []
+
+
+def test_send_and_receive(tcp: TCPUpstream, resolver: TCPSocket) -> None:
+    query = InFlightQuery(id=0x1234, address=_CLIENT, time=0.0, routed=True, key=_KEY, payload_size=512)
+    follower = InFlightQuery(id=0x5678, address=_FOLLOWER, time=0.5, routed=True, key=_KEY, payload_size=512)
+    tcp.send(_KEY, [query, follower], 1.0)
+    (connection,) = tcp
+    upstream, _ = resolver.accept()
+
+    with upstream:
+        assert connection.connecting
+
+        _connect(tcp, connection)
+
+        assert not connection.connecting
+
+        upstream.settimeout(1)
+        sent = _read_query(upstream)
+        response = sent[:2] + b"\x81\x80\x00\x01\x00\x00\x00\x00\x00\x00" + _QUESTION + bytes(600)
+        upstream.sendall(pack("!H", len(response)) + response)
+        connection.socket.settimeout(1)
+        (responses, matched), *_ = tcp.receive(connection, memoryview(bytearray(1024)), 2.0)
+
+    assert sent[2:] == b"\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00" + _QUESTION
+    assert matched is query
+    assert [_response.target for _response in responses] == [_CLIENT, _FOLLOWER]
+    assert responses[0].data == b"\x12\x34" + response[2:]
+    assert responses[1].data == b"\x56\x78\x83\x80\x00\x01\x00\x00\x00\x00\x00\x00" + _QUESTION
+    assert len(tcp) == 0
+
+
+def test_ipv6_resolver(watched: Set[StreamConnection]) -> None:
+    with TCPSocket(AF_INET6) as resolver:
+        resolver.bind(("::1", 0))
+        resolver.listen(1)
+        resolver.settimeout(1)
+        tcp = TCPUpstream(
+            ResolverPool([Address(*resolver.getsockname()[:2])]), watch=watched.add, unwatch=watched.discard
+        )
+        tcp.send(_KEY, [InFlightQuery(id=1, address=_CLIENT, time=0.0, routed=False)], 0.0)
+        (connection,) = tcp
+        upstream, _ = resolver.accept()
+
+        with upstream:
+            _connect(tcp, connection)
+            upstream.settimeout(1)
+
+            assert connection.socket.family == AF_INET6
+            assert _read_query(upstream)[12:] == _QUESTION
+
+        tcp.close()
+
+
+def test_pipelining(tcp: TCPUpstream, resolver: TCPSocket, watched: Set[StreamConnection]) -> None:
+    for idx in range(3):
+        tcp.send(_KEY, [InFlightQuery(id=idx, address=_CLIENT, time=0.0, routed=False)], 0.0)
+
+    assert len(list(tcp)) == 2
+    assert watched == set(tcp)
+    assert len(tcp) == 3
+
+
+def test_closed_by_upstream(tcp: TCPUpstream, resolver: TCPSocket, watched: Set[StreamConnection]) -> None:
+    tcp.send(_KEY, [InFlightQuery(id=1, address=_CLIENT, time=0.0, routed=False)], 0.0)
+    upstream, _ = resolver.accept()
+    upstream.close()
+    (connection,) = tcp
+    connection.socket.settimeout(1)
+
+    assert tcp.receive(connection, memoryview(bytearray(1024)), 1.0) == []
+    assert list(tcp) == []
+    assert watched == set()
+
+
+def test_unreachable(tcp: TCPUpstream, resolver: TCPSocket, watched: Set[StreamConnection]) -> None:
+    resolver.close()
+    tcp.send(_KEY, [InFlightQuery(id=1, address=_CLIENT, time=0.0, routed=False)], 0.0)
+    (connection,) = tcp
+
+    assert connection.backlog
+
+    select([], [connection], [], 1)
+
+    assert tcp.receive(connection, memoryview(bytearray(1024)), 1.0) == []
+    assert list(tcp) == []
+    assert watched == set()
+
+
+def test_connect_error(resolver: TCPSocket, mocker) -> None:
+    connect = mocker.Mock(side_effect=OSError)
+    tcp = TCPUpstream(
+        ResolverPool([Address(*resolver.getsockname())]), watch=mocker.Mock(), unwatch=mocker.Mock(), connect=connect
+    )
+
+    with pytest.raises(OSError):
+        tcp.send(_KEY, [InFlightQuery(id=1, address=_CLIENT, time=0.0, routed=False)], 0.0)
+
+    assert list(tcp) == []
+    assert connect.call_args.args[1] == resolver.getsockname()
+
+
+def test_connect_timeout(resolver: TCPSocket) -> None:
+    tcp = TCPUpstream(
+        ResolverPool([Address(*resolver.getsockname())]), watch=set().add, unwatch=set().discard, connect_timeout=1.0
+    )
+    tcp.send(_KEY, [InFlightQuery(id=1, address=_CLIENT, time=0.0, routed=False)], 0.0)
+    tcp.close_idle(0.5)
+
+    assert len(list(tcp)) == 1
+
+    tcp.close_idle(1.0)
+
+    assert list(tcp) == []
+
+
+def test_expire_and_close_idle(tcp: TCPUpstream, resolver: TCPSocket) -> None:
+    tcp.send(_KEY, [InFlightQuery(id=1, address=_CLIENT, time=1.0, routed=False)], 1.0)
+    _connect(tcp, *tcp)
+
+    assert tcp.oldest == 1.0
+    assert tcp.expire(0.5) == 0
+    assert tcp.expire(1.0) == 1
+    assert tcp.oldest is None
+
+    tcp.close_idle(5.0)
+
+    assert len(list(tcp)) == 1
+
+    tcp.close_idle(11.0)
+
+    assert list(tcp) == []
@@ -0,0 +1,367 @@
+from select import select
+from socket import AF_INET, AF_INET6
+from struct import pack, unpack_from
+from typing import Iterator, Optional
+
+import pytest
+from pytest_mock import MockerFixture
+
+from gwhosts.network import Address, Datagram, DatagramReceiver, UDPSocket
+from gwhosts.proxy._budget import FDBudget
+from gwhosts.proxy._resolvers import ResolverPool
+from gwhosts.proxy._tcp import TCPUpstream
+from gwhosts.proxy._types import InFlightQuery
+from gwhosts.proxy._upstream import RetryBudget, UpstreamChannel
+
+_QUERY = b"\x12\x34\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00\x07example\x03com\x00\x00\x01\x00\x01"
+_CLIENT = Address("127.0.0.1", 12345)
+
+
+@pytest.fixture()
+def resolver() -> Iterator[UDPSocket]:
+    with UDPSocket() as _socket:
+        _socket.bind(("127.0.0.1", 0))
+        _socket.settimeout(1)
+        yield _socket
+
+
+@pytest.fixture()
+def channel(resolver: UDPSocket) -> Iterator[UpstreamChannel]:
+    with UpstreamChannel(ResolverPool([Address(*resolver.getsockname())]), sockets_count=2) as _channel:
+        yield _channel
+
+
+def _wait_for(channel: UpstreamChannel, port: int) -> UDPSocket:
+    _socket = next(_socket for _socket in channel if _socket.getsockname()[1] == port)
+    select([_socket], [], [], 1)
+    return _socket
+
+
+def test_send_and_receive(channel: UpstreamChannel, resolver: UDPSocket) -> None:
+    query = InFlightQuery(id=0x1234, address=_CLIENT, time=0.0, routed=True)
+    channel.send(_QUERY, query)
+
+    assert len(channel) == 1
+
+    data, addr = resolver.recvfrom(1024)
+    (proxy_id,) = unpack_from("!H", data)
+
+    assert data[2:] == _QUERY[2:]
+
+    resolver.sendto(pack("!H", proxy_id) + b"\x81\x80" + data[4:], addr)
+    _socket = _wait_for(channel, addr[1])
+
+    response, addr = _socket.recvfrom(1024)
+
+    assert channel.match(_socket, response, Address(*addr), 0.0) == (
+        [Datagram(b"\x12\x34\x81\x80" + _QUERY[4:], _CLIENT)],
+        query,
+    )
+    assert len(channel) == 0
+
+
+def test_receive_unknown_id(channel: UpstreamChannel, resolver: UDPSocket) -> None:
+    channel.send(_QUERY, InFlightQuery(id=0x1234, address=_CLIENT, time=0.0, routed=False))
+
+    data, addr = resolver.recvfrom(1024)
+    (proxy_id,) = unpack_from("!H", data)
+    resolver.sendto(pack("!H", proxy_id ^ 1) + data[2:], addr)
+    _socket = _wait_for(channel, addr[1])
+
+    response, addr = _socket.recvfrom(1024)
+
+    assert channel.match(_socket, response, Address(*addr), 0.0) is None
+    assert len(channel) == 1
+
+
+def test_capacity(resolver: UDPSocket) -> None:
+    with UpstreamChannel(
+        ResolverPool([Address(*resolver.getsockname())]), sockets_count=2, max_in_flight=2
+    ) as channel:
+        assert channel.capacity == 4
+
+        for _ in range(4):
+            channel.send(_QUERY, InFlightQuery(id=0x1234, address=_CLIENT, time=0.0, routed=False))
+
+        assert channel.capacity == 0
+
+        with pytest.raises(OverflowError):
+            channel.send(_QUERY, InFlightQuery(id=0x1234, address=_CLIENT, time=0.0, routed=False))
+
+
+def test_expire(channel: UpstreamChannel) -> None:
+    for timestamp in (1.0, 2.0, 3.0):
+        channel.send(_QUERY, InFlightQuery(id=0x1234, address=_CLIENT, time=timestamp, routed=False))
+
+    assert channel.expire(2.5) == 2
+    assert len(channel) == 1
+
+
+def test_expire_answered(channel: UpstreamChannel, resolver: UDPSocket) -> None:
+    for timestamp in (1.0, 2.0):
+        channel.send(_QUERY, InFlightQuery(id=0x1234, address=_CLIENT, time=timestamp, routed=False))
+
+    data, (_, port) = resolver.recvfrom(512)
+    _socket = next(_socket for _socket in channel if _socket.getsockname()[1] == port)
+    channel.match(_socket, data, Address(*resolver.getsockname()), 0.0)
+
+    assert channel.oldest == 2.0
+    assert channel.expire(2.5) == 1
+    assert channel.oldest is None
+
+
+def test_open_within_budget(resolver: UDPSocket) -> None:
+    budget = FDBudget()
+    budget.acquire(budget.headroom - 1)
+
+    with UpstreamChannel(ResolverPool([Address(*resolver.getsockname())]), sockets_count=2, budget=budget) as _channel:
+        assert len(list(_channel)) == 1
+        assert budget.headroom == 0
+
+    assert budget.headroom == 1
+
+
+def test_open_over_budget(resolver: UDPSocket) -> None:
+    budget = FDBudget()
+    budget.acquire(budget.headroom)
+
+    with pytest.raises(OverflowError):
+        UpstreamChannel(ResolverPool([Address(*resolver.getsockname())]), budget=budget).open()
+
+
+def test_coalesce(channel: UpstreamChannel, resolver: UDPSocket) -> None:
+    key = _QUERY[12:]
+    query = InFlightQuery(id=0x1234, address=_CLIENT, time=0.0, routed=False, key=key)
+    follower = InFlightQuery(id=0x5678, address=Address("127.0.0.1", 23456), time=0.0, routed=False, key=key)
+    channel.send(_QUERY, query)
+    channel.send(_QUERY, follower)
+
+    assert len(channel) == 1
+    assert channel.coalesced == 1
+
+    data, addr = resolver.recvfrom(1024)
+    resolver.sendto(data[:2] + b"\x81\x80" + data[4:], addr)
+    _socket = _wait_for(channel, addr[1])
+    response, addr = _socket.recvfrom(1024)
+
+    assert channel.match(_socket, response, Address(*addr), 0.0) == (
+        [
+            Datagram(b"\x12\x34\x81\x80" + _QUERY[4:], _CLIENT),
+            Datagram(b"\x56\x78\x81\x80" + _QUERY[4:], follower.address),
+        ],
+        query,
+    )
+
+    channel.send(_QUERY, query)
+
+    assert len(channel) == 1
+    assert channel.coalesced == 1
+
+
+def test_expire_followers(channel: UpstreamChannel) -> None:
+    query = InFlightQuery(id=0x1234, address=_CLIENT, time=1.0, routed=False, key=_QUERY[12:])
+
+    for _ in range(3):
+        channel.send(_QUERY, query)
+
+    assert channel.expire(2.0) == 3
+
+    channel.send(_QUERY, query)
+
+    assert len(channel) == 1
+
+
+def test_spoofed_response(channel: UpstreamChannel, resolver: UDPSocket) -> None:
+    channel.send(_QUERY, InFlightQuery(id=0x1234, address=_CLIENT, time=0.0, routed=False))
+    data, addr = resolver.recvfrom(1024)
+    _socket = next(_socket for _socket in channel if _socket.getsockname()[1] == addr[1])
+
+    assert channel.match(_socket, data, Address("127.0.0.2", 53), 0.0) is None
+    assert len(channel) == 1
+
+
+def test_response_to_another_question(channel: UpstreamChannel, resolver: UDPSocket) -> None:
+    channel.send(_QUERY, InFlightQuery(id=0x1234, address=_CLIENT, time=0.0, routed=False))
+    data, addr = resolver.recvfrom(1024)
+    _socket = next(_socket for _socket in channel if _socket.getsockname()[1] == addr[1])
+    response = data[:2] + b"\x81\x80" + data[4:].replace(b"example", b"attacker")
+
+    assert channel.match(_socket, response, Address(*resolver.getsockname()), 0.0) is None
+    assert len(channel) == 1
+
+
+def test_resolver_hostname(resolver: UDPSocket) -> None:
+    query = InFlightQuery(id=0x1234, address=_CLIENT, time=0.0, routed=False)
+
+    with UpstreamChannel(ResolverPool([Address("localhost", resolver.getsockname()[1])])) as channel:
+        channel.send(_QUERY, query)
+        data, addr = resolver.recvfrom(1024)
+        resolver.sendto(data[:2] + b"\x81\x80" + data[4:], addr)
+        _socket = _wait_for(channel, addr[1])
+        response, addr = _socket.recvfrom(1024)
+
+        assert channel.match(_socket, response, Address(*addr), 0.0) == (
+            [Datagram(b"\x12\x34\x81\x80" + _QUERY[4:], _CLIENT)],
+            query,
+        )
+
+
+def test_resolver_families(resolver: UDPSocket) -> None:
+    query = InFlightQuery(id=0x1234, address=_CLIENT, time=0.0, routed=False)
+
+    with UDPSocket(AF_INET6) as resolver_v6:
+        resolver_v6.bind(("::1", 0))
+        resolver_v6.settimeout(1)
+        pool = ResolverPool([Address(*resolver.getsockname()), Address(*resolver_v6.getsockname()[:2])])
+        pool_v4, pool_v6 = pool
+        pool_v4.ejected_until = float("inf")
+
+        with UpstreamChannel(pool, sockets_count=2) as channel:
+            assert sorted(_socket.family for _socket in channel) == [AF_INET, AF_INET, AF_INET6, AF_INET6]
+
+            channel.send(_QUERY, query)
+            data, addr = resolver_v6.recvfrom(1024)
+            resolver_v6.sendto(data[:2] + b"\x81\x80" + data[4:], addr)
+            _socket = _wait_for(channel, addr[1])
+            (response,) = DatagramReceiver().receive(_socket)
+
+            assert _socket.family == AF_INET6
+            assert channel.match(_socket, *response, 0.0) == (
+                [Datagram(b"\x12\x34\x81\x80" + _QUERY[4:], _CLIENT)],
+                query,
+            )
+            assert pool_v6.answered == 1
+
+
+def test_resolver_accounting(channel: UpstreamChannel, resolver: UDPSocket) -> None:
+    for timestamp in (1.0, 2.0):
+        channel.send(_QUERY, InFlightQuery(id=0x1234, address=_CLIENT, time=timestamp, routed=False))
+
+    data, addr = resolver.recvfrom(1024)
+    _socket = next(_socket for _socket in channel if _socket.getsockname()[1] == addr[1])
+    channel.match(_socket, data, Address(*resolver.getsockname()), 1.25)
+    channel.expire(2.0)
+    (upstream,) = channel.resolvers
+
+    assert (upstream.sent, upstream.answered, upstream.timeouts) == (2, 1, 1)
+    assert upstream.srtt == 0.25
+
+
+@pytest.fixture()
+def hedge() -> Iterator[UDPSocket]:
+    with UDPSocket() as _socket:
+        _socket.bind(("127.0.0.1", 0))
+        _socket.settimeout(1)
+        yield _socket
+
+
+def test_retry_budget() -> None:
+    budget = RetryBudget(ratio=0.5, burst=1.0)
+
+    assert budget.withdraw()
+    assert not budget.withdraw()
+
+    budget.deposit()
+    budget.deposit()
+
+    assert budget.withdraw()
+
+
+def test_retransmit(resolver: UDPSocket, hedge: UDPSocket) -> None:
+    pool = ResolverPool([Address(*resolver.getsockname()), Address(*hedge.getsockname())])
+    primary, secondary = pool
+
+    with UpstreamChannel(pool, sockets_count=1, retry_budget=RetryBudget()) as channel:
+        secondary.ejected_until = 1.0
+        channel.send(_QUERY, InFlightQuery(id=0x1234, address=_CLIENT, time=0.0, routed=False))
+        secondary.ejected_until = 0.0
+        sent, _ = resolver.recvfrom(1024)
+
+        assert channel.next_retransmit == primary.rto
+        assert channel.retransmit(primary.rto - 0.01) == 0
+        assert channel.retransmit(primary.rto) == 1
+        assert channel.next_retransmit is None
+
+        data, addr = hedge.recvfrom(1024)
+        hedge.sendto(data[:2] + b"\x81\x80" + data[4:], addr)
+        _socket = _wait_for(channel, addr[1])
+
+        assert data == sent
+        assert channel.match(_socket, *_socket.recvfrom(1024), 0.5) is not None
+        assert (secondary.answered, channel.retransmitted) == (1, 1)
+        assert secondary.srtt == pytest.approx(0.5 - primary.rto)
+
+
+def test_retransmit_throttled(resolver: UDPSocket) -> None:
+    budget = RetryBudget(ratio=0.0, burst=0.0)
+
+    with UpstreamChannel(ResolverPool([Address(*resolver.getsockname())]), retry_budget=budget) as channel:
+        channel.send(_QUERY, InFlightQuery(id=0x1234, address=_CLIENT, time=0.0, routed=False))
+
+        assert channel.retransmit(1.0) == 0
+        assert channel.retries_throttled == 1
+
+
+def test_expire_retransmitted(resolver: UDPSocket) -> None:
+    with UpstreamChannel(ResolverPool([Address(*resolver.getsockname())]), retry_budget=RetryBudget()) as channel:
+        channel.send(_QUERY, InFlightQuery(id=0x1234, address=_CLIENT, time=0.0, routed=False))
+        channel.retransmit(1.0)
+        (upstream,) = channel.resolvers
+
+        assert channel.expire(5.0) == 1
+        assert (upstream.sent, upstream.timeouts) == (2, 1)
+
+
+def test_detach(channel: UpstreamChannel, resolver: UDPSocket) -> None:
+    query = InFlightQuery(id=0x1234, address=_CLIENT, time=0.0, routed=True, key=_QUERY[12:])
+    follower = InFlightQuery(id=0x5678, address=_CLIENT, time=0.5, routed=True, key=_QUERY[12:])
+    channel.send(_QUERY, query)
+    channel.send(_QUERY, follower)
+
+    assert channel.detach(follower) == []
+    assert not channel.overdue(query.key)
+    assert channel.detach(query) == [query, follower]
+    assert channel.detach(query) == []
+    assert channel.overdue(query.key)
+
+    data, addr = resolver.recvfrom(1024)
+    resolver.sendto(data[:2] + b"\x81\x80" + data[4:], addr)
+    _socket = _wait_for(channel, addr[1])
+    responses, matched = channel.match(_socket, *_socket.recvfrom(1024), 1.0)
+
+    assert [_response.target for _response in responses] == [None]
+    assert matched == query._replace(address=None)
+    assert not channel.pending(query.key)
+
+
+def test_truncate_to_payload_size(channel: UpstreamChannel, resolver: UDPSocket) -> None:
+    key = _QUERY[12:]
+    query = InFlightQuery(id=0x1234, address=_CLIENT, time=0.0, routed=False, key=key, payload_size=512)
+    follower = InFlightQuery(id=0x5678, address=Address("127.0.0.1", 23456), time=0.0, routed=False, key=key)
+    channel.send(_QUERY, query)
+    channel.send(_QUERY, follower)
+    data, addr = resolver.recvfrom(1024)
+    payload = b"\x81\x80\x00\x01\x00\x00\x00\x00\x00\x00" + data[12:] + bytes(600)
+    resolver.sendto(data[:2] + payload, addr)
+    _socket = _wait_for(channel, addr[1])
+    (response, follower_response), _ = channel.match(_socket, *_socket.recvfrom(2048), 0.0)
+
+    assert response.data == b"\x12\x34" + payload
+    assert follower_response.data == b"\x56\x78\x83\x80\x00\x01\x00\x00\x00\x00\x00\x00" + _QUERY[12:]
+
+
+@pytest.mark.parametrize("error", [None, OSError()])
+def test_requery_truncated_over_tcp(mocker: MockerFixture, resolver: UDPSocket, error: Optional[OSError]) -> None:
+    tcp = mocker.create_autospec(TCPUpstream, instance=True)
+    tcp.send.side_effect = error
+    query = InFlightQuery(id=0x1234, address=_CLIENT, time=0.0, routed=False, key=_QUERY[12:])
+
+    with UpstreamChannel(ResolverPool([Address(*resolver.getsockname())]), tcp=tcp) as channel:
+        channel.send(_QUERY, query)
+        data, addr = resolver.recvfrom(1024)
+        resolver.sendto(data[:2] + b"\x83\x80" + data[4:], addr)
+        _socket = _wait_for(channel, addr[1])
+        matched = channel.match(_socket, *_socket.recvfrom(1024), 0.0)
+
+    tcp.send.assert_called_once_with(_QUERY[12:], [query], 0.0)
+    assert matched == (None if error is None else ([Datagram(b"\x12\x34\x83\x80" + _QUERY[4:], _CLIENT)], query))
@@ -0,0 +1,117 @@
+from logging import getLogger
+from multiprocessing import Pipe, get_context
+from multiprocessing.connection import Connection
+from multiprocessing.queues import SimpleQueue
+from os import getpid, kill
+from signal import SIGINT, SIGKILL, SIGTERM
+from time import sleep
+from typing import List
+
+import pytest
+from pytest_mock import MockerFixture
+
+from gwhosts.dns import QName
+from gwhosts.network import Address, Datagram, Network
+from gwhosts.proxy import DNSProxy, RouteOwner
+from gwhosts.proxy._types import RoutedResponse
+from gwhosts.proxy._workers import listen_with_workers
+
+_logger = getLogger("pytest")
+_IPV4_HOST: int = 0xFFFFFFFF
+_CLIENT = Address("127.0.0.1", 12345)
+
+
+@pytest.fixture()
+def owner() -> RouteOwner:
+    return RouteOwner(logger=_logger, ipv4_ifname="tun0", ipv4_gateway="192.168.2.1")
+
+
+def test_learn_addresses(mocker: MockerFixture, owner: RouteOwner) -> None:
+    reader, writer = Pipe(duplex=False)
+    program_routes = mocker.patch.object(owner, "_program_routes")
+    network = Network(0x01020304, _IPV4_HOST)
+
+    writer.send(({network}, set()))
+    writer.send(({network}, set()))
+    owner._learn_addresses(mocker.sentinel.netlink, reader)
+
+    program_routes.assert_called_once_with(mocker.sentinel.netlink, {network: True}, {})
+
+
+def test_learn_addresses_from_exited_worker(mocker: MockerFixture, owner: RouteOwner) -> None:
+    reader, writer = Pipe(duplex=False)
+    program_routes = mocker.patch.object(owner, "_program_routes")
+    network = Network(0x01020304, _IPV4_HOST)
+
+    writer.send(({network}, set()))
+    writer.close()
+
+    with pytest.raises(EOFError):
+        owner._learn_addresses(mocker.sentinel.netlink, reader)
+
+    program_routes.assert_called_once_with(mocker.sentinel.netlink, {network: True}, {})
+
+
+def test_process_responses_with_route_pipe(mocker: MockerFixture) -> None:
+    reader, writer = Pipe(duplex=False)
+    proxy = DNSProxy(
+        hostnames={QName((b"example", b"com"))},
+        logger=_logger,
+        ipv4_ifname="tun0",
+        ipv4_gateway="192.168.2.1",
+        route_pipe=writer,
+    )
+    network = Network(0x01020304, _IPV4_HOST)
+    response = Datagram(b"", _CLIENT)
+    mocker.patch.object(proxy, "_parse_routed_responses")
+    mocker.patch.object(proxy, "_routed_addresses", return_value=({network}, set()))
+    program_routes = mocker.patch.object(proxy, "_program_routes")
+
+    assert proxy._process_responses(None, [], [RoutedResponse(response.data, response)]) == [response]
+    assert reader.recv() == ({network}, set())
+    program_routes.assert_not_called()
+
+
+class _Worker:
+    def __init__(self, pids: SimpleQueue) -> None:
+        self._pids = pids
+
+    def listen(self, addr: Address) -> None:
+        self._pids.put(getpid())
+        sleep(60)
+
+
+class _Owner(RouteOwner):
+    def serve(self, pipes: List[Connection]) -> None:
+        sleep(60)
+
+
+def _alive(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/stat") as stat:
+            return stat.read().rsplit(")", 1)[1].split()[0] != "Z"
+
+    except FileNotFoundError:
+        return False
+
+
+@pytest.mark.parametrize("signum", (SIGTERM, SIGINT, SIGKILL))
+def test_workers_exit_with_owner(signum: int) -> None:
+    context = get_context("fork")
+    pids = context.SimpleQueue()
+    owner = context.Process(
+        target=listen_with_workers,
+        args=(lambda **kwargs: _Worker(pids), _Owner(logger=_logger), _CLIENT, 2),
+    )
+    owner.start()
+    workers = [pids.get(), pids.get()]
+    kill(owner.pid, signum)
+    owner.join(5)
+
+    for _ in range(50):
+        if not any(_alive(_pid) for _pid in workers):
+            break
+
+        sleep(0.1)
+
+    assert not any(_alive(_pid) for _pid in workers)
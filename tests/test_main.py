@@ -0,0 +1,45 @@
+from socket import AF_INET6
+
+import pytest
+
+from gwhosts.main import _address
+from gwhosts.network import Address, UDPSocket
+from gwhosts.proxy._resolvers import ResolverPool
+from gwhosts.proxy._types import InFlightQuery
+from gwhosts.proxy._upstream import UpstreamChannel
+
+_QUERY = b"\x12\x34\x01\x00\x00\x01\x00\x00\x00\x00\x00\x00\x07example\x03com\x00\x00\x01\x00\x01"
+
+
+@pytest.mark.parametrize(
+    ("value", "address"),
+    (
+        ("127.0.0.1", Address("127.0.0.1", 53)),
+        ("127.0.0.1:8053", Address("127.0.0.1", 8053)),
+        ("localhost:8053", Address("localhost", 8053)),
+        ("2001:db8::53", Address("2001:db8::53", 53)),
+        ("[2001:db8::53]", Address("2001:db8::53", 53)),
+        ("[2001:db8::53]:8053", Address("2001:db8::53", 8053)),
+    ),
+)
+def test_address(value: str, address: Address) -> None:
+    assert _address(value) == address
+
+
+@pytest.mark.parametrize("value", ("127.0.0.1:port", "[::1]8053", "[::1]:"))
+def test_invalid_address(value: str) -> None:
+    with pytest.raises(ValueError):
+        _address(value)
+
+
+def test_ipv6_upstream() -> None:
+    with UDPSocket(AF_INET6) as resolver:
+        resolver.bind(("::1", 0))
+        resolver.settimeout(1)
+        addr = _address(f"[::1]:{resolver.getsockname()[1]}")
+
+        with UpstreamChannel(ResolverPool([addr])) as channel:
+            channel.send(_QUERY, InFlightQuery(id=0x1234, address=Address("127.0.0.1", 12345), time=0.0, routed=False))
+            data, _ = resolver.recvfrom(1024)
+
+    assert data[2:] == _QUERY[2:]